@@ -1,3 +1,4 @@
 from .ccxtbroker import *
 from .ccxtfeed import *
 from .ccxtstore import *
+from .ccxtasyncstore import *
@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+# -*- coding: utf-8; py-indent-offset:4 -*-
+###############################################################################
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+###############################################################################
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import os
+import sqlite3
+
+
+class CandleCache(object):
+    '''Closed candles saved on disk by exchange, symbol and timeframe, so a
+    ``CCXTFeed`` only fetches the candles after the last saved one when it
+    restarts.
+
+    Candles are ``[timestamp, open, high, low, close, volume]`` lists, in a
+    sqlite database at ``path``. One cache can be shared by all the feeds.
+
+        cache = CandleCache('data/candles.db')
+        data = store.getdata(dataname='BNB/USDT', fromdate=..., candle_cache=cache)
+    '''
+
+    def __init__(self, path='data/candles.db'):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute(
+            'CREATE TABLE IF NOT EXISTS candles ('
+            'exchange TEXT, symbol TEXT, timeframe TEXT, timestamp INTEGER, '
+            'open REAL, high REAL, low REAL, close REAL, volume REAL, '
+            'PRIMARY KEY (exchange, symbol, timeframe, timestamp)) WITHOUT ROWID')
+        self.conn.commit()
+
+    def read(self, exchange, symbol, timeframe, since=None):
+        '''Saved candles from timestamp ``since``, in time order.'''
+        rows = self.conn.execute(
+            'SELECT timestamp, open, high, low, close, volume FROM candles '
+            'WHERE exchange = ? AND symbol = ? AND timeframe = ? AND timestamp >= ? '
+            'ORDER BY timestamp', (exchange, symbol, timeframe, since or 0))
+        return [list(row) for row in rows]
+
+    def write(self, exchange, symbol, timeframe, candles):
+        '''Saves ``candles``, replacing saved candles of the same timestamp.'''
+        self.conn.executemany(
+            'INSERT OR REPLACE INTO candles VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+            [(exchange, symbol, timeframe) + tuple(ohlcv) for ohlcv in candles
+             if None not in ohlcv])
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
@@ -0,0 +1,122 @@
+#!/usr/bin/env python
+# -*- coding: utf-8; py-indent-offset:4 -*-
+###############################################################################
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+###############################################################################
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import asyncio
+import threading
+from datetime import datetime
+
+import ccxt.async_support as ccxt_async
+from ccxt.base.errors import NetworkError, ExchangeError
+
+from .ccxtstore import CCXTStore
+from .ratelimit import backoff
+
+
+class CCXTAsyncStore(CCXTStore):
+    '''CCXTStore fetching the live candles of all its feeds concurrently.
+
+    With ``CCXTStore`` each feed fetches its candles in turn from cerebro's
+    ``_load``, so a cycle of ten feeds takes ten requests one after another.
+    This store also opens the exchange with the ``ccxt.async_support`` client,
+    run by an asyncio loop in its own thread, and the feeds polled together,
+    see ``CCXTStore.fetch_live``, are requested at once and their candles
+    added to each feed's queue. A cycle takes as long as the slowest symbol.
+
+    Requests share the token bucket of the store, the ccxt rate limiter of
+    the async client is disabled as it would send them one at a time. The
+    backfill, the broker and the other methods use the synchronous client of
+    ``CCXTStore``.
+
+    Takes the ``CCXTStore`` arguments. Get the feeds and broker from the
+    store, so they use it instead of a ``CCXTStore``:
+
+        store = CCXTAsyncStore(exchange='binance', currency='USDT', config=config, retries=5)
+        data = store.getdata(dataname='BNB/USDT', ...)
+    '''
+
+    @classmethod
+    def getdata(cls, *args, **kwargs):
+        '''Returns ``DataCls`` using the store with args, kwargs'''
+        return cls.DataCls(*args, store=cls(), **kwargs)
+
+    @classmethod
+    def getbroker(cls, *args, **kwargs):
+        '''Returns ``BrokerCls`` using the store with args, kwargs'''
+        return cls.BrokerCls(*args, store=cls(), **kwargs)
+
+    def __init__(self, exchange, currency, config, retries, debug=False, sandbox=False,
+                 **kwargs):
+        super(CCXTAsyncStore, self).__init__(exchange, currency, config, retries,
+                                             debug=debug, sandbox=sandbox, **kwargs)
+        self._loop = asyncio.new_event_loop()
+        threading.Thread(target=self._loop.run_forever, daemon=True).start()
+        self.async_exchange = self._call(self._open(exchange, config, sandbox))
+
+    def _call(self, coro):
+        '''Runs ``coro`` in the store loop and returns its result.'''
+        return asyncio.run_coroutine_threadsafe(coro, self._loop).result()
+
+    async def _open(self, exchange, config, sandbox):
+        if not isinstance(exchange, str):
+            raise ValueError('CCXTAsyncStore needs the name of a ccxt exchange')
+        async_exchange = getattr(ccxt_async, exchange)(dict(config, enableRateLimit=False))
+        if sandbox:
+            async_exchange.set_sandbox_mode(True)
+        return async_exchange
+
+    def close(self):
+        '''Closes the async client and stops the loop.'''
+        self._call(self.async_exchange.close())
+        self._loop.call_soon_threadsafe(self._loop.stop)
+
+    def poll_feeds(self, feeds):
+        '''Fetches the new candles of ``feeds`` concurrently.'''
+        self._call(self._fetch_feeds(feeds))
+
+    async def _fetch_feeds(self, feeds):
+        await asyncio.gather(*[self._fetch_feed(feed) for feed in feeds])
+
+    async def _fetch_feed(self, feed):
+        '''Fetches pages of candles of ``feed`` until a page is not full.'''
+        while True:
+            symbol, granularity, since, limit, params = feed._ohlcv_request()
+            data = await self.request('fetch_ohlcv', symbol, timeframe=granularity,
+                                      since=since, limit=limit, params=params)
+            added = feed._add_ohlcv(data)
+            if not added or limit is None or len(data) < limit:
+                break
+
+    async def request(self, method, *args, **kwargs):
+        '''Calls ``method`` of the async client, rate limited by the store
+        token bucket and retried like the ``CCXTStore`` methods.'''
+        weight = self.endpoint_weights.get(method, 1)
+        for i in range(self.retries):
+            if self.debug:
+                print('{} - async {} - Attempt {} {}'.format(datetime.now(), method, i, args))
+            wait = self.limiter.delay(weight)
+            if wait > 0:
+                await asyncio.sleep(wait)
+            try:
+                return await getattr(self.async_exchange, method)(*args, **kwargs)
+            except (NetworkError, ExchangeError):
+                if i == self.retries - 1:
+                    raise
+                await asyncio.sleep(backoff(i, self.backoff_base, self.backoff_max))
@@ -37,6 +37,7 @@ class CCXTOrder(OrderBase):
         self.data = data
         self.ccxt_order = ccxt_order
         self.executed_fills = []
+        self.filled = 0.0
         self.ordtype = self.Buy if ccxt_order['side'] == 'buy' else self.Sell
         self.size = float(ccxt_order['amount'])
 
@@ -93,6 +94,20 @@ class CCXTBroker(with_metaclass(MetaCCXTBroker, BrokerBase)):
 
     Added new private_end_point method to allow using any private non-unified end point
 
+    Open orders are updated in next() with one request per symbol, using
+    fetch_orders when the exchange has it, otherwise fetch_open_orders with
+    fetch_order only for the orders no longer open. The create_order response
+    is used for new orders unless it is missing the order details.
+
+    With an ``order_stream``, eg: ``ccxtstream.WebSocketOrderStream``, fills
+    and status changes are applied from the stream at each next() call, as
+    they arrive, instead of polling. Polling is used while the stream is down,
+    and once after each reconnection to pick up missed updates.
+
+    Balances come from the store balance cache, see ``CCXTStore.balance_ttl``.
+    Fills and closed orders mark the balance as changed, and it is fetched
+    again once at the end of next(), however many orders were updated.
+
     '''
 
     order_types = {Order.Market: 'market',
@@ -110,7 +125,7 @@ class CCXTBroker(with_metaclass(MetaCCXTBroker, BrokerBase)):
             'value': 'canceled'}
     }
 
-    def __init__(self, broker_mapping=None, debug=False, **kwargs):
+    def __init__(self, broker_mapping=None, debug=False, order_stream=None, store=None, **kwargs):
         super(CCXTBroker, self).__init__()
 
         if broker_mapping is not None:
@@ -123,7 +138,7 @@ class CCXTBroker(with_metaclass(MetaCCXTBroker, BrokerBase)):
             except KeyError:  # might not want to change the mappings
                 pass
 
-        self.store = CCXTStore(**kwargs)
+        self.store = store or CCXTStore(**kwargs)
 
         self.currency = self.store.currency
 
@@ -136,9 +151,24 @@ class CCXTBroker(with_metaclass(MetaCCXTBroker, BrokerBase)):
 
         self.open_orders = list()
 
+        self.order_stream = order_stream
+        self._stream_unknown = {}  # updates for orders not submitted yet
+        self._reconcile = True  # poll once the stream is connected
+        self._balance_dirty = False  # fills since the last balance fetch
+
         self.startingcash = self.store._cash
         self.startingvalue = self.store._value
 
+    def start(self):
+        super(CCXTBroker, self).start()
+        if self.order_stream is not None:
+            self.order_stream.start()
+
+    def stop(self):
+        super(CCXTBroker, self).stop()
+        if self.order_stream is not None:
+            self.order_stream.stop()
+
     def get_balance(self):
         self.store.get_balance()
         self.cash = self.store._cash
@@ -182,40 +212,131 @@ class CCXTBroker(with_metaclass(MetaCCXTBroker, BrokerBase)):
     def next(self):
         if self.debug:
             print('Broker next() called')
-        
-        for o_order in list(self.open_orders):
-            oID = o_order.ccxt_order['id']
-
-            # Print debug before fetching so we know which order is giving an
-            # issue if it crashes
-            if self.debug:
-                print('Fetching Order ID: {}'.format(oID))
-
-            # Get the order
-            ccxt_order = self.store.fetch_order(oID, o_order.data.p.dataname)
-            
-            # Check for new fills
-            if 'trades' in ccxt_order and ccxt_order['trades'] is not None:
-                for fill in ccxt_order['trades']:
-                    if fill not in o_order.executed_fills:
-                        o_order.execute(fill['datetime'], fill['amount'], fill['price'], 
-                                        0, 0.0, 0.0, 
-                                        0, 0.0, 0.0, 
-                                        0.0, 0.0,
-                                        0, 0.0)
-                        o_order.executed_fills.append(fill['id'])
-
-            if self.debug:
-                print(json.dumps(ccxt_order, indent=self.indent))
-
-            # Check if the order is closed
-            if ccxt_order[self.mappings['closed_order']['key']] == self.mappings['closed_order']['value']:
-                pos = self.getposition(o_order.data, clone=False)
-                pos.update(o_order.size, o_order.price)
-                o_order.completed()
-                self.notify(o_order)
-                self.open_orders.remove(o_order)
-                self.get_balance()
+
+        self._update_orders()
+
+        if self._balance_dirty:
+            self._balance_dirty = False
+            self.store.invalidate_balance()
+            self.get_balance()
+
+    def _update_orders(self):
+        '''Applies the order updates of the stream, or polls the open orders.'''
+        if self.order_stream is not None:
+            self._next_stream()
+            connected = self.order_stream.connected.is_set()
+            if connected and not self._reconcile:
+                return
+            self._reconcile = not connected
+
+        self._poll_orders()
+
+    def _next_stream(self):
+        '''Applies the order updates received from the stream.'''
+        updates = collections.defaultdict(list)
+        while True:
+            item = self.order_stream.get()
+            if item is None:
+                break
+            event, ccxt_order = item
+            if event == self.order_stream.RECONNECTED:
+                self._reconcile = True
+            else:
+                updates[ccxt_order['id']].append(ccxt_order)
+
+        # Updates can arrive before create_order returns, they are kept for
+        # one more call, then dropped as orders of another client.
+        unknown, self._stream_unknown = self._stream_unknown, {}
+        for oID, ccxt_orders in updates.items():
+            unknown.setdefault(oID, []).extend(ccxt_orders)
+        open_orders = {o.ccxt_order['id']: o for o in self.open_orders}
+        for oID, ccxt_orders in unknown.items():
+            o_order = open_orders.get(oID)
+            if o_order is None:
+                if oID in updates:
+                    self._stream_unknown[oID] = updates[oID]
+                continue
+            for ccxt_order in ccxt_orders:
+                if o_order in self.open_orders:
+                    self._update_order(o_order, ccxt_order)
+
+    def _poll_orders(self):
+        orders_by_symbol = collections.defaultdict(list)
+        for o_order in self.open_orders:
+            orders_by_symbol[o_order.data.p.dataname].append(o_order)
+
+        for symbol, orders in orders_by_symbol.items():
+            ccxt_orders = self._fetch_orders(symbol, orders)
+
+            for o_order in orders:
+                oID = o_order.ccxt_order['id']
+                ccxt_order = ccxt_orders.get(oID)
+                if ccxt_order is None:
+                    # Print debug before fetching so we know which order is giving an
+                    # issue if it crashes
+                    if self.debug:
+                        print('Fetching Order ID: {}'.format(oID))
+                    ccxt_order = self.store.fetch_order(oID, symbol)
+
+                self._update_order(o_order, ccxt_order)
+
+    def _fetch_orders(self, symbol, orders):
+        '''Orders of ``symbol`` by id, with one request. Orders not returned
+        are fetched one by one by the caller.'''
+        has = self.store.exchange.has
+        if has.get('fetchOrders'):
+            timestamps = [o.ccxt_order.get('timestamp') for o in orders]
+            since = min(timestamps) if None not in timestamps else None
+            ccxt_orders = self.store.fetch_orders(symbol, since=since)
+        elif has.get('fetchOpenOrders'):
+            ccxt_orders = self.store.fetch_open_orders(symbol)
+        else:
+            return {}
+
+        if self.debug:
+            print('Fetched {} orders for {}'.format(len(ccxt_orders), symbol))
+        return {ccxt_order['id']: ccxt_order for ccxt_order in ccxt_orders}
+
+    def _update_order(self, o_order, ccxt_order):
+        # Check for new fills
+        if 'trades' in ccxt_order and ccxt_order['trades'] is not None:
+            for fill in ccxt_order['trades']:
+                if fill['id'] not in o_order.executed_fills:
+                    o_order.execute(fill['datetime'], fill['amount'], fill['price'],
+                                    0, 0.0, 0.0,
+                                    0, 0.0, 0.0,
+                                    0.0, 0.0,
+                                    0, 0.0)
+                    o_order.executed_fills.append(fill['id'])
+                    self._balance_dirty = True
+
+        # Fills change the balance also when the exchange does not list the trades
+        filled = ccxt_order.get('filled')
+        if filled is not None and filled != o_order.filled:
+            o_order.filled = filled
+            self._balance_dirty = True
+
+        if self.debug:
+            print(json.dumps(ccxt_order, indent=self.indent))
+
+        # Check if the order is closed
+        if ccxt_order.get(self.mappings['closed_order']['key']) == self.mappings['closed_order']['value']:
+            pos = self.getposition(o_order.data, clone=False)
+            pos.update(o_order.size, self._fill_price(o_order, ccxt_order))
+            o_order.completed()
+            self.notify(o_order)
+            self.open_orders.remove(o_order)
+            self._balance_dirty = True
+
+    def _fill_price(self, o_order, ccxt_order):
+        '''Price of a closed order: the average of its executed fills, else the
+        average reported by the exchange. Market orders have no submit price.'''
+        if o_order.executed.size:
+            return o_order.executed.price
+        for key in ('average', 'price'):
+            if ccxt_order.get(key) is not None:
+                return ccxt_order[key]
+        return o_order.price
 
     def _submit(self, owner, data, exectype, side, amount, price, params):
         order_type = self.order_types.get(exectype) if exectype else 'market'
@@ -226,7 +347,11 @@ class CCXTBroker(with_metaclass(MetaCCXTBroker, BrokerBase)):
         ret_ord = self.store.create_order(symbol=data.p.dataname, order_type=order_type, side=side,
                                           amount=amount, price=price, params=params)
 
-        _order = self.store.fetch_order(ret_ord['id'], data.p.dataname)
+        # Only fetch the order if the exchange returned a partial response.
+        if None in (ret_ord.get(key) for key in ('status', 'side', 'amount')):
+            _order = self.store.fetch_order(ret_ord['id'], data.p.dataname)
+        else:
+            _order = ret_ord
 
         order = CCXTOrder(owner, data, _order)
         order.price = ret_ord['price']
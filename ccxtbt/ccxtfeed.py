@@ -28,7 +28,7 @@ from datetime import datetime
 
 import backtrader as bt
 from backtrader.feed import DataBase
-from backtrader.utils.py3 import with_metaclass
+from backtrader.utils.py3 import queue, with_metaclass
 
 from .ccxtstore import CCXTStore
 
@@ -62,6 +62,23 @@ class CCXTFeed(with_metaclass(MetaCCXTFeed, DataBase)):
           support sending some additional fetch parameters.
         - Added drop_newest option to avoid loading incomplete candles where exchanges
           do not support sending ohlcv params to prevent returning partial data
+        - Added candle_stream option. Live candles are read from a websocket kline
+          stream, eg: ``ccxtstream.WebSocketCandleStream``, as they close, instead of
+          requesting the last ``ohlcv_limit`` candles at each load. REST is only used
+          for the backfill, while the stream is down, and to fill gaps between the
+          last candle and a streamed candle. ``stream_symbol`` is the exchange symbol
+          in the stream, default the dataname without ``/``, eg: ``BNBUSDT``.
+        - Live candles are fetched through ``store.fetch_live``, which polls the
+          feeds of the store together when their candles close, and a
+          ``CCXTAsyncStore`` fetches the candles of all its feeds at once.
+        - The backfill from ``fromdate`` is fetched in pages of ``ohlcv_limit``
+          candles by ``backfill_workers`` threads. Added ``candle_cache``, a
+          ``candlecache.CandleCache`` saving the closed candles on disk, so after a
+          restart only the candles after the last saved one are fetched.
+        - Trades of ``bt.TimeFrame.Ticks`` feeds are fetched since the last trade
+          and deduplicated by id within the last ``tick_window`` trades. With
+          ``bt.TimeFrame.Seconds`` the trades are aggregated to bars of
+          ``compression`` seconds, eg: 5 second bars.
 
     """
 
@@ -71,6 +88,11 @@ class CCXTFeed(with_metaclass(MetaCCXTFeed, DataBase)):
         ('fetch_ohlcv_params', {}),
         ('ohlcv_limit', 20),
         ('drop_newest', False),
+        ('candle_stream', None),
+        ('stream_symbol', None),
+        ('candle_cache', None),
+        ('backfill_workers', 4),
+        ('tick_window', 5000),
         ('debug', False)
     )
 
@@ -82,18 +104,29 @@ class CCXTFeed(with_metaclass(MetaCCXTFeed, DataBase)):
     # def __init__(self, exchange, symbol, ohlcv_limit=None, config={}, retries=5):
     def __init__(self, **kwargs):
         # self.store = CCXTStore(exchange, config, retries)
-        self.store = self._store(**kwargs)
+        self.store = kwargs.get('store') or self._store(**kwargs)
         self._data = deque()  # data queue for price data
-        self._last_id = ''  # last processed trade id for ohlcv
+        self._tick_ts = None  # timestamp of the last processed trade
+        self._tick_window = deque(maxlen=self.p.tick_window)  # last trade ids
+        self._tick_ids = set()  # ids in _tick_window
+        self._tick_bar = None  # bar being aggregated from trades
         self._last_ts = 0  # last processed timestamp for ohlcv
+        self._candles = None  # queue of streamed candles
 
     def start(self, ):
         DataBase.start(self)
 
+        if self.p.candle_stream is not None:
+            symbol = self.p.stream_symbol or self.p.dataname.replace('/', '')
+            self._candles = self.p.candle_stream.subscribe(symbol)
+            self.p.candle_stream.start()
+
+        self.store.register(self)
+
         if self.p.fromdate:
             self._state = self._ST_HISTORBACK
             self.put_notification(self.DELAYED)
-            self._fetch_ohlcv(self.p.fromdate)
+            self._backfill(self.p.fromdate)
 
         else:
             self._state = self._ST_LIVE
@@ -105,10 +138,16 @@ class CCXTFeed(with_metaclass(MetaCCXTFeed, DataBase)):
 
         while True:
             if self._state == self._ST_LIVE:
-                if self._timeframe == bt.TimeFrame.Ticks:
+                if self._timeframe in (bt.TimeFrame.Ticks, bt.TimeFrame.Seconds):
                     return self._load_ticks()
+                elif self._candles is not None and self.p.candle_stream.connected.is_set():
+                    self._load_stream()
+                    ret = self._load_ohlcv()
+                    if self.p.debug:
+                        print('{} Load streamed OHLCV Returning: {}'.format(datetime.utcnow(), ret))
+                    return ret
                 else:
-                    self._fetch_ohlcv()
+                    self.store.fetch_live(self)
                     ret = self._load_ohlcv()
                     if self.p.debug:
                         print('----     LOAD    ----')
@@ -130,9 +169,89 @@ class CCXTFeed(with_metaclass(MetaCCXTFeed, DataBase)):
                         self.put_notification(self.LIVE)
                         continue
 
-    def _fetch_ohlcv(self, fromdate=None):
-        """Fetch OHLCV data into self._data queue"""
+    def stop(self):
+        DataBase.stop(self)
+        self.store.unregister(self)
+        if self.p.candle_stream is not None:
+            self.p.candle_stream.stop()
+
+    def _polling(self):
+        '''True if live candles are fetched with REST.'''
+        return (self._state == self._ST_LIVE and
+                self._timeframe not in (bt.TimeFrame.Ticks, bt.TimeFrame.Seconds) and
+                not (self._candles is not None and self.p.candle_stream.connected.is_set()))
+
+    def _next_close(self):
+        '''Time in seconds the next candle to load closes.'''
+        granularity = self.store.get_granularity(self._timeframe, self._compression)
+        interval = self.store.exchange.parse_timeframe(granularity)
+        # The newest candle is dropped with drop_newest, else loaded while open
+        return self._last_ts / 1000 + interval * (2 if self.p.drop_newest else 1)
+
+    def _load_stream(self):
+        """Move the streamed candles into self._data queue, fetching any
+        candles missed before them"""
         granularity = self.store.get_granularity(self._timeframe, self._compression)
+        interval = self.store.exchange.parse_timeframe(granularity) * 1000
+
+        while True:
+            try:
+                event, ohlcv = self._candles.get(False)
+            except queue.Empty:
+                break
+
+            if event == self.p.candle_stream.RECONNECTED:
+                continue  # missed candles are fetched with the next candle
+
+            tstamp = ohlcv[0]
+            if tstamp <= self._last_ts:
+                continue
+            if self._last_ts and tstamp > self._last_ts + interval:
+                if self.p.debug:
+                    print('Filling gap from {} to {}'.format(self._last_ts, tstamp))
+                self._fetch_ohlcv(until=tstamp - interval)
+
+            self._data.append(ohlcv)
+            self._last_ts = tstamp
+
+    def _backfill(self, fromdate):
+        """Fetch the candles from ``fromdate`` into self._data queue, reading
+        the candles saved in ``candle_cache`` first"""
+        granularity = self.store.get_granularity(self._timeframe, self._compression)
+        interval = self.store.exchange.parse_timeframe(granularity) * 1000
+        since = int((fromdate - datetime(1970, 1, 1)).total_seconds() * 1000)
+        now = int(time.time() * 1000)
+
+        cache = self.p.candle_cache
+        key = (self.store.exchange.id, self.p.dataname, granularity)
+        cached = cache.read(*key, since=since) if cache is not None else []
+        if cached:
+            ranges = [(since, cached[0][0]), (cached[-1][0] + interval, now)]
+        else:
+            ranges = [(since, now)]
+
+        fetched = []
+        for start, end in ranges:
+            if start < end:
+                fetched += self.store.fetch_ohlcv_range(
+                    self.p.dataname, granularity, start, end, self.p.ohlcv_limit,
+                    params=self.p.fetch_ohlcv_params, workers=self.p.backfill_workers)
+
+        if self.p.debug:
+            print('{} - Backfill: {} saved candles, {} fetched'.format(
+                datetime.utcnow(), len(cached), len(fetched)))
+
+        if cache is not None:
+            # The newest candle may still be open
+            cache.write(*key, [ohlcv for ohlcv in fetched if ohlcv[0] + interval <= now])
+
+        self._add_ohlcv(cached + fetched)
+
+    def _fetch_ohlcv(self, fromdate=None, until=None):
+        """Fetch OHLCV data into self._data queue, in pages of ``ohlcv_limit``
+        candles, up to the candle at ``until`` if given"""
+        granularity = self.store.get_granularity(self._timeframe, self._compression)
+        interval = self.store.exchange.parse_timeframe(granularity) * 1000
 
         if fromdate:
             since = int((fromdate - datetime(1970, 1, 1)).total_seconds() * 1000)
@@ -170,64 +289,121 @@ class CCXTFeed(with_metaclass(MetaCCXTFeed, DataBase)):
                 data = sorted(self.store.fetch_ohlcv(self.p.dataname, timeframe=granularity,
                                                      since=since, limit=limit, params=self.p.fetch_ohlcv_params))
 
-            # Check to see if dropping the latest candle will help with
-            # exchanges which return partial data
-            if self.p.drop_newest:
-                del data[-1]
+            self._add_ohlcv(data, until)
 
-            for ohlcv in data:
-
-                # for ohlcv in sorted(self.store.fetch_ohlcv(self.p.dataname, timeframe=granularity,
-                #                                           since=since, limit=limit, params=self.p.fetch_ohlcv_params)):
+            # A page short of the limit holds the newest candles
+            if dlen == len(self._data) or (limit is not None and len(data) < limit):
+                break
+            if until is not None and self._last_ts >= until:
+                break
+            since = self._last_ts + interval
 
-                if None in ohlcv:
-                    continue
+    def _ohlcv_request(self):
+        '''Arguments of ``fetch_ohlcv`` for the candles after the last one.'''
+        granularity = self.store.get_granularity(self._timeframe, self._compression)
+        since = self._last_ts if self._last_ts > 0 else None
+        return (self.p.dataname, granularity, since, self.p.ohlcv_limit,
+                self.p.fetch_ohlcv_params)
 
-                tstamp = ohlcv[0]
+    def _add_ohlcv(self, data, until=None):
+        '''Adds the new candles of ``data`` to self._data queue, up to the
+        candle at ``until`` if given. Returns the number added.'''
+        data = sorted(data)
+        dlen = len(self._data)
 
-                # Prevent from loading incomplete data
-                # if tstamp > (time.time() * 1000):
-                #    continue
+        # Check to see if dropping the latest candle will help with
+        # exchanges which return partial data
+        if self.p.drop_newest and until is None and data:
+            del data[-1]
 
-                if tstamp > self._last_ts:
-                    if self.p.debug:
-                        print('Adding: {}'.format(ohlcv))
-                    self._data.append(ohlcv)
-                    self._last_ts = tstamp
+        for ohlcv in data:
 
-            if dlen == len(self._data):
-                break
+            if None in ohlcv:
+                continue
 
-    def _load_ticks(self):
-        if self._last_id is None:
-            # first time get the latest trade only
-            trades = [self.store.fetch_trades(self.p.dataname)[-1]]
-        else:
-            trades = self.store.fetch_trades(self.p.dataname)
+            tstamp = ohlcv[0]
 
-        for trade in trades:
-            trade_id = trade['id']
+            # Prevent from loading incomplete data
+            # if tstamp > (time.time() * 1000):
+            #    continue
 
-            if trade_id > self._last_id:
-                trade_time = datetime.strptime(trade['datetime'], '%Y-%m-%dT%H:%M:%S.%fZ')
-                self._data.append((trade_time, float(trade['price']), float(trade['amount'])))
-                self._last_id = trade_id
+            if until is not None and tstamp > until:
+                continue
 
-        try:
-            trade = self._data.popleft()
-        except IndexError:
-            return None  # no data in the queue
+            if tstamp > self._last_ts:
+                if self.p.debug:
+                    print('Adding: {}'.format(ohlcv))
+                self._data.append(ohlcv)
+                self._last_ts = tstamp
 
-        trade_time, price, size = trade
+        return len(self._data) - dlen
 
-        self.lines.datetime[0] = bt.date2num(trade_time)
-        self.lines.open[0] = price
-        self.lines.high[0] = price
-        self.lines.low[0] = price
-        self.lines.close[0] = price
-        self.lines.volume[0] = size
+    def _load_ticks(self):
+        if self._data:
+            return self._load_ohlcv()  # ticks of the last fetch first
 
-        return True
+        if self._tick_ts is None:
+            # first time get the latest trade only
+            trades = self.store.fetch_trades(self.p.dataname)[-1:]
+        else:
+            trades = self.store.fetch_trades(self.p.dataname, since=self._tick_ts)
+
+        for trade in sorted(trades, key=lambda trade: trade['timestamp']):
+            tstamp = trade['timestamp']
+            if self._tick_ts is not None and tstamp < self._tick_ts:
+                continue
+
+            trade_id = trade.get('id')
+            if trade_id is None:
+                trade_id = (tstamp, trade['price'], trade['amount'])
+            elif isinstance(trade_id, str) and trade_id.isdigit():
+                trade_id = int(trade_id)
+            if trade_id in self._tick_ids:
+                continue
+
+            if len(self._tick_window) == self._tick_window.maxlen:
+                self._tick_ids.discard(self._tick_window[0])
+            self._tick_window.append(trade_id)
+            self._tick_ids.add(trade_id)
+            self._tick_ts = tstamp
+
+            self._add_tick(tstamp, float(trade['price']), float(trade['amount']))
+
+        # Close the bar once its time is over
+        bar = self._tick_bar
+        if bar is not None and time.time() * 1000 >= bar[0] + self._tick_bar_ms():
+            self._data.append(bar)
+            self._tick_bar = None
+
+        return self._load_ohlcv()
+
+    def _tick_bar_ms(self):
+        '''Length in ms of the bars ticks are aggregated to, 0 for no bars.'''
+        if self._timeframe == bt.TimeFrame.Seconds:
+            return self._compression * 1000
+        return 0
+
+    def _add_tick(self, tstamp, price, amount):
+        '''Adds a trade to self._data queue, as a tick or into the current bar.'''
+        length = self._tick_bar_ms()
+        if not length:
+            self._data.append([tstamp, price, price, price, price, amount])
+            return
+
+        start = tstamp - tstamp % length
+        bar = self._tick_bar
+        if bar is not None and start > bar[0]:
+            self._data.append(bar)
+            bar = None
+
+        if bar is None:
+            self._tick_bar = [start, price, price, price, price, amount]
+        else:
+            # Trades late for a closed bar go to the current bar
+            bar[2] = max(bar[2], price)
+            bar[3] = min(bar[3], price)
+            bar[4] = price
+            bar[5] += amount
 
     def _load_ohlcv(self):
         try:
@@ -237,7 +413,7 @@ class CCXTFeed(with_metaclass(MetaCCXTFeed, DataBase)):
 
         tstamp, open_, high, low, close, volume = ohlcv
 
-        dtime = datetime.utcfromtimestamp(tstamp // 1000)
+        dtime = datetime.utcfromtimestamp(tstamp / 1000)
 
         self.lines.datetime[0] = bt.date2num(dtime)
         self.lines.open[0] = open_
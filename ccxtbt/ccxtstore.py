@@ -21,7 +21,9 @@
 from __future__ import (absolute_import, division, print_function,
                         unicode_literals)
 
+import json
 import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from functools import wraps
 
@@ -31,6 +33,8 @@ from backtrader.metabase import MetaParams
 from backtrader.utils.py3 import with_metaclass
 from ccxt.base.errors import NetworkError, ExchangeError
 
+from .ratelimit import backoff, get_bucket
+
 
 class MetaSingleton(MetaParams):
     '''Metaclass to make a metaclassed class a singleton'''
@@ -55,6 +59,44 @@ class CCXTStore(with_metaclass(MetaSingleton, object)):
 
     Added new private_end_point method to allow using any private non-unified end point
 
+    Requests are rate limited by a token bucket shared by the stores using the
+    same exchange and api key, instead of sleeping ``exchange.rateLimit``
+    before every request. Requests only wait when the bucket is empty, so
+    orders go out at network speed when under the exchange limit. Failed
+    requests are retried after an exponential backoff with jitter.
+
+      - ``rate_limit`` (default: ``None``)
+        Requests per second. ``None`` uses ``1000 / exchange.rateLimit``.
+      - ``burst`` (default: ``None``)
+        Bucket capacity, the requests that can go out at once. ``None`` is one
+        second of requests.
+      - ``endpoint_weights`` (default: ``None``)
+        Dict of store method name to request weight, updating
+        ``ENDPOINT_WEIGHTS``, eg: ``{'fetch_ohlcv': 2}`` for an exchange
+        counting candles requests double.
+      - ``backoff_base`` (default: ``None``), ``backoff_max`` (default: 30)
+        Seconds of the first retry backoff, ``None`` is
+        ``exchange.rateLimit / 1000``, and of the longest backoff.
+
+    Balances are cached for ``balance_ttl`` seconds, so the broker and
+    strategies sharing the store do not request the balance at each call. The
+    broker invalidates the cache on each fill, so balances are requested again
+    after a trade. ``balance_stats`` gives the cache hits and misses.
+
+      - ``balance_ttl`` (default: 5)
+        Seconds a fetched balance is used for, ``0`` to always request it.
+
+    Live candles are polled by the store for all its feeds on one schedule.
+    Each feed is polled ``poll_delay`` seconds after its next candle closes,
+    instead of at each load, and the feeds due at the same time are polled in
+    the same cycle. Feeds still missing the closed candle, eg: when the
+    exchange is late, are polled again every ``poll_retry`` seconds.
+
+      - ``poll_delay`` (default: 1)
+        Seconds after the candle close to poll. ``None`` polls at each load.
+      - ``poll_retry`` (default: 1)
+        Seconds between polls of a feed still missing its closed candle.
+
     '''
 
     # Supported granularities
@@ -82,6 +124,11 @@ class CCXTStore(with_metaclass(MetaSingleton, object)):
         (bt.TimeFrame.Years, 1): '1y',
     }
 
+    # Request weight of each store method, methods not listed weigh 1.
+    ENDPOINT_WEIGHTS = {
+        'getposition': 0,  # no request
+    }
+
     BrokerCls = None  # broker class will auto register
     DataCls = None  # data class will auto register
 
@@ -95,14 +142,41 @@ class CCXTStore(with_metaclass(MetaSingleton, object)):
         '''Returns broker with *args, **kwargs from registered ``BrokerCls``'''
         return cls.BrokerCls(*args, **kwargs)
 
-    def __init__(self, exchange, currency, config, retries, debug=False, sandbox=False):
-        self.exchange = getattr(ccxt, exchange)(config)
+    def __init__(self, exchange, currency, config, retries, debug=False, sandbox=False,
+                 rate_limit=None, burst=None, endpoint_weights=None, backoff_base=None,
+                 backoff_max=30, balance_ttl=5, poll_delay=1, poll_retry=1):
+        if isinstance(exchange, ccxt.Exchange):
+            self.exchange = exchange  # eg: mockexchange.MockExchange
+        else:
+            self.exchange = getattr(ccxt, exchange)(config)
         if sandbox:
             self.exchange.set_sandbox_mode(True)
         self.currency = currency
         self.retries = retries
         self.debug = debug
-        balance = self.exchange.fetch_balance() if 'secret' in config else 0
+
+        if rate_limit is None:
+            rate_limit = 1000 / self.exchange.rateLimit
+        self.limiter = get_bucket((self.exchange.id, config.get('apiKey')), rate_limit, burst)
+        self.endpoint_weights = dict(self.ENDPOINT_WEIGHTS, **(endpoint_weights or {}))
+        if backoff_base is None:
+            backoff_base = self.exchange.rateLimit / 1000
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+
+        self.balance_ttl = balance_ttl
+        self._balances = {}  # params key: (fetch time, balance)
+        self.balance_hits = 0
+        self.balance_misses = 0
+
+        self.poll_delay = poll_delay
+        self.poll_retry = poll_retry
+        self.feeds = []
+        self._poll_due = {}  # feed: time of its next poll
+
+        balance = 0
+        if 'secret' in config:
+            balance = self.fetch_balance()
 
         if balance == 0 or not balance['free'][currency]:
             self._cash = 0
@@ -131,29 +205,101 @@ class CCXTStore(with_metaclass(MetaSingleton, object)):
 
         return granularity
 
+    def register(self, feed):
+        '''Called by ``feed`` at start.'''
+        self.feeds.append(feed)
+
+    def unregister(self, feed):
+        '''Called by ``feed`` at stop.'''
+        # Lines compare with ==, feeds are compared by identity
+        self.feeds = [f for f in self.feeds if f is not feed]
+        self._poll_due.pop(feed, None)
+
+    def fetch_live(self, feed):
+        '''Fetches the new candles of live ``feed`` into its queue if it is
+        due a poll, with the candles of the other feeds due.'''
+        if self.poll_delay is None:
+            self.poll_feeds([feed])
+            return
+
+        now = time.time()
+        if now < self._poll_due.get(feed, 0):
+            return
+
+        feeds = [f for f in self.feeds
+                 if f is not feed and f._polling() and now >= self._poll_due.get(f, 0)]
+        feeds.insert(0, feed)
+        self.poll_feeds(feeds)
+
+        now = time.time()
+        for f in feeds:
+            due = f._next_close() + self.poll_delay
+            self._poll_due[f] = due if due > now else now + self.poll_retry
+
+    def poll_feeds(self, feeds):
+        '''Fetches the new candles of ``feeds`` into their queues.'''
+        for feed in feeds:
+            feed._fetch_ohlcv()
+
     def retry(method):
         @wraps(method)
         def retry_method(self, *args, **kwargs):
+            weight = self.endpoint_weights.get(method.__name__, 1)
             for i in range(self.retries):
                 if self.debug:
                     print('{} - {} - Attempt {}'.format(datetime.now(), method.__name__, i))
-                time.sleep(self.exchange.rateLimit / 1000)
+                self.limiter.acquire(weight)
                 try:
                     return method(self, *args, **kwargs)
                 except (NetworkError, ExchangeError):
                     if i == self.retries - 1:
                         raise
+                    wait = backoff(i, self.backoff_base, self.backoff_max)
+                    if self.debug:
+                        print('{} - {} - Retrying in {:.3f}s'.format(
+                            datetime.now(), method.__name__, wait))
+                    time.sleep(wait)
 
         return retry_method
 
+    def fetch_balance(self, params=None):
+        '''Balance with ``params``, from the cache if fetched less than
+        ``balance_ttl`` seconds ago.'''
+        params = params or {}
+        key = json.dumps(params, sort_keys=True, default=str)
+        cached = self._balances.get(key)
+        if cached is not None and time.monotonic() - cached[0] < self.balance_ttl:
+            self.balance_hits += 1
+            return cached[1]
+
+        self.balance_misses += 1
+        balance = self._fetch_balance(params)
+        self._balances[key] = (time.monotonic(), balance)
+        return balance
+
+    def invalidate_balance(self):
+        '''Drops the cached balances, eg: after a fill.'''
+        self._balances.clear()
+
+    def balance_stats(self):
+        '''Hits, misses and hit rate of the balance cache.'''
+        calls = self.balance_hits + self.balance_misses
+        return {
+            'hits': self.balance_hits,
+            'misses': self.balance_misses,
+            'hit_rate': self.balance_hits / calls if calls else 0.0,
+        }
+
     @retry
+    def _fetch_balance(self, params):
+        return self.exchange.fetch_balance(params)
+
     def get_wallet_balance(self, currency, params=None):
-        balance = self.exchange.fetch_balance(params)
+        balance = self.fetch_balance(params)
         return balance
 
-    @retry
     def get_balance(self):
-        balance = self.exchange.fetch_balance()
+        balance = self.fetch_balance()
 
         cash = balance['free'][self.currency]
         value = balance['total'][self.currency]
@@ -177,8 +323,8 @@ class CCXTStore(with_metaclass(MetaSingleton, object)):
         return self.exchange.cancel_order(order_id, symbol)
 
     @retry
-    def fetch_trades(self, symbol):
-        return self.exchange.fetch_trades(symbol)
+    def fetch_trades(self, symbol, since=None, limit=None, params={}):
+        return self.exchange.fetch_trades(symbol, since=since, limit=limit, params=params)
 
     @retry
     def fetch_ohlcv(self, symbol, timeframe, since, limit, params={}):
@@ -186,13 +332,47 @@ class CCXTStore(with_metaclass(MetaSingleton, object)):
             print('Fetching: {}, TF: {}, Since: {}, Limit: {}'.format(symbol, timeframe, since, limit))
         return self.exchange.fetch_ohlcv(symbol, timeframe=timeframe, since=since, limit=limit, params=params)
 
+    def fetch_ohlcv_range(self, symbol, timeframe, since, until, limit, params={}, workers=4):
+        '''Candles from ``since`` up to, not including, ``until`` (ms), in time
+        order. The range is split in pages of ``limit`` candles fetched by
+        ``workers`` threads, with the requests rate limited as usual.'''
+        interval = self.exchange.parse_timeframe(timeframe) * 1000
+        span = interval * limit
+
+        def fetch_page(start):
+            end = min(start + span, until)
+            candles = []
+            # Exchanges returning less than ``limit`` candles need more requests
+            while start < end:
+                data = self.fetch_ohlcv(symbol, timeframe=timeframe, since=start, limit=limit,
+                                        params=params)
+                data = [ohlcv for ohlcv in data if start <= ohlcv[0] < end]
+                if not data:
+                    break
+                candles.extend(data)
+                start = max(ohlcv[0] for ohlcv in data) + interval
+            return candles
+
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            pages = list(pool.map(fetch_page, range(since, until, span)))
+
+        candles = {}
+        for page in pages:
+            for ohlcv in page:
+                candles[ohlcv[0]] = ohlcv
+        return [candles[tstamp] for tstamp in sorted(candles)]
+
     @retry
     def fetch_order(self, oid, symbol):
         return self.exchange.fetch_order(oid, symbol)
 
     @retry
-    def fetch_open_orders(self):
-        return self.exchange.fetchOpenOrders()
+    def fetch_open_orders(self, symbol=None, since=None, limit=None, params={}):
+        return self.exchange.fetch_open_orders(symbol, since, limit, params)
+
+    @retry
+    def fetch_orders(self, symbol=None, since=None, limit=None, params={}):
+        return self.exchange.fetch_orders(symbol, since, limit, params)
 
     @retry
     def private_end_point(self, type, endpoint, params):
@@ -0,0 +1,315 @@
+#!/usr/bin/env python
+# -*- coding: utf-8; py-indent-offset:4 -*-
+###############################################################################
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+###############################################################################
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import asyncio
+import json
+import threading
+from datetime import datetime
+
+import aiohttp
+from aiohttp import web
+from backtrader.utils.py3 import queue
+
+from .ratelimit import backoff
+
+
+class Stream(object):
+    '''Stream of updates from an exchange websocket, eg: order updates from a
+    user-data stream or closed candles.
+
+    The stream runs in its own thread with an asyncio loop. Subclasses
+    implement ``listen``, which connects, calls ``publish`` with each update
+    and returns when the connection is lost. The stream then reconnects with
+    backoff. Updates are read with ``get`` from the cerebro thread, and a
+    ``RECONNECTED`` event is queued after each reconnection, for the reader to
+    fetch the updates it may have missed.
+    '''
+
+    UPDATE, RECONNECTED = range(2)
+
+    def __init__(self, backoff_base=0.5, backoff_max=30):
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.updates = queue.Queue()
+        self.connected = threading.Event()
+        self.connections = 0
+        self._stop = threading.Event()
+        self._loop = None
+        self._thread = None
+
+    def start(self):
+        '''Starts the stream thread, once for all the readers.'''
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+
+    def publish(self, update):
+        '''Queues an update, called from ``listen``.'''
+        self.updates.put((self.UPDATE, update))
+
+    def get(self):
+        '''Next ``(event, update)`` or ``None`` if no update is waiting.'''
+        try:
+            return self.updates.get(False)
+        except queue.Empty:
+            return None
+
+    def on_connect(self):
+        '''Called by ``listen`` once connected.'''
+        self.connections += 1
+        self.connected.set()
+        if self.connections > 1:
+            self.updates.put((self.RECONNECTED, None))
+
+    async def listen(self):
+        raise NotImplementedError
+
+    def _run(self):
+        self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self._loop)
+        attempt = 0
+        while not self._stop.is_set():
+            connections = self.connections
+            try:
+                self._loop.run_until_complete(self.listen())
+            except Exception as e:
+                print('{} - Stream error: {!r}'.format(datetime.now(), e))
+            self.connected.clear()
+            attempt = 0 if self.connections > connections else attempt + 1
+            if not self._stop.is_set():
+                self._stop.wait(backoff(attempt, self.backoff_base, self.backoff_max))
+        self._loop.close()
+
+
+class WebSocketStream(Stream):
+    '''Updates from a websocket.
+
+    Each text message is decoded from json and passed to ``parse``, which
+    returns an update, a list of them, or ``None`` to skip the message.
+    Without ``parse`` the messages are the updates.
+    '''
+
+    def __init__(self, url, parse=None, heartbeat=30, **kwargs):
+        super(WebSocketStream, self).__init__(**kwargs)
+        self.url = url
+        self.parse = parse
+        self.heartbeat = heartbeat
+
+    async def listen(self):
+        async with aiohttp.ClientSession() as session:
+            async with session.ws_connect(self.url, heartbeat=self.heartbeat) as ws:
+                self.on_connect()
+                while not self._stop.is_set():
+                    try:
+                        msg = await ws.receive(timeout=1)
+                    except asyncio.TimeoutError:
+                        continue
+                    if msg.type != aiohttp.WSMsgType.TEXT:
+                        break
+
+                    updates = json.loads(msg.data)
+                    if self.parse is not None:
+                        updates = self.parse(updates)
+                    if updates is None:
+                        continue
+                    for update in updates if isinstance(updates, list) else [updates]:
+                        self.publish(update)
+
+
+class WebSocketOrderStream(WebSocketStream):
+    '''Order updates from a websocket user-data stream, for ``CCXTBroker``.
+
+    Updates are in the ccxt unified order format, eg:
+
+        {'id': '123', 'status': 'open',
+         'trades': [{'id': 't1', 'datetime': ..., 'amount': 0.5, 'price': 10}]}
+
+    Use ``parse`` to convert the exchange messages, eg: ``parse_binance_order``.
+    '''
+
+
+class WebSocketCandleStream(WebSocketStream):
+    '''Closed candles from a websocket kline stream, for ``CCXTFeed``.
+
+    Updates are dicts of the exchange ``symbol`` and the ``ohlcv`` list
+    ``[timestamp, open, high, low, close, volume]`` of a closed candle. Use
+    ``parse`` to convert the exchange messages, eg: ``parse_binance_kline``.
+    One stream can carry the candles of several symbols, each feed reads its
+    own with ``subscribe``.
+    '''
+
+    def __init__(self, url, parse=None, **kwargs):
+        super(WebSocketCandleStream, self).__init__(url, parse=parse, **kwargs)
+        self.subscribers = {}
+
+    def subscribe(self, symbol):
+        '''Queue of the ``(event, ohlcv)`` updates of ``symbol``.'''
+        return self.subscribers.setdefault(symbol, queue.Queue())
+
+    def publish(self, update):
+        subscriber = self.subscribers.get(update['symbol'])
+        if subscriber is not None:
+            subscriber.put((self.UPDATE, update['ohlcv']))
+
+    def on_connect(self):
+        super(WebSocketCandleStream, self).on_connect()
+        if self.connections > 1:
+            for subscriber in self.subscribers.values():
+                subscriber.put((self.RECONNECTED, None))
+
+
+def parse_binance_order(msg):
+    '''Binance spot ``executionReport`` user-data message to an order update.'''
+    if msg.get('e') != 'executionReport':
+        return None
+
+    status = {
+        'NEW': 'open',
+        'PARTIALLY_FILLED': 'open',
+        'FILLED': 'closed',
+        'CANCELED': 'canceled',
+        'PENDING_CANCEL': 'canceling',
+        'REJECTED': 'rejected',
+        'EXPIRED': 'expired',
+    }.get(msg['X'], msg['X'].lower())
+
+    trades = []
+    if msg['x'] == 'TRADE':
+        trades.append({
+            'id': str(msg['t']),
+            'datetime': datetime.utcfromtimestamp(msg['T'] / 1000).isoformat() + 'Z',
+            'timestamp': msg['T'],
+            'amount': float(msg['l']),
+            'price': float(msg['L']),
+        })
+
+    return {
+        'id': str(msg['i']),
+        'clientOrderId': msg['c'],
+        'symbol': msg['s'],
+        'side': msg['S'].lower(),
+        'amount': float(msg['q']),
+        'filled': float(msg['z']),
+        'status': status,
+        'timestamp': msg['E'],
+        'trades': trades,
+    }
+
+
+def binance_kline_url(symbols, granularity, base='wss://stream.binance.com:9443'):
+    '''Binance combined kline stream url of ccxt ``symbols``, eg: ``BNB/USDT``.'''
+    streams = '/'.join('{}@kline_{}'.format(s.replace('/', '').lower(), granularity)
+                       for s in symbols)
+    return '{}/stream?streams={}'.format(base, streams)
+
+
+def parse_binance_kline(msg):
+    '''Binance kline message, single or combined stream, to a closed candle.'''
+    msg = msg.get('data', msg)
+    if msg.get('e') != 'kline' or not msg['k']['x']:
+        return None
+
+    k = msg['k']
+    return {
+        'symbol': k['s'],
+        'ohlcv': [k['t'], float(k['o']), float(k['h']), float(k['l']), float(k['c']),
+                  float(k['v'])],
+    }
+
+
+class LocalStreamServer(object):
+    '''Localhost websocket server standing in for an exchange stream, for
+    tests. Messages passed to ``publish`` are sent as json to the connected
+    clients, and ``disconnect`` drops them to test reconnection.
+
+        server = LocalStreamServer()
+        server.start()
+        stream = WebSocketOrderStream(server.url)
+    '''
+
+    def __init__(self, host='127.0.0.1', port=0):
+        self.host = host
+        self.port = port
+        self.clients = set()
+        self._loop = None
+        self._runner = None
+        self._started = threading.Event()
+
+    @property
+    def url(self):
+        return 'ws://{}:{}/ws'.format(self.host, self.port)
+
+    def start(self):
+        threading.Thread(target=self._run, daemon=True).start()
+        self._started.wait()
+
+    def _run(self):
+        self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self._loop)
+        app = web.Application()
+        app.router.add_get('/ws', self._handler)
+        self._runner = web.AppRunner(app)
+        self._loop.run_until_complete(self._runner.setup())
+        site = web.TCPSite(self._runner, self.host, self.port)
+        self._loop.run_until_complete(site.start())
+        self.port = site._server.sockets[0].getsockname()[1]
+        self._started.set()
+        self._loop.run_forever()
+
+    async def _handler(self, request):
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        self.clients.add(ws)
+        try:
+            async for _ in ws:
+                pass
+        finally:
+            self.clients.discard(ws)
+        return ws
+
+    def _call(self, coro):
+        return asyncio.run_coroutine_threadsafe(coro, self._loop).result()
+
+    async def _send(self, message):
+        for ws in list(self.clients):
+            await ws.send_str(json.dumps(message))
+
+    async def _close_clients(self):
+        for ws in list(self.clients):
+            await ws.close()
+
+    def publish(self, message):
+        '''Sends ``message`` to all connected clients.'''
+        self._call(self._send(message))
+
+    def disconnect(self):
+        '''Closes the client connections.'''
+        self._call(self._close_clients())
+
+    def stop(self):
+        self.disconnect()
+        self._call(self._runner.cleanup())
+        self._loop.call_soon_threadsafe(self._loop.stop)
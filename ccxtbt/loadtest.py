@@ -0,0 +1,185 @@
+#!/usr/bin/env python
+# -*- coding: utf-8; py-indent-offset:4 -*-
+###############################################################################
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+###############################################################################
+'''Load test of the live path of the store, broker and feed against
+``MockExchange``.
+
+Runs cerebro on tick feeds of ``--symbols`` symbols with a strategy sending
+``--orders`` market orders per symbol at each ``next``, for ``--seconds``
+seconds, then reports the orders sent and completed per second, the cycle
+time between ``next`` calls, the time spent in the broker ``next`` and the
+age of the ticks when they reach the strategy. Eg:
+
+    python -m ccxtbt.loadtest --symbols 5 --latency 0.02 --rate-limit 50 --fill-parts 2
+    python -m ccxtbt.loadtest --stream  # order updates from a local websocket
+'''
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import argparse
+import time
+from datetime import timezone
+
+import backtrader as bt
+
+from .ccxtstore import CCXTStore
+from .ccxtstream import LocalStreamServer, WebSocketOrderStream
+from .mockexchange import MockExchange
+
+
+def percentiles(values, points=(50, 95, 100)):
+    '''Percentiles of ``values`` at ``points``, ``None`` if empty.'''
+    values = sorted(values)
+    if not values:
+        return [None for _ in points]
+    return [values[min(len(values) - 1, int(len(values) * p / 100))] for p in points]
+
+
+class LoadStrategy(bt.Strategy):
+    params = (
+        ('orders', 1),
+        ('size', 0.01),
+        ('seconds', 10),
+    )
+
+    def start(self):
+        self.sent = 0
+        self.completed = set()
+        self.failed = set()
+        self.cycles = []
+        self.ages = []
+        self.started = None
+        self.last = None
+        self.side = 0
+
+    def notify_order(self, order):
+        # The broker notifies the order itself, not a copy, count each once
+        if order.status == order.Completed:
+            self.completed.add(order.ref)
+        elif order.status in (order.Canceled, order.Rejected, order.Margin):
+            self.failed.add(order.ref)
+
+    def next(self):
+        now = time.perf_counter()
+        if self.started is None:
+            self.started = now
+        else:
+            self.cycles.append(now - self.last)
+        self.last = now
+
+        for data in self.datas:
+            if len(data):
+                # num2date is naive utc
+                dtime = bt.num2date(data.datetime[0]).replace(tzinfo=timezone.utc)
+                self.ages.append(time.time() - dtime.timestamp())
+            for _ in range(self.p.orders):
+                if self.side % 2:
+                    self.sell(data=data, size=self.p.size)
+                else:
+                    self.buy(data=data, size=self.p.size)
+                self.side += 1
+                self.sent += 1
+
+        if now - self.started >= self.p.seconds:
+            self.env.runstop()
+
+
+def run(args):
+    server = None
+    if args.stream:
+        server = LocalStreamServer()
+        server.start()
+
+    symbols = ['S{}/USDT'.format(i) for i in range(args.symbols)]
+    balance = dict({symbol.split('/')[0]: 1e6 for symbol in symbols}, USDT=1e9)
+    exchange = MockExchange(latency=args.latency, latency_jitter=args.jitter,
+                            rate_limit=args.rate_limit, error_rate=args.error_rate,
+                            fill_parts=args.fill_parts, fill_interval=args.fill_interval,
+                            trade_rate=args.trade_rate, balance=balance, stream=server)
+    store = CCXTStore(exchange=exchange, currency='USDT', config={}, retries=5,
+                      backoff_base=0.05)
+
+    order_stream = WebSocketOrderStream(server.url) if server is not None else None
+    broker = store.getbroker(order_stream=order_stream)
+    broker_times = []
+    broker_next = broker.next
+
+    def timed_next():
+        start = time.perf_counter()
+        broker_next()
+        broker_times.append(time.perf_counter() - start)
+
+    broker.next = timed_next
+
+    cerebro = bt.Cerebro(quicknotify=True)
+    cerebro.setbroker(broker)
+    for symbol in symbols:
+        cerebro.adddata(store.getdata(dataname=symbol, name=symbol,
+                                      timeframe=bt.TimeFrame.Ticks))
+    cerebro.addstrategy(LoadStrategy, orders=args.orders, seconds=args.seconds)
+
+    strategy = cerebro.run(qcheck=0.01)[0]
+    elapsed = time.perf_counter() - strategy.started if strategy.started else 0
+
+    if order_stream is not None:
+        order_stream.stop()
+    if server is not None:
+        server.stop()
+
+    print('Symbols {}, latency {}s, rate limit {}/s, error rate {}, fill parts {}, stream {}'
+          .format(args.symbols, args.latency, args.rate_limit, args.error_rate,
+                  args.fill_parts, bool(args.stream)))
+    print('Seconds:          {:.2f}'.format(elapsed))
+    print('Orders sent:      {} ({:.1f}/s)'.format(strategy.sent, strategy.sent / elapsed
+                                                   if elapsed else 0))
+    print('Orders completed: {} ({:.1f}/s)'.format(len(strategy.completed),
+                                                   len(strategy.completed) / elapsed
+                                                   if elapsed else 0))
+    print('Orders failed:    {}'.format(len(strategy.failed)))
+    for name, values in (('Cycle ms', strategy.cycles), ('Broker next ms', broker_times),
+                         ('Tick age ms', strategy.ages)):
+        p50, p95, top = percentiles(values)
+        if p50 is None:
+            print('{:17} -'.format(name + ':'))
+        else:
+            print('{:17} p50 {:.1f}  p95 {:.1f}  max {:.1f}'.format(
+                name + ':', p50 * 1000, p95 * 1000, top * 1000))
+    print('Rate limiter:     {} requests, {:.2f}s waited'.format(store.limiter.calls,
+                                                                 store.limiter.waited))
+    print('Exchange:         {}'.format(exchange.stats()))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--symbols', type=int, default=3)
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--orders', type=int, default=1, help='orders per symbol per next')
+    parser.add_argument('--latency', type=float, default=0.01)
+    parser.add_argument('--jitter', type=float, default=0.005)
+    parser.add_argument('--rate-limit', type=float, default=None)
+    parser.add_argument('--error-rate', type=float, default=0)
+    parser.add_argument('--fill-parts', type=int, default=1)
+    parser.add_argument('--fill-interval', type=float, default=0)
+    parser.add_argument('--trade-rate', type=float, default=20)
+    parser.add_argument('--stream', action='store_true',
+                        help='order updates from a local websocket')
+    run(parser.parse_args())
+
+
+if __name__ == '__main__':
+    main()
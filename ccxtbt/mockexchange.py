@@ -0,0 +1,353 @@
+#!/usr/bin/env python
+# -*- coding: utf-8; py-indent-offset:4 -*-
+###############################################################################
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+###############################################################################
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import collections
+import copy
+import math
+import random
+import threading
+import time
+import zlib
+
+import ccxt
+
+
+class MockExchange(ccxt.Exchange):
+    '''In process exchange for testing and load testing the store, broker and
+    feed without a real exchange or testnet.
+
+    Implements the ccxt methods used by ``CCXTStore``: ``fetch_ohlcv``,
+    ``fetch_trades``, ``create_order``, ``fetch_order``, ``fetch_orders``,
+    ``fetch_open_orders``, ``cancel_order`` and ``fetch_balance``. Prices are
+    a deterministic function of the symbol and time, so candles and public
+    trades exist for any symbol and time without keeping a history. Orders
+    fill against the current price, market orders at once and limit orders
+    when the price reaches them.
+
+    Pass the exchange to the store in place of the exchange name:
+
+        exchange = MockExchange(latency=0.02, rate_limit=20, fill_parts=2)
+        store = CCXTStore(exchange=exchange, currency='USDT', config={}, retries=5)
+
+    Params:
+      - ``latency`` (default: 0), ``latency_jitter`` (default: 0)
+        Seconds each call takes, plus a random part up to ``latency_jitter``.
+      - ``rate_limit`` (default: ``None``)
+        Calls per second above which calls raise ``RateLimitExceeded``.
+      - ``error_rate`` (default: 0)
+        Share of calls raising ``RequestTimeout``.
+      - ``fill_parts`` (default: 1), ``fill_interval`` (default: 0)
+        Orders fill in ``fill_parts`` trades, ``fill_interval`` seconds apart.
+      - ``trade_rate`` (default: 10)
+        Public trades per second of each symbol, for ``fetch_trades``.
+      - ``balance`` (default: 100000 USDT)
+        Dict of the starting balance of each currency.
+      - ``stream`` (default: ``None``)
+        Object with a ``publish`` method, eg: ``ccxtstream.LocalStreamServer``,
+        sent the unified order at each change, for ``WebSocketOrderStream``.
+      - ``seed`` (default: 0)
+        Seed of the prices, errors and latency.
+
+    ``calls`` counts the calls of each method, ``rate_limited`` and ``errors``
+    the calls that raised.
+    '''
+
+    def __init__(self, latency=0, latency_jitter=0, rate_limit=None, error_rate=0,
+                 fill_parts=1, fill_interval=0, trade_rate=10, balance=None,
+                 stream=None, seed=0, config={}):
+        super(MockExchange, self).__init__(config)
+        self.id = 'mock'
+        self.name = 'Mock'
+        self.rateLimit = 1000 / rate_limit if rate_limit else 10
+        self.has = dict(self.has, fetchOHLCV=True, fetchTrades=True, fetchOrder=True,
+                        fetchOrders=True, fetchOpenOrders=True, fetchBalance=True,
+                        createOrder=True, cancelOrder=True)
+        self.timeframes = {tf: tf for tf in ('1m', '3m', '5m', '15m', '30m', '1h', '2h',
+                                             '4h', '6h', '8h', '12h', '1d')}
+
+        self.latency = latency
+        self.latency_jitter = latency_jitter
+        self.rate_limit = rate_limit
+        self.error_rate = error_rate
+        self.fill_parts = fill_parts
+        self.fill_interval = fill_interval
+        self.trade_rate = trade_rate
+        self.stream = stream
+        self.seed = seed
+
+        self.lock = threading.Lock()
+        self.random = random.Random(seed)
+        self.balance = collections.defaultdict(float, balance or {'USDT': 100000.0})
+        self.orders = collections.OrderedDict()
+        self._open = collections.OrderedDict()  # open orders by id
+        self.calls = collections.Counter()
+        self.rate_limited = 0
+        self.errors = 0
+        self._recent = collections.deque()  # call times of the last second
+        self._order_id = 0
+        self._trade_id = 0
+
+    # Prices
+
+    def price(self, symbol, tstamp):
+        '''Price of ``symbol`` at ``tstamp`` ms: a slow wave with noise.'''
+        phase = zlib.crc32(symbol.encode()) % 1000
+        base = 10 + phase
+        wave = math.sin(2 * math.pi * tstamp / 3600000 + phase)
+        noise = random.Random(self.seed * 7919 + phase * 104729 + tstamp // 1000).uniform(-1, 1)
+        return round(base * (1 + 0.01 * wave + 0.001 * noise), 6)
+
+    def _candle(self, symbol, tstamp, interval):
+        step = max(1000, interval // 10)
+        prices = [self.price(symbol, t) for t in range(tstamp, tstamp + interval, step)]
+        prices.append(self.price(symbol, tstamp + interval - 1))
+        volume = random.Random(tstamp + self.seed).uniform(1, 100)
+        return [tstamp, prices[0], max(prices), min(prices), prices[-1], round(volume, 4)]
+
+    # Calls
+
+    def _call(self, method):
+        '''Latency, rate limit and errors of a call, then fills orders.'''
+        with self.lock:
+            self.calls[method] += 1
+            delay = self.latency + self.random.uniform(0, self.latency_jitter)
+            failed = self.random.random() < self.error_rate
+
+        if delay > 0:
+            time.sleep(delay)
+
+        with self.lock:
+            now = time.time()
+            if self.rate_limit:
+                while self._recent and self._recent[0] <= now - 1:
+                    self._recent.popleft()
+                if len(self._recent) >= self.rate_limit:
+                    self.rate_limited += 1
+                    raise ccxt.RateLimitExceeded('mock {} rate limit exceeded'.format(method))
+                self._recent.append(now)
+            if failed:
+                self.errors += 1
+                raise ccxt.RequestTimeout('mock {} timed out'.format(method))
+            return self._match(int(now * 1000))
+
+    def _match(self, now):
+        '''Fills the open orders due a fill, returns the changed orders in
+        the unified format.'''
+        changed = []
+        for order in list(self._open.values()):
+            if order['_next_fill'] > now:
+                continue
+
+            price = self.price(order['symbol'], now)
+            if order['type'] == 'limit':
+                if order['side'] == 'buy' and price > order['price']:
+                    continue
+                if order['side'] == 'sell' and price < order['price']:
+                    continue
+                price = order['price']
+
+            amount = min(order['remaining'], order['amount'] / self.fill_parts)
+            if order['remaining'] - amount < 1e-12:
+                amount = order['remaining']
+            self._trade_id += 1
+            order['trades'].append({
+                'id': str(self._trade_id),
+                'order': order['id'],
+                'symbol': order['symbol'],
+                'side': order['side'],
+                'timestamp': now,
+                'datetime': self.iso8601(now),
+                'amount': amount,
+                'price': price,
+            })
+            cost = sum(trade['amount'] * trade['price'] for trade in order['trades'])
+            order['filled'] += amount
+            order['remaining'] = order['amount'] - order['filled']
+            order['average'] = cost / order['filled']
+            order['cost'] = cost
+            if order['type'] == 'market':
+                order['price'] = order['average']  # as ccxt reports filled market orders
+            order['lastTradeTimestamp'] = now
+            order['_next_fill'] = now + self.fill_interval * 1000
+
+            base, quote = order['symbol'].split('/')
+            sign = 1 if order['side'] == 'buy' else -1
+            self.balance[base] += sign * amount
+            self.balance[quote] -= sign * amount * price
+
+            if order['remaining'] <= 1e-12:
+                order['remaining'] = 0.0
+                order['status'] = 'closed'
+                del self._open[order['id']]
+            changed.append(self._unified(order))
+        return changed
+
+    def _publish(self, orders):
+        if self.stream is not None:
+            for order in orders:
+                self.stream.publish(order)
+
+    def _unified(self, order):
+        return {key: copy.deepcopy(value) for key, value in order.items()
+                if not key.startswith('_')}
+
+    def _order(self, oid):
+        order = self.orders.get(str(oid))
+        if order is None:
+            raise ccxt.OrderNotFound('mock order {} not found'.format(oid))
+        return order
+
+    # Public methods
+
+    def fetch_ohlcv(self, symbol, timeframe='1m', since=None, limit=None, params={}):
+        self._publish(self._call('fetch_ohlcv'))
+        interval = self.parse_timeframe(timeframe) * 1000
+        limit = limit or 500
+        now = self.milliseconds()
+        last = now - now % interval  # open candle
+        if since is None:
+            first = last - (limit - 1) * interval
+        else:
+            first = since + (-since % interval)
+        return [self._candle(symbol, tstamp, interval)
+                for tstamp in range(first, min(last, first + (limit - 1) * interval) + 1, interval)]
+
+    def fetch_trades(self, symbol, since=None, limit=None, params={}):
+        self._publish(self._call('fetch_trades'))
+        now = self.milliseconds()
+        last = int(now * self.trade_rate / 1000)
+        limit = limit or 1000
+        if since is None:
+            first = last - limit + 1
+        else:
+            first = int(math.ceil(since * self.trade_rate / 1000))
+            first = max(first, last - int(60 * self.trade_rate))  # a minute of history
+        trades = []
+        for k in range(first, min(last, first + limit - 1) + 1):
+            tstamp = int(k * 1000 / self.trade_rate)
+            side = 'buy' if random.Random(k + self.seed).random() < 0.5 else 'sell'
+            trades.append({
+                'id': str(k),
+                'symbol': symbol,
+                'timestamp': tstamp,
+                'datetime': self.iso8601(tstamp),
+                'side': side,
+                'price': self.price(symbol, tstamp),
+                'amount': round(random.Random(k * 31 + self.seed).uniform(0.01, 2), 4),
+            })
+        return trades
+
+    # Private methods
+
+    def fetch_balance(self, params={}):
+        self._publish(self._call('fetch_balance'))
+        with self.lock:
+            balance = {'info': {}, 'free': {}, 'used': {}, 'total': {}}
+            for currency, total in self.balance.items():
+                balance[currency] = {'free': total, 'used': 0.0, 'total': total}
+                balance['free'][currency] = total
+                balance['used'][currency] = 0.0
+                balance['total'][currency] = total
+            return balance
+
+    def create_order(self, symbol, type, side, amount, price=None, params={}):
+        self._publish(self._call('create_order'))
+        if type == 'limit' and price is None:
+            raise ccxt.InvalidOrder('mock limit order without price')
+
+        now = self.milliseconds()
+        with self.lock:
+            base, quote = symbol.split('/')
+            cost = amount * (price or self.price(symbol, now))
+            if side == 'buy' and self.balance[quote] < cost:
+                raise ccxt.InsufficientFunds('mock {} {} short'.format(cost, quote))
+            if side == 'sell' and self.balance[base] < amount:
+                raise ccxt.InsufficientFunds('mock {} {} short'.format(amount, base))
+
+            self._order_id += 1
+            order = {
+                'id': str(self._order_id),
+                'clientOrderId': params.get('clientOrderId'),
+                'timestamp': now,
+                'datetime': self.iso8601(now),
+                'lastTradeTimestamp': None,
+                'symbol': symbol,
+                'type': type,
+                'side': side,
+                'price': price,
+                'amount': amount,
+                'filled': 0.0,
+                'remaining': amount,
+                'average': None,
+                'cost': 0.0,
+                'status': 'open',
+                'fee': None,
+                'trades': [],
+                '_next_fill': now,
+            }
+            self.orders[order['id']] = order
+            self._open[order['id']] = order
+            unified = self._unified(order)
+        self._publish([unified])
+        return unified
+
+    def cancel_order(self, id, symbol=None, params={}):
+        self._publish(self._call('cancel_order'))
+        with self.lock:
+            order = self._order(id)
+            if order['status'] != 'open':
+                raise ccxt.OrderNotFound('mock order {} is {}'.format(id, order['status']))
+            order['status'] = 'canceled'
+            del self._open[order['id']]
+            unified = self._unified(order)
+        self._publish([unified])
+        return unified
+
+    def fetch_order(self, id, symbol=None, params={}):
+        self._publish(self._call('fetch_order'))
+        with self.lock:
+            return self._unified(self._order(id))
+
+    def fetch_orders(self, symbol=None, since=None, limit=None, params={}):
+        self._publish(self._call('fetch_orders'))
+        return self._orders(symbol, since, limit)
+
+    def fetch_open_orders(self, symbol=None, since=None, limit=None, params={}):
+        self._publish(self._call('fetch_open_orders'))
+        return self._orders(symbol, since, limit, status='open')
+
+    def _orders(self, symbol, since, limit, status=None):
+        with self.lock:
+            orders = [self._unified(order) for order in self.orders.values()
+                      if (symbol is None or order['symbol'] == symbol) and
+                      (since is None or order['timestamp'] >= since) and
+                      (status is None or order['status'] == status)]
+        return orders[-limit:] if limit else orders
+
+    def stats(self):
+        '''Calls by method and the calls that raised.'''
+        return {
+            'calls': dict(self.calls),
+            'rate_limited': self.rate_limited,
+            'errors': self.errors,
+            'orders': len(self.orders),
+            'fills': self._trade_id,
+        }
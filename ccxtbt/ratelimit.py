@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+# -*- coding: utf-8; py-indent-offset:4 -*-
+###############################################################################
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+###############################################################################
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import random
+import threading
+import time
+
+
+class TokenBucket(object):
+    '''Token bucket rate limiter shared by all the callers of an exchange.
+
+    The bucket holds up to ``capacity`` tokens and refills at ``rate`` tokens
+    per second. A request of weight ``w`` takes ``w`` tokens, and only waits
+    when the bucket does not hold them, so calls under the exchange limit go
+    out straight away while bursts are spread to ``rate``.
+
+    Thread safe. ``waited`` and ``calls`` give the total seconds spent waiting
+    and the number of requests.
+    '''
+
+    def __init__(self, rate, capacity=None):
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity is not None else max(1.0, rate))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+        self.waited = 0.0
+        self.calls = 0
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self, weight=1):
+        '''Takes ``weight`` tokens and returns the seconds to wait for them.'''
+        with self.lock:
+            self.calls += 1
+            if weight <= 0:
+                return 0.0
+            self._refill(time.monotonic())
+            # Tokens may go negative, later callers then wait behind this one.
+            self.tokens -= weight
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0.0
+            self.waited += wait
+            return wait
+
+    def acquire(self, weight=1):
+        '''Blocks until ``weight`` tokens are available.'''
+        wait = self.delay(weight)
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+
+# One bucket per exchange and key, shared by the stores of the process.
+_buckets = {}
+_buckets_lock = threading.Lock()
+
+
+def get_bucket(key, rate, capacity=None):
+    '''Returns the shared ``TokenBucket`` for ``key``, eg: the exchange id and
+    api key, creating it with ``rate`` and ``capacity`` the first time.'''
+    with _buckets_lock:
+        if key not in _buckets:
+            _buckets[key] = TokenBucket(rate, capacity)
+        return _buckets[key]
+
+
+def backoff(attempt, base, maximum):
+    '''Seconds to wait before retry ``attempt`` (0 for the first retry):
+    exponential backoff with full jitter, between 0 and
+    ``min(maximum, base * 2 ** attempt)``.'''
+    return random.uniform(0, min(maximum, base * 2 ** attempt))
@@ -14,13 +14,61 @@
 #
 ###############################################################################
 import backtrader as bt
+import pyarrow as pa
 
+from extension.spill import SpillWriter, spill_enabled, spill_path
+from extension.timing import ANALYZER_METHODS, timed
 
-class GlobalOutput(bt.analyzers.Analyzer):
-    """ Capture output from the custom global indicators that are active.   """
+
+class SpillAnalyzer(bt.analyzers.Analyzer):
+    """
+    Base for per bar analyzers that keep their output in ``self.rets``.
+
+    With the ``spill_rows`` param set, rows are written to disk in chunks of
+    ``spill_rows`` instead of kept in memory, and ``get_analysis`` returns a
+    ``SpillReader`` for ``extension.result`` to read back lazily.
+
+    ``spill_types`` are the arrow types of the spilled columns that are not
+    floats, as line values are.
+    """
+
+    spill_types = {}
 
     def start(self):
         self.rets = {}
+        self.spill = None
+        if spill_enabled(self.strategy.p):
+            self.spill = SpillWriter(
+                spill_path(self.strategy.p, type(self).__name__.lower()),
+                self.strategy.p.spill_rows,
+                self.spill_types,
+            )
+
+    def to_row(self, key, value):
+        """ Flat row for the spill file, columns match the exported table. """
+        raise NotImplementedError
+
+    def record(self, key, value):
+        if self.spill is None:
+            self.rets[key] = value
+        else:
+            self.spill.append(self.to_row(key, value))
+
+    def stop(self):
+        if self.spill is not None:
+            self.rets = self.spill.close()
+
+    def get_analysis(self):
+        return self.rets
+
+
+class GlobalOutput(SpillAnalyzer):
+    """ Capture output from the custom global indicators that are active.   """
+
+    spill_types = dict(Datetime=pa.timestamp("us"))
+
+    def to_row(self, key, value):
+        return dict(Datetime=key, **value)
 
     def next(self):
         st = self.strategy
@@ -48,10 +96,7 @@ class GlobalOutput(bt.analyzers.Analyzer):
             pass
 
 
-        self.rets[self.data.datetime.datetime()] = global_values
-
-    def get_analysis(self):
-        return self.rets
+        self.record(self.data.datetime.datetime(), global_values)
 
 
 class TradeList(bt.analyzers.Analyzer):
@@ -72,9 +117,32 @@ class TradeList(bt.analyzers.Analyzer):
     def __init__(self):
         self.trades = []
         self.cumprofit = 0.0
+        # Running [trade, highest, lowest] for each open trade keyed by trade
+        # ref. Updated every bar so closing a trade does not need to look back
+        # over the data lines, which are bounded when using ``exactbars``.
+        self.open_trades = {}
+
+    def update_extremes(self, trade):
+        high = trade.data.high[0]
+        low = trade.data.low[0]
+        try:
+            extremes = self.open_trades[trade.ref]
+        except KeyError:
+            self.open_trades[trade.ref] = [trade, high, low]
+            return
+
+        extremes[1] = max(extremes[1], high)
+        extremes[2] = min(extremes[2], low)
+
+    def next(self):
+        for trade, _, _ in self.open_trades.values():
+            self.update_extremes(trade)
 
     def notify_trade(self, trade):
 
+        if trade.isopen:
+            self.update_extremes(trade)
+
         if trade.isclosed:
 
             brokervalue = self.strategy.broker.getvalue()
@@ -108,8 +176,8 @@ class TradeList(bt.analyzers.Analyzer):
                     size = record.status.size
                     value = record.status.value
 
-            highest_in_trade = max(trade.data.high.get(ago=0, size=barlen + 1))
-            lowest_in_trade = min(trade.data.low.get(ago=0, size=barlen + 1))
+            self.update_extremes(trade)
+            _, highest_in_trade, lowest_in_trade = self.open_trades.pop(trade.ref)
             hp = 100 * (highest_in_trade - pricein) / pricein
             lp = 100 * (lowest_in_trade - pricein) / pricein
             if dir == "long":
@@ -142,11 +210,15 @@ class TradeList(bt.analyzers.Analyzer):
             )
 
 
-class OrderHistory(bt.analyzers.Analyzer):
+class OrderHistory(SpillAnalyzer):
     """ Analyzer for tracking details of outstanding orders at each bar. """
 
-    def start(self):
-        self.rets = {}
+    spill_types = dict(
+        Datetime=pa.timestamp("us"), ref=pa.int64(), status=pa.int64(), ordtype=pa.string()
+    )
+
+    def to_row(self, key, value):
+        return dict(Datetime=key[0], **value)
 
     def next(self):
         st = self.strategy
@@ -168,19 +240,18 @@ class OrderHistory(bt.analyzers.Analyzer):
                         valid=o.valid,
                     )
 
-                    self.rets[(dt, o.ref,)] = order_detail
+                    self.record((dt, o.ref,), order_detail)
             except:
                 pass
 
-    def get_analysis(self):
-        return self.rets
-
 
-class CashMarket(bt.analyzers.Analyzer):
+class CashMarket(SpillAnalyzer):
     """
     Analyzer returning cash and market values
     """
 
+    spill_types = dict(Date=pa.timestamp("us"))
+
     def __init__(self):
         self.current_date = None
 
@@ -191,18 +262,18 @@ class CashMarket(bt.analyzers.Analyzer):
         self.rets = {}
         self.vals = 0.0
 
+    def to_row(self, key, value):
+        return dict(Date=key, Cash=value[0], Value=value[1])
+
     def notify_cashvalue(self, cash, value):
         date = self.data.datetime.date()
         if date != self.current_date:
             self.vals = (cash, value)
-            self.rets[self.strategy.datetime.datetime()] = self.vals
+            self.record(self.strategy.datetime.datetime(), self.vals)
             self.current_date = date
         else:
             pass
 
-    def get_analysis(self):
-        return self.rets
-
 
 class TradeClosed(bt.analyzers.Analyzer):
     """
@@ -233,7 +304,7 @@ class TradeClosed(bt.analyzers.Analyzer):
         return self.rets
 
 
-class OHLCV(bt.analyzers.Analyzer):
+class OHLCV(SpillAnalyzer):
     """
 
     This analyzer reports the OHLCV of each of datas.
@@ -253,29 +324,30 @@ class OHLCV(bt.analyzers.Analyzer):
         each return as keys
     """
 
-    def start(self):
-        # tf = min(d._timeframe for d in self.datas)
-        # self._usedate = bt.TimeFrame.Seconds
-        self.rets = {}
+    spill_types = dict(Date=pa.timestamp("us"))
+
+    def to_row(self, key, value):
+        columns = ["Date", "Open", "High", "Low", "Close", "Volume"]
+        return dict(zip(columns, [key] + value))
 
     def next(self):
         # Create custom volume for plotting higher volumes in bright yellow,
         # grey out lower volume.
 
         try:
-            self.rets[self.datas[0].datetime.datetime()] = [
-                self.datas[0].open[0],
-                self.datas[0].high[0],
-                self.datas[0].low[0],
-                self.datas[0].close[0],
-                self.datas[0].volume[0],
-            ]
+            self.record(
+                self.datas[0].datetime.datetime(),
+                [
+                    self.datas[0].open[0],
+                    self.datas[0].high[0],
+                    self.datas[0].low[0],
+                    self.datas[0].close[0],
+                    self.datas[0].volume[0],
+                ],
+            )
         except:
             pass
 
-    def get_analysis(self):
-        return self.rets
-
 
 class Benchmark(bt.analyzers.Analyzer):
     """ This analyzer reports the Benchmark of each. """
@@ -302,9 +374,97 @@ class Benchmark(bt.analyzers.Analyzer):
         return self.rets
 
 
+# Registry of the analyzers available to the backtests, keyed by the ``_name``
+# used in cerebro. Each analyzer declares:
+#   - ``cls``: Analyzer class.
+#   - ``kwargs``: Optional keyword arguments passed to ``cerebro.addanalyzer``.
+#   - ``tier``: Cost tier. ``light`` analyzers have one or minimal lines of
+#     output per test and are used for every test. ``full`` analyzers have many
+#     lines per test and are only used with ``full_export``.
+#   - ``tables``: Output tables the analyzer is exported to by
+#     ``extension.result``.
+#   - ``required``: Optional. The backtest itself relies on this analyzer, so it
+#     is always attached, but it is only exported if selected.
+#   - ``excel``: Optional. Selected whenever saving to excel, as the workbook
+#     always has its sheet.
+ANALYZERS = dict(
+    trades=dict(
+        cls=bt.analyzers.TradeAnalyzer,
+        tier="light",
+        tables=["trade_analysis"],
+        required=True,
+    ),
+    drawdown=dict(cls=bt.analyzers.DrawDown, tier="light", tables=["drawdown"]),
+    cash_market=dict(cls=CashMarket, tier="light", tables=["value"], required=True),
+    # VWR=dict(
+    #     cls=bt.analyzers.VariabilityWeightedReturn,
+    #     kwargs=dict(timeframe=bt.TimeFrame.Days, tau=2.0, sdev_max=0.2),
+    #     tier="light",
+    #     tables=["vwr"],
+    # ),
+    transactions=dict(
+        cls=bt.analyzers.Transactions, tier="full", tables=["transaction"], excel=True,
+    ),
+    trade_list=dict(cls=TradeList, tier="full", tables=["trade_list"], excel=True),
+    trade_closed=dict(cls=TradeClosed, tier="full", tables=["trade"]),
+    OHLCV=dict(cls=OHLCV, tier="full", tables=["ohlcv"]),
+    benchmark=dict(cls=Benchmark, tier="full", tables=["benchmark"]),
+    global_signal=dict(cls=GlobalOutput, tier="full", tables=["global_out"]),
+    order_history=dict(cls=OrderHistory, tier="full", tables=["order_history"]),
+)
+
+
+def select_analyzers(scene):
+    """
+    Names of the analyzers selected for a backtest.
+
+    If the scene has an ``analyzers`` list it is used as is, otherwise the
+    ``light`` tier is selected, plus the ``full`` tier if ``full_export``,
+    plus the ``excel`` analyzers if ``save_excel``. The ``benchmark``
+    analyzer is dropped when there is no benchmark.
+
+    :param scene dict: One set of backtest parameters.
+    :return list: Analyzer names from the ``ANALYZERS`` registry.
+    """
+    names = scene.get("analyzers")
+    if names is None:
+        tiers = ["light", "full"] if scene["full_export"] else ["light"]
+        names = [
+            n
+            for n, a in ANALYZERS.items()
+            if a["tier"] in tiers or (a.get("excel") and scene.get("save_excel"))
+        ]
+    elif isinstance(names, str):
+        names = [names]
+    else:
+        names = list(names)
+
+    unknown = [n for n in names if n not in ANALYZERS]
+    if unknown:
+        raise ValueError(
+            f"Unknown analyzers {unknown}, available analyzers are "
+            f"{list(ANALYZERS.keys())}."
+        )
+
+    duplicates = sorted({n for n in names if names.count(n) > 1})
+    if duplicates:
+        raise ValueError(f"Analyzers {duplicates} are selected more than once.")
+
+    if not scene["benchmark"]:
+        names = [n for n in names if n != "benchmark"]
+
+    return names
+
+
 class AddAnalyzer:
     """
     Adds the analyzers to cerebro and returns cerebro to the ``run_strat``.
+
+    Analyzers are selected from the ``ANALYZERS`` registry using
+    ``select_analyzers``. Required analyzers not selected are still attached
+    since the backtest relies on them, and ``trade_list`` with
+    ``print_final_output``. Other analyzers are not attached. With
+    ``timings`` the analyzers add up the time spent in them.
     """
     def __init__(self, cerebro):
         self.cerebro = cerebro
@@ -313,31 +473,19 @@ class AddAnalyzer:
         # Analyzers. Custom analyzers can be found in extensions/analyzer.py
         # Analyzers returned in the strategy object
         scene = self.cerebro.strats[0][0][2]
-        # self.cerebro.addanalyzer(
-        #     bt.analyzers.VariabilityWeightedReturn,
-        #     _name="VWR",
-        #     timeframe=bt.TimeFrame.Days,
-        #     tau=2.0,
-        #     sdev_max=0.2,
-        # )
-
-        # For all tests, but mainly high volume multi-processor tests.
-        self.cerebro.addanalyzer(bt.analyzers.TradeAnalyzer, _name="trades")
-        self.cerebro.addanalyzer(bt.analyzers.DrawDown, _name="drawdown")
-        self.cerebro.addanalyzer(bt.analyzers.Transactions, _name="transactions")
-        self.cerebro.addanalyzer(CashMarket, _name="cash_market")
-        self.cerebro.addanalyzer(TradeList, _name="trade_list")
-
-        # Enable these analyzers only if full expert used for plotting
-        # individual backtests.
-        if scene["full_export"]:
-            self.cerebro.addanalyzer(bt.analyzers.Transactions, _name="transactions")
-            self.cerebro.addanalyzer(TradeClosed, _name="trade_closed")
-            self.cerebro.addanalyzer(OHLCV, _name="OHLCV")
-            self.cerebro.addanalyzer(Benchmark, _name="benchmark")
-            self.cerebro.addanalyzer(GlobalOutput, _name="global_signal")
-            self.cerebro.addanalyzer(OrderHistory, _name="order_history")
-
 
+        names = select_analyzers(scene)
+        names += [
+            n for n, a in ANALYZERS.items() if a.get("required") and n not in names
+        ]
+        if scene.get("print_final_output") and "trade_list" not in names:
+            names.append("trade_list")
+
+        for name in names:
+            analyzer = ANALYZERS[name]
+            cls = analyzer["cls"]
+            if scene.get("timings"):
+                cls = timed(cls, ANALYZER_METHODS)
+            self.cerebro.addanalyzer(cls, _name=name, **analyzer.get("kwargs", {}))
 
         return self.cerebro
@@ -0,0 +1,365 @@
+###############################################################################
+#
+# Software program written by Neil Murphy in year 2021.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+#
+# By using this software, the Disclaimer and Terms distributed with the
+# software are deemed accepted, without limitation, by user.
+#
+# You should have received a copy of the Disclaimer and Terms document
+# along with this program.  If not, see... https://bit.ly/2Tlr9ii
+#
+###############################################################################
+import numpy as np
+import pandas as pd
+
+"""
+Module computing the performance metrics of the ``quantstats`` table with NumPy.
+
+The metrics follow the definitions of ``quantstats.stats`` on daily returns,
+with no risk free rate and 252 periods a year, but are returned unrounded as
+floats. Everything is computed on a 2D array of portfolio values, one row per
+test, so one test or a whole batch of aligned equity curves are computed the
+same way with ``batch_metrics``. ``NaN`` values mark the dates missing in a
+test. Infinite ratios, such as the profit factor of a test with no losing
+day, are returned as ``NaN``.
+
+The column names are those of the ``quantstats`` table saved by earlier
+versions. ``compare_quantstats`` checks the metrics of a test against
+``quantstats``.
+"""
+
+PERIODS = 252
+
+# Standard normal quantile and density at 5%, for the value at risk.
+NORM_PPF_05 = -1.6448536269514722
+NORM_PDF_PPF_05 = 0.10313564037537128
+
+# Metric column and the ``quantstats.stats`` function it matches, used by
+# ``compare_quantstats``.
+METRICS = {
+    "Time_in_Market": "exposure",
+    "Cumulative_Return": "comp",
+    "CAGR﹪": "cagr",
+    "Sharpe": "sharpe",
+    "Smart_Sharpe": "smart_sharpe",
+    "Sortino": "sortino",
+    "Smart_Sortino": "smart_sortino",
+    "Sortino/√2": None,
+    "Omega": "omega",
+    "Max_Drawdown": "max_drawdown",
+    "Volatility_ann.": "volatility",
+    "Calmar": "calmar",
+    "Skew": "skew",
+    "Kurtosis": "kurtosis",
+    "Ulcer_Index": "ulcer_index",
+    "Ulcer_Performance_Index": "ulcer_performance_index",
+    "Recovery_Factor": "recovery_factor",
+    "Avg._Return": "avg_return",
+    "Avg._Win": "avg_win",
+    "Avg._Loss": "avg_loss",
+    "Win/Loss_Ratio": "payoff_ratio",
+    "Win_Days": "win_rate",
+    "Profit_Factor": "profit_factor",
+    "Gain/Pain_Ratio": "gain_to_pain_ratio",
+    "Kelly_Criterion": "kelly_criterion",
+    "Risk_of_Ruin": "risk_of_ruin",
+    "Daily_Value-at-Risk": "value_at_risk",
+    "Expected_Shortfall_cVaR": "conditional_value_at_risk",
+    "Tail_Ratio": "tail_ratio",
+    "Common_Sense_Ratio": "common_sense_ratio",
+    "Outlier_Win_Ratio": "outlier_win_ratio",
+    "Outlier_Loss_Ratio": "outlier_loss_ratio",
+    "Expected_Daily": None,
+    "Best_Day": "best",
+    "Worst_Day": "worst",
+    "Max_Consecutive_Wins": "consecutive_wins",
+    "Max_Consecutive_Losses": "consecutive_losses",
+}
+
+
+def divide(a, b):
+    """ Element wise ``a / b``, ``NaN`` where ``b`` is zero. """
+    a, b = np.broadcast_arrays(np.asarray(a, dtype=float), np.asarray(b, dtype=float))
+    out = np.full(a.shape, np.nan)
+    np.divide(a, b, out=out, where=b != 0)
+    return out
+
+
+def masked_mean(r, mask):
+    """ Row means of ``r`` where ``mask`` is true. """
+    return divide(np.where(mask, r, 0.0).sum(axis=1), mask.sum(axis=1))
+
+
+def longest_run(mask):
+    """ Longest run of true values in each row. """
+    count = np.cumsum(mask, axis=1)
+    reset = np.maximum.accumulate(np.where(mask, 0, count), axis=1)
+    return (count - reset).max(axis=1, initial=0).astype(float)
+
+
+def autocorr_penalty(r, valid, n):
+    """ Penalty of ``quantstats`` smart ratios for autocorrelated returns. """
+    x, y = r[:, :-1], r[:, 1:]
+    both = valid[:, :-1] & valid[:, 1:]
+    m = both.sum(axis=1)
+    mx = masked_mean(x, both)[:, None]
+    my = masked_mean(y, both)[:, None]
+    dx = np.where(both, x - mx, 0.0)
+    dy = np.where(both, y - my, 0.0)
+    scale = np.sqrt((dx ** 2).sum(axis=1) * (dy ** 2).sum(axis=1))
+    coef = np.abs(divide((dx * dy).sum(axis=1), scale))
+    # No penalty when the correlation is undefined.
+    coef = np.where((m > 1) & ~np.isnan(coef), coef, 0.0)
+
+    # sqrt(1 + 2 * sum((1 - i / n) * coef ** i)) for i in 1 .. n - 1, using
+    # the geometric series sums, or summed directly when coef is close to 1.
+    nf = np.maximum(n, 1).astype(float)
+    with np.errstate(all="ignore"):
+        c = np.minimum(coef, 0.9)
+        cn = c ** nf
+        s1 = (c - cn) / (1 - c)
+        s2 = (c - nf * cn + (nf - 1) * cn * c) / (1 - c) ** 2
+    total = s1 - s2 / nf
+    for row in np.flatnonzero(coef > 0.9):
+        i = np.arange(1, n[row])
+        total[row] = ((1 - i / n[row]) * coef[row] ** i).sum()
+    return np.sqrt(1 + 2 * total)
+
+
+def quantiles(r, valid, n, probs):
+    """
+    Row quantiles of the valid returns, interpolated linearly as by pandas.
+
+    :return array: One row per probability, one column per test.
+    """
+    ordered = np.sort(np.where(valid, r, np.inf), axis=1)
+    out = []
+    for prob in probs:
+        h = (n - 1) * prob
+        lo = np.floor(h).astype(int).clip(min=0)
+        hi = np.minimum(lo + 1, n - 1).clip(min=0)
+        a = np.take_along_axis(ordered, lo[:, None], axis=1)[:, 0]
+        b = np.take_along_axis(ordered, hi[:, None], axis=1)[:, 0]
+        with np.errstate(invalid="ignore"):
+            out.append(np.where(n > 0, a + (h - lo) * (b - a), np.nan))
+    return np.array(out)
+
+
+def metrics(values, dates):
+    """
+    Performance metrics of each row of portfolio values.
+
+    :param values: 2D array of portfolio values, tests by dates, ``NaN``
+        outside of a test. A 1D array is one test.
+    :param dates: Dates of the ``values`` columns.
+    :return DataFrame: One row of metrics per test, the ``quantstats`` table
+        columns without ``test_number``.
+    """
+    values = np.atleast_2d(np.asarray(values, dtype=float))
+    dates = pd.DatetimeIndex(dates)
+
+    # Daily returns from the previous value of the test, so dates missing in
+    # one test of an aligned batch are skipped. The first value has no return.
+    rows = np.arange(values.shape[0])[:, None]
+    last_valid = np.where(~np.isnan(values), np.arange(values.shape[1]), 0)
+    previous = values[rows, np.maximum.accumulate(last_valid, axis=1)]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        r = values[:, 1:] / previous[:, :-1] - 1
+    r[~np.isfinite(r)] = np.nan
+    if r.shape[1] == 0:
+        # A single value has no return, but keeps one column to reduce.
+        r = np.full((values.shape[0], 1), np.nan)
+    valid = ~np.isnan(r)
+    n = valid.sum(axis=1)
+    nf = n.astype(float)
+
+    first = np.where(n > 0, valid.argmax(axis=1), 0)
+    last = np.where(n > 0, r.shape[1] - 1 - valid[:, ::-1].argmax(axis=1), 0)
+    ret_dates = dates[1:] if len(dates) > 1 else dates
+
+    # Move the returns of each test to the start of its row, so consecutive
+    # returns are next to each other for the runs and autocorrelation.
+    order = np.argsort(~valid, axis=1, kind="stable")
+    r = np.take_along_axis(r, order, axis=1)
+    valid = np.take_along_axis(valid, order, axis=1)
+    r0 = np.where(valid, r, 0.0)
+
+    wins = valid & (r0 > 0)
+    losses = valid & (r0 < 0)
+    nonzero = valid & (r0 != 0)
+
+    mean = divide(r0.sum(axis=1), nf)
+    dev = np.where(valid, r - mean[:, None], 0.0)
+    # Products instead of powers, which are much slower on large arrays.
+    dev2 = dev * dev
+    m2 = divide(dev2.sum(axis=1), nf)
+    m3 = divide((dev2 * dev).sum(axis=1), nf)
+    m4 = divide((dev2 * dev2).sum(axis=1), nf)
+    # Sample deviations, undefined below two returns.
+    ddof = np.where(n > 1, nf - 1, 0.0)
+    std = np.sqrt(divide(dev2.sum(axis=1), ddof))
+
+    growth = np.where(valid, 1 + r, 1.0)
+    wealth = np.cumprod(growth, axis=1)
+    comp = wealth[:, -1] - 1
+    with np.errstate(invalid="ignore"):
+        cagr = np.where(
+            comp + 1 < 0, np.nan, np.abs(comp + 1) ** divide(PERIODS, nf) - 1
+        )
+
+    # Drawdowns from the starting value.
+    peak = np.maximum(np.maximum.accumulate(wealth, axis=1), 1.0)
+    drawdown = np.where(valid, wealth / peak - 1, 0.0)
+    max_dd = drawdown.min(axis=1)
+    ulcer = np.sqrt(divide((drawdown ** 2).sum(axis=1), ddof))
+
+    downside = np.sqrt(divide(np.where(losses, r0 ** 2, 0.0).sum(axis=1), nf))
+    sortino = divide(mean, downside) * np.sqrt(PERIODS)
+    sharpe = divide(mean, std) * np.sqrt(PERIODS)
+    penalty = autocorr_penalty(r, valid, n)
+
+    gains = np.where(wins, r0, 0.0).sum(axis=1)
+    pains = -np.where(losses, r0, 0.0).sum(axis=1)
+    avg_win = masked_mean(r0, wins)
+    avg_loss = masked_mean(r0, losses)
+    payoff = divide(avg_win, np.abs(avg_loss))
+    win_rate = divide(wins.sum(axis=1), nonzero.sum(axis=1))
+    win_rate = np.where(nonzero.sum(axis=1) == 0, 0.0, win_rate)
+    profit_factor = divide(gains, pains)
+    profit_factor = np.where((pains == 0) & (gains > 0), np.inf, profit_factor)
+    profit_factor = np.where((pains == 0) & (gains == 0), 0.0, profit_factor)
+
+    q = quantiles(r, valid, n, [0.01, 0.05, 0.95, 0.99])
+    tail = np.abs(divide(q[2], q[1]))
+
+    # Flat returns have no skew or excess kurtosis, as in pandas, and no
+    # value at risk beyond the mean.
+    skew = divide(np.sqrt(nf * (nf - 1)) * m3, (nf - 2) * m2 ** 1.5)
+    skew = np.where((m2 == 0) & (n > 2), 0.0, skew)
+    kurtosis = divide(
+        (nf - 1) * ((nf + 1) * divide(m4, m2 ** 2) - 3 * (nf - 1)),
+        (nf - 2) * (nf - 3),
+    )
+    kurtosis = np.where((m2 == 0) & (n > 3), 0.0, kurtosis)
+    spread = np.where(std > 0, std, np.nan)
+
+    out = pd.DataFrame(
+        {
+            "Start_Period": ret_dates[first].strftime("%Y-%m-%d"),
+            "End_Period": ret_dates[last].strftime("%Y-%m-%d"),
+            "Risk-Free_Rate": 0.0,
+            "Time_in_Market": divide(nonzero.sum(axis=1), nf),
+            "Cumulative_Return": comp,
+            "CAGR﹪": cagr,
+            "Sharpe": sharpe,
+            "Smart_Sharpe": divide(sharpe, penalty),
+            "Sortino": sortino,
+            "Smart_Sortino": divide(sortino, penalty),
+            "Sortino/√2": sortino / np.sqrt(2),
+            "Omega": divide(gains, pains),
+            "Max_Drawdown": max_dd,
+            "Volatility_ann.": std * np.sqrt(PERIODS),
+            "Calmar": divide(cagr, np.abs(max_dd)),
+            "Skew": skew,
+            "Kurtosis": kurtosis,
+            "Ulcer_Index": ulcer,
+            "Ulcer_Performance_Index": divide(comp, ulcer),
+            "Recovery_Factor": divide(np.abs(r0.sum(axis=1)), np.abs(max_dd)),
+            "Avg._Return": masked_mean(r0, nonzero),
+            "Avg._Win": avg_win,
+            "Avg._Loss": avg_loss,
+            "Win/Loss_Ratio": payoff,
+            "Win_Days": win_rate,
+            "Profit_Factor": profit_factor,
+            "Gain/Pain_Ratio": divide(r0.sum(axis=1), pains),
+            "Kelly_Criterion": divide(payoff * win_rate - (1 - win_rate), payoff),
+            "Risk_of_Ruin": ((1 - win_rate) / (1 + win_rate)) ** nf,
+            "Daily_Value-at-Risk": mean + spread * NORM_PPF_05,
+            "Expected_Shortfall_cVaR": np.where(
+                std > 0, mean - spread * NORM_PDF_PPF_05 / 0.05, mean
+            ),
+            "Tail_Ratio": tail,
+            "Common_Sense_Ratio": profit_factor * tail,
+            "Outlier_Win_Ratio": divide(q[3], masked_mean(r0, valid & (r0 >= 0))),
+            "Outlier_Loss_Ratio": divide(q[0], avg_loss),
+            "Expected_Daily": np.abs(comp + 1) ** divide(1, nf) - 1,
+            "Best_Day": np.where(valid, r, -np.inf).max(axis=1),
+            "Worst_Day": np.where(valid, r, np.inf).min(axis=1),
+            "Max_Consecutive_Wins": longest_run(wins),
+            "Max_Consecutive_Losses": longest_run(losses),
+        }
+    )
+    return out.replace([np.inf, -np.inf], np.nan)
+
+
+def value_metrics(value, test_number):
+    """
+    ``quantstats`` table row of one test.
+
+    :param value: ``value`` table of the test, with ``Date`` and ``Value``.
+    :param test_number: Backtest test number.
+    :return DataFrame: One row with ``test_number`` and the metrics.
+    """
+    df = metrics(value["Value"].to_numpy(), pd.to_datetime(value["Date"]))
+    df.insert(0, "test_number", test_number)
+    return df
+
+
+def batch_metrics(value):
+    """
+    ``quantstats`` table rows of many tests in one pass. The equity curves are
+    aligned by date into a tests by dates array.
+
+    :param value: ``value`` table rows of the tests, with ``test_number``,
+        ``Date`` and ``Value``.
+    :return DataFrame: One row per test with ``test_number`` and the metrics.
+    """
+    tests, test_codes = np.unique(value["test_number"].to_numpy(), return_inverse=True)
+    dates, date_codes = np.unique(
+        pd.to_datetime(value["Date"]).to_numpy(), return_inverse=True
+    )
+    curves = np.full((len(tests), len(dates)), np.nan)
+    curves[test_codes, date_codes] = value["Value"].to_numpy(dtype=float)
+
+    df = metrics(curves, dates)
+    df.insert(0, "test_number", tests)
+    return df
+
+
+def compare_quantstats(value):
+    """
+    Metrics of one test next to the ``quantstats.stats`` functions they
+    follow, to check the two agree.
+
+    :param value: ``value`` table of the test, with ``Date`` and ``Value``.
+    :return DataFrame: ``native`` and ``quantstats`` columns by metric.
+    """
+    # Imported here, quantstats is slow to import and only used for checking.
+    import quantstats as qs
+
+    prices = value.set_index(pd.to_datetime(value["Date"]))["Value"].dropna()
+    returns = qs.utils.to_returns(prices).dropna()
+    native = metrics(prices.to_numpy(), prices.index).iloc[0]
+
+    rows = {}
+    for column, name in METRICS.items():
+        if name is None:
+            continue
+        func = getattr(qs.stats, name)
+        if name == "comp":
+            expected = func(returns)
+        elif name == "max_drawdown":
+            expected = func(prices)
+        elif name == "exposure":
+            expected = (returns != 0).sum() / len(returns)
+        else:
+            expected = func(returns)
+        rows[column] = [native[column], float(expected)]
+
+    return pd.DataFrame.from_dict(
+        rows, orient="index", columns=["native", "quantstats"]
+    ).replace([np.inf, -np.inf], np.nan)
@@ -13,994 +13,722 @@
 # along with this program.  If not, see... https://bit.ly/2Tlr9ii
 #
 ###############################################################################
+import time
+
 import pandas as pd
 from pathlib import Path
-import quantstats as qs
 import xlsxwriter
-import yfinance as yf
+
+from extension.analyzer import select_analyzers
+from extension.metrics import value_metrics
+from extension.spill import SpillReader
+from extension.tearsheet import save_series
+from extension.timing import Timer
 
 """
 Module for converting the standard indicator dictionaries exported in the strategy 
 object at the end of a Backtrader backtest. 
+
+Each analyzer has an exporter in ``EXPORTERS`` returning its tables, built column 
+by column and keyed by ``test_number``. The tables are built once and used for both 
+the database and the excel workbook.
 """
 
-def add_key_to_df(df, test_number):
-    """ Inserts the key columns at the beginning of the dataframe"""
-    df.insert(0, "test_number", test_number)
-    return df
+# Trade analysis columns. There are many single point metrics available, missing
+# ones are filled with 0 so every test has the same columns.
+TRADE_ANALYSIS_COLUMNS = [
+    "total_total",
+    "total_open",
+    "total_closed",
+    "streak_won_current",
+    "streak_won_longest",
+    "streak_lost_current",
+    "streak_lost_longest",
+    "pnl_gross_total",
+    "pnl_gross_average",
+    "pnl_net_total",
+    "pnl_net_average",
+    "won_total",
+    "won_pnl_total",
+    "won_pnl_average",
+    "won_pnl_max",
+    "lost_total",
+    "lost_pnl_total",
+    "lost_pnl_average",
+    "lost_pnl_max",
+    "long_total",
+    "long_pnl_total",
+    "long_pnl_average",
+    "long_pnl_won_total",
+    "long_pnl_won_average",
+    "long_pnl_won_max",
+    "long_pnl_lost_total",
+    "long_pnl_lost_average",
+    "long_pnl_lost_max",
+    "long_won",
+    "long_lost",
+    "short_total",
+    "short_pnl_total",
+    "short_pnl_average",
+    "short_pnl_won_total",
+    "short_pnl_won_average",
+    "short_pnl_won_max",
+    "short_pnl_lost_total",
+    "short_pnl_lost_average",
+    "short_pnl_lost_max",
+    "short_won",
+    "short_lost",
+    "len_total",
+    "len_average",
+    "len_max",
+    "len_min",
+    "len_won_total",
+    "len_won_average",
+    "len_won_max",
+    "len_won_min",
+    "len_lost_total",
+    "len_lost_average",
+    "len_lost_max",
+    "len_lost_min",
+    "len_long_total",
+    "len_long_average",
+    "len_long_max",
+    "len_long_min",
+    "len_long_won_total",
+    "len_long_won_average",
+    "len_long_won_max",
+    "len_long_won_min",
+    "len_long_lost_total",
+    "len_long_lost_average",
+    "len_long_lost_max",
+    "len_long_lost_min",
+    "len_short_total",
+    "len_short_average",
+    "len_short_max",
+    "len_short_min",
+    "len_short_won_total",
+    "len_short_won_average",
+    "len_short_won_max",
+    "len_short_won_min",
+    "len_short_lost_total",
+    "len_short_lost_average",
+    "len_short_lost_max",
+    "len_short_lost_min",
+]
+
+
+def unnest(d, flat, pk=""):
+    """
+    Recursive function that will create layered key names and attach the values.
+    Used to flatten the trade analysis and drawdown nested dictionaries.
+    """
+    for k, v in d.items():
+        if isinstance(v, dict):
+            unnest(v, flat, pk + "_" + k)
+        else:
+            flat[(pk + "_" + k)[1:]] = v
+
+    return flat
+
+
+def single_row(d, test_number):
+    """ One row table from a flat dictionary, keyed by ``test_number``. """
+    data = {"test_number": [test_number]}
+    data.update({k: [v] for k, v in d.items()})
+    return pd.DataFrame(data)
 
 
-def tradelist(
-    scene, analyzer, test_number, workbook=None, sheet_format=None, agg_dict=None
-):
+def tradelist(analyzer, test_number):
     """
     This analyzer prints a list of trades similar to amibroker, containing MFE and MAE
 
-    :param workbook: Excel workbook to be saved to disk.
     :param analyzer: Backtest analyzer.
-    :param sheet_format: Dictionary holding formatting information such as col width, font etc.
-    :param agg_dict: Collects the dictionary outputs from backtrader for using in platting.
-    :return workbook: Excel workbook to be saved to disk.
+    :param test_number: Backtest test number.
+    :return dict: ``trade_list`` table.
     """
-    trade_list = analyzer[0]
-    if scene["save_db"]:
-        df = pd.DataFrame(trade_list)
-        df.columns = [x.replace("%", "_pct") for x in df.columns]
-        df = add_key_to_df(df, test_number)
-        agg_dict["trade_list"] = df
-
-    if scene["save_excel"]:
-        worksheet = workbook.add_worksheet("trade_list")
-        columns = trade_list[0].keys()
-        columns = [x.capitalize() for x in columns]
-        worksheet.write_row(0, 0, columns)
-
-        worksheet.set_row(0, None, sheet_format["header_format"])
-
-        worksheet.set_column("D:D", sheet_format["x_wide"], None)
-        worksheet.set_column("E:E", sheet_format["narrow"], sheet_format["float_2d"])
-        worksheet.set_column("F:F", sheet_format["x_wide"], None)
-        worksheet.set_column("G:G", sheet_format["narrow"], sheet_format["float_2d"])
-        worksheet.set_column("H:H", sheet_format["narrow"], sheet_format["percent"])
-        worksheet.set_column("I:I", sheet_format["narrow"], sheet_format["int_0d"])
-        worksheet.set_column("J:J", sheet_format["narrow"], sheet_format["percent"])
-        worksheet.set_column("L:M", sheet_format["narrow"], sheet_format["int_0d"])
-        worksheet.set_column("O:O", sheet_format["narrow"], sheet_format["int_0d"])
-        worksheet.set_column("P:P", sheet_format["narrow"], sheet_format["percent"])
-        worksheet.set_column("Q:Q", sheet_format["narrow"], sheet_format["percent"])
-
-        for i, d in enumerate(trade_list):
-            d["datein"] = d["datein"].strftime("%Y-%m-%d %H:%M")
-            d["dateout"] = d["dateout"].strftime("%Y-%m-%d %H:%M")
+    trade_list = analyzer.get_analysis()
+    if not trade_list:
+        return {}
 
-            worksheet.write_row(i + 1, 0, d.values())
+    data = {"test_number": test_number}
+    for c in trade_list[0].keys():
+        data[c.replace("%", "_pct")] = [t[c] for t in trade_list]
 
-    return workbook, agg_dict
+    return {"trade_list": pd.DataFrame(data)}
 
 
-def tradeclosed(
-    scene, analyzer, test_number, workbook=None, sheet_format=None, agg_dict=None
-):
+def tradeclosed(analyzer, test_number):
     """
     Closed trades, pnl, commission, and duration.
-    :param workbook: Excel workbook to be saved to disk.
+
     :param analyzer: Backtest analyzer.
-    :param sheet_format: Dictionary holding formatting information such as col width, font etc.
-    :param agg_dict: Collects the dictionary outputs from backtrader for using in platting.
-    :return workbook: Excel workbook to be saved to disk.
+    :param test_number: Backtest test number.
+    :return dict: ``trade`` table.
     """
     trade_dict = analyzer.get_analysis()
+    if not trade_dict:
+        return {}
 
-    columns_df = [
-        "Date Closed",
-        "Ticker",
-        "PnL",
-        "PnL Comm",
-        "Commission",
-        "Days Open",
-    ]
-
-    if scene["save_db"]:
-        df = pd.DataFrame(trade_dict)
-        df = df.T
-        df.columns = columns_df
-        df = add_key_to_df(df, test_number)
-        agg_dict["trade"] = df
-
-    if scene["save_excel"]:
-        columns = [
-            "Date Closed",
-            "Time",
-            "Ticker",
-            "PnL",
-            "PnL Comm",
-            "Commission",
-            "Days Open",
-        ]
-
-        worksheet = workbook.add_worksheet("trade")
-
-        worksheet.write_row(0, 0, columns)
-
-        worksheet.set_row(0, None, sheet_format["header_format"])
+    columns = ["Date Closed", "Ticker", "PnL", "PnL Comm", "Commission", "Days Open"]
 
-        worksheet.set_column("A:A", sheet_format["wide"], None)
-        worksheet.set_column("B:B", sheet_format["medium"], None)
-        worksheet.set_column("D:E", sheet_format["narrow"], sheet_format["float_2d"])
-        worksheet.set_column("F:F", sheet_format["medium"], sheet_format["int_0d"])
-        worksheet.set_column("G:G", sheet_format["medium"], sheet_format["float_5d"])
+    data = {"test_number": test_number}
+    data.update(zip(columns, zip(*trade_dict.values())))
 
-        for i, value in enumerate(trade_dict.values()):
-            worksheet.write_row(i + 1, 0, [value[0].strftime("%Y-%m-%d")])
-            worksheet.write_row(i + 1, 1, [value[0].strftime("%H:%M")])
-            worksheet.write_row(i + 1, 2, value[1:])
+    return {"trade": pd.DataFrame(data)}
 
-    return workbook, agg_dict
 
-
-def transactions(
-    scene, analyzer, test_number, workbook=None, sheet_format=None, agg_dict=None
-):
+def transactions(analyzer, test_number):
     """
-    Returns the transactions dataframe.
-    :param workbook: Excel workbook to be saved to disk.
+    Returns the transactions table, one row for each transaction including
+    several transactions on the same bar.
+
     :param analyzer: Backtest analyzer.
-    :param sheet_format: Dictionary holding formatting information such as col width, font etc.
-    :param agg_dict: Collects the dictionary outputs from backtrader for using in platting.
-    :return workbook: Excel workbook to be saved to disk.
+    :param test_number: Backtest test number.
+    :return dict: ``transaction`` table.
     """
     trans_dict = analyzer.get_analysis()
-    columns_df = ["Date", "Units", "Price", "SID", "Ticker", "Value"]
+    if not trans_dict:
+        return {}
 
-    if scene["save_db"]:
-        li = []
-        for k, v in trans_dict.items():
-            rec = tuple([k, v[0][0], v[0][1], v[0][2], v[0][3], v[0][4]])
-            li.append(rec)
-        df = pd.DataFrame(li, columns=columns_df)
-        df = add_key_to_df(df, test_number)
-        agg_dict["transaction"] = df
+    columns = ["Date", "Units", "Price", "SID", "Ticker", "Value"]
 
-    if scene["save_excel"]:
-        columns = ["Date", "Units", "Price", "SID", "Ticker", "Value"]
-
-        worksheet = workbook.add_worksheet("transaction")
-        worksheet.write_row(0, 0, columns)
-
-        worksheet.set_row(0, None, sheet_format["header_format"])
-
-        worksheet.set_column("A:A", sheet_format["x_wide"], None)
-        worksheet.set_column("C:C", sheet_format["medium"], sheet_format["float_2d"])
-        worksheet.set_column("E:F", sheet_format["medium"], sheet_format["float_2d"])
-
-        dates = []
-        trans = []
-        for d, v in trans_dict.items():
-            for t in v:
-                dates.append(d)
-                trans.append(t)
-
-        for n in range(len(dates)):
-            date = [dates[n].strftime("%y-%m-%d %H:%M")]
+    rows = [[d] + list(t) for d, trans in trans_dict.items() for t in trans]
 
-            worksheet.write_row(n + 1, 0, date)
-            worksheet.write_row(n + 1, 1, trans[n])
+    data = {"test_number": test_number}
+    data.update(zip(columns, zip(*rows)))
 
-    return workbook, agg_dict
+    return {"transaction": pd.DataFrame(data)}
 
 
-def unnest_trade_analysis(d, trade_analysis_dict, pk=""):
+def tradeanalyzer(analyzer, test_number):
     """
-    Recursive function that will create layered key names and attach the values.
-    Used by the trade_analysis function.
-    """
-    for k, v in d.items():
-        if isinstance(v, dict):
-            unnest_trade_analysis(v, trade_analysis_dict, pk + "_" + k)
-        else:
-            trade_analysis_dict[(pk + "_" + k)[1:]] = v
-
+    This is the trades analysis nested dictionary, converting to single row for
+    insertion into table. See ``TRADE_ANALYSIS_COLUMNS`` for the columns.
 
-def tradeanalyzer(
-    scene, analyzer, test_number, workbook=None, sheet_format=None, agg_dict=None
-):
-    """
-    This is the trades analysis nested dictionary, converting to single row for insertion into table.
-    :param workbook: Excel workbook to be saved to disk.
     :param analyzer: Backtest analyzer.
-    :param sheet_format: Dictionary holding formatting information such as col width, font etc.
-    :param agg_dict: Collects the dictionary outputs from backtrader for using in platting.
-    :return workbook: Excel workbook to be saved to disk.
-    Return columns: There are many single point metrics available. Please refer to the following for reference.
-
-    [
-    'key',
-    'total_total', 'total_open', 'total_closed',
-
-    'streak_won_current', 'streak_won_longest', 'streak_lost_current', 'streak_lost_longest',
-
-    'pnl_gross_total', 'pnl_gross_average', 'pnl_net_total', 'pnl_net_average',
-
-    'won_total', 'won_pnl_total', 'won_pnl_average', 'won_pnl_max',
-
-    'lost_total', 'lost_pnl_total', 'lost_pnl_average', 'lost_pnl_max',
-
-    'long_total',
-    'long_pnl_total', 'long_pnl_average',
-    'long_pnl_won_total', 'long_pnl_won_average', 'long_pnl_won_max',
-    'long_pnl_lost_total', 'long_pnl_lost_average', 'long_pnl_lost_max',
-    'long_won', 'long_lost',
-
-    'short_total',
-    'short_pnl_total', 'short_pnl_average',
-    'short_pnl_won_total', 'short_pnl_won_average', 'short_pnl_won_max',
-    'short_pnl_lost_total', 'short_pnl_lost_average', 'short_pnl_lost_max',
-    'short_won', 'short_lost',
-
-    'len_total', 'len_average', 'len_max', 'len_min',
-    'len_won_total', 'len_won_average', 'len_won_max', 'len_won_min',
-    'len_lost_total', 'len_lost_average', 'len_lost_max', 'len_lost_min',
-    'len_long_total', 'len_long_average', 'len_long_max', 'len_long_min',
-    'len_long_won_total', 'len_long_won_average', 'len_long_won_max', 'len_long_won_min',
-    'len_long_lost_total', 'len_long_lost_average', 'len_long_lost_max', 'len_long_lost_min',
-    'len_short_total', 'len_short_average', 'len_short_max', 'len_short_min',
-    'len_short_won_total', 'len_short_won_average', 'len_short_won_max', 'len_short_won_min',
-    'len_short_lost_total', 'len_short_lost_average', 'len_short_lost_max', 'len_short_lost_min'
-    ]
+    :param test_number: Backtest test number.
+    :return dict: ``trade_analysis`` table.
     """
+    trade_analysis_dict = unnest(analyzer.get_analysis(), {})
+    for c in TRADE_ANALYSIS_COLUMNS:
+        trade_analysis_dict.setdefault(c, 0)
 
-    trades = analyzer.get_analysis()
-
-    # Create empty dictionary for final keys:values, this will pass through recursive function unest_trade_analysis
-    trade_analysis_dict = {}
-    unnest_trade_analysis(trades, trade_analysis_dict, pk="")
-
-    ta_cols = [
-        "total_total",
-        "total_open",
-        "total_closed",
-        "streak_won_current",
-        "streak_won_longest",
-        "streak_lost_current",
-        "streak_lost_longest",
-        "pnl_gross_total",
-        "pnl_gross_average",
-        "pnl_net_total",
-        "pnl_net_average",
-        "won_total",
-        "won_pnl_total",
-        "won_pnl_average",
-        "won_pnl_max",
-        "lost_total",
-        "lost_pnl_total",
-        "lost_pnl_average",
-        "lost_pnl_max",
-        "long_total",
-        "long_pnl_total",
-        "long_pnl_average",
-        "long_pnl_won_total",
-        "long_pnl_won_average",
-        "long_pnl_won_max",
-        "long_pnl_lost_total",
-        "long_pnl_lost_average",
-        "long_pnl_lost_max",
-        "long_won",
-        "long_lost",
-        "short_total",
-        "short_pnl_total",
-        "short_pnl_average",
-        "short_pnl_won_total",
-        "short_pnl_won_average",
-        "short_pnl_won_max",
-        "short_pnl_lost_total",
-        "short_pnl_lost_average",
-        "short_pnl_lost_max",
-        "short_won",
-        "short_lost",
-        "len_total",
-        "len_average",
-        "len_max",
-        "len_min",
-        "len_won_total",
-        "len_won_average",
-        "len_won_max",
-        "len_won_min",
-        "len_lost_total",
-        "len_lost_average",
-        "len_lost_max",
-        "len_lost_min",
-        "len_long_total",
-        "len_long_average",
-        "len_long_max",
-        "len_long_min",
-        "len_long_won_total",
-        "len_long_won_average",
-        "len_long_won_max",
-        "len_long_won_min",
-        "len_long_lost_total",
-        "len_long_lost_average",
-        "len_long_lost_max",
-        "len_long_lost_min",
-        "len_short_total",
-        "len_short_average",
-        "len_short_max",
-        "len_short_min",
-        "len_short_won_total",
-        "len_short_won_average",
-        "len_short_won_max",
-        "len_short_won_min",
-        "len_short_lost_total",
-        "len_short_lost_average",
-        "len_short_lost_max",
-        "len_short_lost_min",
-    ]
-
-    columns = [
-        "Item",
-        "Value",
-    ]
-
-    if scene["save_db"]:
-        df = pd.DataFrame(
-            trade_analysis_dict.values(), index=trade_analysis_dict.keys()
-        )
-        df = df.T
-        df = add_key_to_df(df, test_number)
-        fill_cols = [c for c in ta_cols if c not in df.columns]
-        for c in fill_cols:
-            df[c] = 0
-        agg_dict["trade_analysis"] = df
-
-    if scene["save_excel"]:
-        worksheet = workbook.add_worksheet("trade_analysis")
-
-        worksheet.write_row(0, 0, columns)
+    return {"trade_analysis": single_row(trade_analysis_dict, test_number)}
 
-        worksheet.set_row(0, None, sheet_format["header_format"])
 
-        worksheet.set_column("A:B", sheet_format["x_wide"], sheet_format["align_left"])
-
-        for i, (k, v) in enumerate(trade_analysis_dict.items()):
-            worksheet.write_row(i + 1, 0, [k])
-            worksheet.write_row(i + 1, 1, [v])
+def vwr(analyzer, test_number):
+    """
+    Variability Weighted Return (VWR).
 
-    return workbook, agg_dict
+    :param analyzer: Backtest analyzer.
+    :param test_number: Backtest test number.
+    :return dict: ``vwr`` table.
+    """
+    return {"vwr": single_row(analyzer.get_analysis(), test_number)}
 
 
-def vwr(scene, analyzer, test_number, workbook=None, sheet_format=None, agg_dict=None):
+def drawdown(analyzer, test_number):
     """
-    Calculates Variability Weighted Return (VWR).
-    :param workbook: Excel workbook to be saved to disk.
+    Drawdown information.
+
     :param analyzer: Backtest analyzer.
-    :param sheet_format: Dictionary holding formatting information such as col width, font etc.
-    :param agg_dict: Collects the dictionary outputs from backtrader for using in platting.
-    :return workbook: Excel workbook to be saved to disk.
+    :param test_number: Backtest test number.
+    :return dict: ``drawdown`` table.
     """
-    # Get the drawdowns auto ordered nested dictionary
-    vwr_dict = analyzer.get_analysis()
-
-    columns = [
-        "vwr",
-    ]
+    drawdown_dict = unnest(analyzer.get_analysis(), {})
 
-    if scene["save_db"]:
-        df = pd.DataFrame(vwr_dict.values(), index=vwr_dict.keys()).T
-        df = add_key_to_df(df, test_number)
-        agg_dict["vwr"] = df
+    return {"drawdown": single_row(drawdown_dict, test_number)}
 
-    if scene["save_excel"]:
 
-        worksheet = workbook.add_worksheet("vwr")
+def cashmarket(analyzer, test_number):
+    """
+    Portfolio cash and total values.
 
-        worksheet.write_row(0, 0, columns)
+    :param analyzer: Backtest analyzer.
+    :param test_number: Backtest test number.
+    :return dict: ``value`` table.
+    """
+    value = analyzer.get_analysis()
+    if isinstance(value, SpillReader):
+        return {"value": value.keyed(test_number)}
+    if not value:
+        return {}
+
+    cash, market = zip(*value.values())
+
+    return {
+        "value": pd.DataFrame(
+            {
+                "test_number": test_number,
+                "Date": list(value.keys()),
+                "Cash": cash,
+                "Value": market,
+            }
+        )
+    }
 
-        worksheet.set_row(0, None, sheet_format["header_format"])
 
-        worksheet.set_column("A:A", sheet_format["x_wide"], sheet_format["align_left"])
-        worksheet.set_column("B:B", sheet_format["medium"], sheet_format["align_left"])
+def candles(candle_dict, test_number):
+    """ OHLCV table from a dictionary of datetime keys and OHLCV lists. """
+    columns = ["Open", "High", "Low", "Close", "Volume"]
 
-        for i, (k, v) in enumerate(vwr_dict.items()):
-            worksheet.write_row(i + 1, 0, [k])
-            worksheet.write_row(i + 1, 1, [v])
+    data = {"test_number": test_number, "Date": list(candle_dict.keys())}
+    data.update(zip(columns, zip(*candle_dict.values())))
 
-    return workbook, agg_dict
+    return pd.DataFrame(data)
 
 
-def drawdown_analysis(d, drawdown_analysis_dict, pk=""):
+def ohlcv(analyzer, test_number):
     """
-    Recursive function that will create layered key names and attach the values.
-    """
-    for k, v in d.items():
-        if isinstance(v, dict):
-            drawdown_analysis(v, drawdown_analysis_dict, pk + "_" + k)
-        else:
-            drawdown_analysis_dict[(pk + "_" + k)[1:]] = v
-
-    return drawdown_analysis_dict
-
+    OHLCV
 
-def drawdown(
-    scene, analyzer, test_number, workbook=None, sheet_format=None, agg_dict=None
-):
-    """
-    Calculates drawdown information.
-    :param workbook: Excel workbook to be saved to disk.
     :param analyzer: Backtest analyzer.
-    :param sheet_format: Dictionary holding formatting information such as col width, font etc.
-    :param agg_dict: Collects the dictionary outputs from backtrader for using in platting.
-    :return workbook: Excel workbook to be saved to disk.
+    :param test_number: Backtest test number.
+    :return dict: ``ohlcv`` table.
     """
-    # Get the drawdowns auto ordered nested dictionary
-    drawdown = analyzer.get_analysis()
+    ohlcv = analyzer.get_analysis()
+    if isinstance(ohlcv, SpillReader):
+        return {"ohlcv": ohlcv.keyed(test_number)}
+    if not ohlcv:
+        return {}
 
-    # Create empty dictionary for final keys:values
-    drawdown_analysis_dict = {}
-    drawdown_analysis_dict = drawdown_analysis(drawdown, drawdown_analysis_dict, pk="")
+    return {"ohlcv": candles(ohlcv, test_number)}
 
-    columns = [
-        "Item",
-        "Value",
-    ]
-
-    if scene["save_db"]:
-        df = pd.DataFrame(
-            drawdown_analysis_dict.values(), index=drawdown_analysis_dict.keys()
-        ).T
-        df = add_key_to_df(df, test_number)
-        agg_dict["drawdown"] = df
 
-    if scene["save_excel"]:
+def benchmark(analyzer, test_number):
+    """
+    Benchmark Candles
 
-        worksheet = workbook.add_worksheet("drawdown")
+    :param analyzer: Backtest analyzer.
+    :param test_number: Backtest test number.
+    :return dict: ``benchmark`` table.
+    """
+    benchmark = analyzer.get_analysis()
+    if not benchmark:
+        return {}
 
-        worksheet.write_row(0, 0, columns)
+    return {"benchmark": candles(benchmark, test_number)}
 
-        worksheet.set_row(0, None, sheet_format["header_format"])
 
-        worksheet.set_column("A:A", sheet_format["x_wide"], sheet_format["align_left"])
-        worksheet.set_column("B:B", sheet_format["medium"], sheet_format["align_left"])
+def records(record_dict, test_number, key_name, keys):
+    """
+    Table from a dictionary of row dictionaries, with ``keys`` in the
+    ``key_name`` column. Missing values are None.
+    """
+    columns = dict.fromkeys(c for row in record_dict.values() for c in row)
 
-        for i, (k, v) in enumerate(drawdown_analysis_dict.items()):
-            worksheet.write_row(i + 1, 0, [k])
-            worksheet.write_row(i + 1, 1, [v])
+    data = {"test_number": test_number, key_name: keys}
+    for c in columns:
+        data[c] = [row.get(c) for row in record_dict.values()]
 
-    return workbook, agg_dict
+    return pd.DataFrame(data)
 
 
-def cashmarket(
-    scene, analyzer, test_number, workbook=None, sheet_format=None, agg_dict=None
-):
+def globaloutput(analyzer, test_number):
     """
-    Portfolio cash and total values.
+    Global output details captured.
 
-    :param workbook: Excel workbook to be saved to disk.
     :param analyzer: Backtest analyzer.
-    :param sheet_format: Dictionary holding formatting information such as col width, font etc.
-    :param agg_dict: Collects the dictionary outputs from backtrader for using in platting.
-    :return workbook: Excel workbook to be saved to disk.
+    :param test_number: Backtest test number.
+    :return dict: ``global_out`` table.
     """
-    # Get the stats auto ordered nested dictionary
-    value = analyzer.get_analysis()
-
-    columns = [
-        "Date",
-        "Cash",
-        "Value",
-    ]
-
-    if scene["save_db"]:
-        df = pd.DataFrame(value)
-        df = df.T
-        df = df.reset_index()
-        df.columns = columns
-        df = add_key_to_df(df, test_number)
-        agg_dict["value"] = df
-
-    if scene["save_excel"]:
-
-        worksheet = workbook.add_worksheet("value")
+    global_out = analyzer.get_analysis()
+    if isinstance(global_out, SpillReader):
+        return {"global_out": global_out.keyed(test_number)}
+    if not global_out:
+        return {}
+
+    return {
+        "global_out": records(
+            global_out, test_number, "Datetime", list(global_out.keys())
+        )
+    }
 
-        worksheet.write_row(0, 0, columns)
 
-        worksheet.set_row(0, None, sheet_format["header_format"])
+def orderhistory(analyzer, test_number):
+    """
+    Order history details captured.
 
-        worksheet.set_column("A:C", sheet_format["wide"], sheet_format["float_2d"])
+    :param analyzer: Backtest analyzer.
+    :param test_number: Backtest test number.
+    :return dict: ``order_history`` table.
+    """
+    order_history = analyzer.get_analysis()
+    if isinstance(order_history, SpillReader):
+        return {"order_history": order_history.keyed(test_number)}
+    if not order_history:
+        return {}
+
+    return {
+        "order_history": records(
+            order_history,
+            test_number,
+            "Datetime",
+            [dt for dt, _ in order_history.keys()],
+        )
+    }
 
-        for i, (k, v) in enumerate(value.items()):
-            date = k.strftime("%y-%m-%d %H:%M")
-            worksheet.write_row(i + 1, 0, [date])
-            worksheet.write_row(i + 1, 1, v)
 
-    return workbook, agg_dict
+# Registry of the exporters, keyed by the analyzer names of the ``ANALYZERS``
+# registry in ``extension.analyzer``. Exporters take the analyzer and the test
+# number and return a dictionary of table name to dataframe (or ``SpillReader``
+# for spilled analyzers). Tables are those declared in ``ANALYZERS``.
+EXPORTERS = dict(
+    trades=tradeanalyzer,
+    drawdown=drawdown,
+    cash_market=cashmarket,
+    VWR=vwr,
+    transactions=transactions,
+    trade_list=tradelist,
+    trade_closed=tradeclosed,
+    OHLCV=ohlcv,
+    benchmark=benchmark,
+    global_signal=globaloutput,
+    order_history=orderhistory,
+)
 
 
-def positionvalue(
-    scene, analyzer, test_number, workbook=None, sheet_format=None, agg_dict=None
-):
+def dimension(scene, test_number):
     """
-    Tracks all positions over time.
-
-    :param workbook: Excel workbook to be saved to disk.
-    :param analyzer: Backtest analyzer.
-    :param sheet_format: Dictionary holding formatting information such as col width, font etc.
-    :param agg_dict: Collects the dictionary outputs from backtrader for using in platting.
-    :return workbook: Excel workbook to be saved to disk.
-    """
-    # Get the stats auto ordered nested dictionary
-    position = analyzer.get_analysis()
-
-    if scene["save_db"]:
-        df = pd.DataFrame(list(position.values())[1:], index=list(position.keys())[1:])
-        df = df.reset_index()
-        li = position["Datetime"]
-        li.insert(0, "Datetime")
-        df.columns = li
-        df = add_key_to_df(df, test_number)
-        agg_dict["positions"] = df
-
-    if scene["save_excel"]:
-        worksheet = workbook.add_worksheet("positions")
+    Input parameters, the ``dimension`` columns only.
 
-        columns_date = ["Date"]
-        columns_row = position["Datetime"]
+    :param scene: Dictionary with backtest parameters.
+    :param test_number: Backtest test number.
+    :return dataframe: ``dimension`` table.
+    """
+    dimension_dict = {c: scene_value(scene[c]) for c in scene["db_cols"]}
+    dimension_dict["test_number"] = test_number
 
-        worksheet.write_row(0, 0, columns_date)
-        worksheet.write_row(0, 1, columns_row)
+    return pd.DataFrame({k: [v] for k, v in dimension_dict.items()})
 
-        worksheet.set_row(0, None, sheet_format["header_format"])
 
-        worksheet.set_column("A:A", sheet_format["wide"], None)
-        worksheet.set_column("B:B", sheet_format["wide"], sheet_format["float_2d"])
-        worksheet.set_column("C:ZZ", sheet_format["medium"], sheet_format["float_2d"])
+def scene_value(v):
+    """ Converts tuples and lists in the scene to strings. """
+    if isinstance(v, tuple):
+        return ", ".join(["(" + x[0] + ", " + str(x[1]) + ")" for x in v])
+    if isinstance(v, list):
+        return ", ".join([str(x) for x in v])
+    return v
 
-        for i, (k, v) in enumerate(position.items()):
-            if i == 0:
-                continue
 
-            date = k.strftime("%Y-%m-%d %H:%M")
-            worksheet.write_row(i, 0, [date])
-            worksheet.write_row(i, 1, v)
+def quantstats(value, test_number):
+    """
+    Performance metrics from the portfolio values, computed by
+    ``extension.metrics`` following the quantstats definitions.
 
-    return workbook, agg_dict
+    :param value: ``value`` table, dataframe or ``SpillReader``.
+    :param test_number: Backtest test number.
+    :return dataframe: ``quantstats`` table.
+    """
+    if isinstance(value, SpillReader):
+        value = value.read(columns=["Date", "Value"])
+    return value_metrics(value, test_number)
 
 
-def ohlcv(
-    scene, analyzer, test_number, workbook=None, sheet_format=None, agg_dict=None
-):
+def write_rows(worksheet, df, date_format=None, dates=(), start_row=1):
     """
-    OHLCV
-
-    :param workbook: Excel workbook to be saved to disk.
-    :param analyzer: Backtest analyzer.
-    :param sheet_format: Dictionary holding formatting information such as col width, font etc.
-    :param agg_dict: Collects the dictionary outputs from backtrader for using in platting.
-    :return workbook: Excel workbook to be saved to disk.
+    Writes the dataframe rows to the worksheet, without ``test_number``.
+    ``dates`` columns are written as strings using ``date_format``.
     """
-    # Get the stats auto ordered nested dictionary
-    ohlcv = analyzer.get_analysis()
+    df = df.drop(columns="test_number")
+    for c in dates:
+        df[c] = pd.to_datetime(df[c]).dt.strftime(date_format)
 
-    columns = ["Date", "Open", "High", "Low", "Close", "Volume"]
+    for i, values in enumerate(df.itertuples(index=False), start=start_row):
+        worksheet.write_row(i, 0, values)
 
-    if scene["save_db"]:
-        df = pd.DataFrame(ohlcv)
-        df = df.T
-        df = df.reset_index()
-        df.columns = columns
-        df = add_key_to_df(df, test_number)
-        agg_dict["ohlcv"] = df
 
-    if scene["save_excel"]:
+def write_items(worksheet, df, sheet_format):
+    """ Writes a single row table as ``Item`` and ``Value`` rows. """
+    worksheet.write_row(0, 0, ["Item", "Value"])
+    worksheet.set_row(0, None, sheet_format["header_format"])
 
-        worksheet = workbook.add_worksheet("ohlcv")
+    items = df.drop(columns="test_number").iloc[0]
+    for i, (k, v) in enumerate(items.items()):
+        worksheet.write_row(i + 1, 0, [k, v])
 
-        worksheet.write_row(0, 0, columns)
 
-        worksheet.set_row(0, None, sheet_format["header_format"])
+def sheet_trade_list(worksheet, df, sheet_format):
+    columns = [x.replace("_pct", "%").capitalize() for x in df.columns[1:]]
+    worksheet.write_row(0, 0, columns)
 
-        worksheet.set_column("A:A", sheet_format["wide"], None)
-        worksheet.set_column("B:E", sheet_format["narrow"], sheet_format["float_2d"])
-        worksheet.set_column("F:F", sheet_format["medium"], sheet_format["int_0d"])
+    worksheet.set_row(0, None, sheet_format["header_format"])
 
-        for i, (k, v) in enumerate(ohlcv.items()):
-            if i == 0:
-                continue
+    worksheet.set_column("D:D", sheet_format["x_wide"], None)
+    worksheet.set_column("E:E", sheet_format["narrow"], sheet_format["float_2d"])
+    worksheet.set_column("F:F", sheet_format["x_wide"], None)
+    worksheet.set_column("G:G", sheet_format["narrow"], sheet_format["float_2d"])
+    worksheet.set_column("H:H", sheet_format["narrow"], sheet_format["percent"])
+    worksheet.set_column("I:I", sheet_format["narrow"], sheet_format["int_0d"])
+    worksheet.set_column("J:J", sheet_format["narrow"], sheet_format["percent"])
+    worksheet.set_column("L:M", sheet_format["narrow"], sheet_format["int_0d"])
+    worksheet.set_column("O:O", sheet_format["narrow"], sheet_format["int_0d"])
+    worksheet.set_column("P:P", sheet_format["narrow"], sheet_format["percent"])
+    worksheet.set_column("Q:Q", sheet_format["narrow"], sheet_format["percent"])
 
-            date = k.strftime("%Y-%m-%d %H:%M")
-            worksheet.write_row(i, 0, [date])
-            worksheet.write_row(i, 1, v)
+    write_rows(worksheet, df, "%Y-%m-%d %H:%M", ["datein", "dateout"])
 
-    return workbook, agg_dict
 
-def benchmark(
-    scene, analyzer, test_number, workbook=None, sheet_format=None, agg_dict=None
-):
-    """
-    Benchmark Candles
+def sheet_trade(worksheet, df, sheet_format):
+    columns = [
+        "Date Closed",
+        "Time",
+        "Ticker",
+        "PnL",
+        "PnL Comm",
+        "Commission",
+        "Days Open",
+    ]
 
-    :param workbook: Excel workbook to be saved to disk.
-    :param analyzer: Backtest analyzer.
-    :param sheet_format: Dictionary holding formatting information such as col width, font etc.
-    :param agg_dict: Collects the dictionary outputs from backtrader for using in platting.
-    :return workbook: Excel workbook to be saved to disk.
-    """
-    # Get the stats auto ordered nested dictionary
-    benchmark = analyzer.get_analysis()
+    worksheet.write_row(0, 0, columns)
 
-    columns = ["Date", "Open", "High", "Low", "Close", "Volume"]
+    worksheet.set_row(0, None, sheet_format["header_format"])
 
-    if scene["save_db"]:
-        df = pd.DataFrame(benchmark)
-        df = df.T
-        df = df.reset_index()
-        df.columns = columns
-        df = add_key_to_df(df, test_number)
-        agg_dict["benchmark"] = df
+    worksheet.set_column("A:A", sheet_format["wide"], None)
+    worksheet.set_column("B:B", sheet_format["medium"], None)
+    worksheet.set_column("D:E", sheet_format["narrow"], sheet_format["float_2d"])
+    worksheet.set_column("F:F", sheet_format["medium"], sheet_format["int_0d"])
+    worksheet.set_column("G:G", sheet_format["medium"], sheet_format["float_5d"])
 
-    if scene["save_excel"]:
+    df = df.copy()
+    df.insert(2, "Time", pd.to_datetime(df["Date Closed"]).dt.strftime("%H:%M"))
+    write_rows(worksheet, df, "%Y-%m-%d", ["Date Closed"])
 
-        worksheet = workbook.add_worksheet("benchmark")
 
-        worksheet.write_row(0, 0, columns)
+def sheet_transaction(worksheet, df, sheet_format):
+    worksheet.write_row(0, 0, list(df.columns[1:]))
 
-        worksheet.set_row(0, None, sheet_format["header_format"])
+    worksheet.set_row(0, None, sheet_format["header_format"])
 
-        worksheet.set_column("A:A", sheet_format["wide"], None)
-        worksheet.set_column("B:E", sheet_format["narrow"], sheet_format["float_2d"])
-        worksheet.set_column("F:F", sheet_format["medium"], sheet_format["int_0d"])
+    worksheet.set_column("A:A", sheet_format["x_wide"], None)
+    worksheet.set_column("C:C", sheet_format["medium"], sheet_format["float_2d"])
+    worksheet.set_column("E:F", sheet_format["medium"], sheet_format["float_2d"])
 
-        for i, (k, v) in enumerate(benchmark.items()):
-            if i == 0:
-                continue
+    write_rows(worksheet, df, "%y-%m-%d %H:%M", ["Date"])
 
-            date = k.strftime("%Y-%m-%d %H:%M")
-            worksheet.write_row(i, 0, [date])
-            worksheet.write_row(i, 1, v)
 
-    return workbook, agg_dict
+def sheet_trade_analysis(worksheet, df, sheet_format):
+    worksheet.set_column("A:B", sheet_format["x_wide"], sheet_format["align_left"])
 
-def globaloutput(
-    scene, analyzer, test_number, workbook=None, sheet_format=None, agg_dict=None
-):
-    """
-    Global output details captured.
-y
-    :param workbook: Excel workbook to be saved to disk.
-    :param analyzer: Backtest analyzer.
-    :param sheet_format: Dictionary holding formatting information such as col width, font etc.
-    :param agg_dict: Collects the dictionary outputs from backtrader for using in platting.
-    :return workbook: Excel workbook to be saved to disk.
-    """
+    write_items(worksheet, df, sheet_format)
 
-    global_out = analyzer.get_analysis()
-    # columns_keys = ["datetime", "ma"]
-    # columns_values = [k for k in global_out[next(iter(global_out))].keys()]
 
-    if scene["save_db"]:
-        df = pd.DataFrame(global_out).T
-        if df.size == 0:
-            pass
-        df.index = df.index.set_names(["Datetime"])
-        df = df.reset_index()
-        df = add_key_to_df(df, test_number)
-        agg_dict["global_out"] = df
+def sheet_drawdown(worksheet, df, sheet_format):
+    worksheet.set_column("A:A", sheet_format["x_wide"], sheet_format["align_left"])
+    worksheet.set_column("B:B", sheet_format["medium"], sheet_format["align_left"])
 
-    return workbook, agg_dict
+    write_items(worksheet, df, sheet_format)
 
 
-def orderhistory(
-    scene, analyzer, test_number, workbook=None, sheet_format=None, agg_dict=None
-):
-    """
-    Order history details captured.
+def sheet_value(worksheet, df, sheet_format):
+    worksheet.write_row(0, 0, list(df.columns[1:]))
 
-    :param workbook: Excel workbook to be saved to disk.
-    :param analyzer: Backtest analyzer.
-    :param sheet_format: Dictionary holding formatting information such as col width, font etc.
-    :param agg_dict: Collects the dictionary outputs from backtrader for using in platting.
-    :return workbook: Excel workbook to be saved to disk.
-    """
+    worksheet.set_row(0, None, sheet_format["header_format"])
 
-    order_history = analyzer.get_analysis()
-    # columns_keys = ["datetime", "ma"]
-    # columns_values = [k for k in global_out[next(iter(global_out))].keys()]
+    worksheet.set_column("A:C", sheet_format["wide"], sheet_format["float_2d"])
 
-    if scene["save_db"]:
-        df = pd.DataFrame(order_history).T
-        if df.size == 0:
-            pass
-        df.index = df.index.droplevel(1)
-        df.index.name = "Datetime"
-        df = df.reset_index()
-        df = add_key_to_df(df, test_number)
-        agg_dict["order_history"] = df
+    write_rows(worksheet, df, "%y-%m-%d %H:%M", ["Date"])
 
-    return workbook, agg_dict
 
+def sheet_candles(worksheet, df, sheet_format):
+    worksheet.write_row(0, 0, list(df.columns[1:]))
 
-def dimension(
-    scene, results, test_number, workbook=None, sheet_format=None, agg_dict=None
-):
-    """
-    Input parameters.
+    worksheet.set_row(0, None, sheet_format["header_format"])
 
-    :param workbook: Excel workbook to be saved to disk.
-    :param analyzer: Backtest analyzer.
-    :param sheet_format: Dictionary holding formatting information such as col width, font etc.
-    :param agg_dict: Collects the dictionary outputs from backtrader for using in platting.
-    :return workbook: Excel workbook to be saved to disk.
-    """
-    # Convert tuples to string in scene.
-    # Convert tuples to strings.
-    for t in [k for k, v in scene.items() if isinstance(v, tuple)]:
-        scene[t] = ", ".join(["(" + x[0] + ", " + str(x[1]) + ")" for x in scene[t]])
+    worksheet.set_column("A:A", sheet_format["wide"], None)
+    worksheet.set_column("B:E", sheet_format["narrow"], sheet_format["float_2d"])
+    worksheet.set_column("F:F", sheet_format["medium"], sheet_format["int_0d"])
 
-    # Create the dimension dataframe.
-    dimension_dict = {}
-    db_cols = scene.pop("db_cols")
-    dimension_dict.update(scene)
+    write_rows(worksheet, df, "%Y-%m-%d %H:%M", ["Date"])
 
-    columns = [
-        "Item",
-        "Value",
-    ]
 
-    if scene["save_db"]:
-        df = pd.DataFrame(dimension_dict.values(), index=dimension_dict.keys())
-        df = df.T
-        df = df.loc[:, db_cols]
-        agg_dict["dimension"] = df
+# Excel worksheet layouts by table name. Tables without a layout, eg:
+# ``global_out``, are only saved to the database.
+EXCEL_SHEETS = dict(
+    trade_list=sheet_trade_list,
+    trade=sheet_trade,
+    transaction=sheet_transaction,
+    trade_analysis=sheet_trade_analysis,
+    vwr=sheet_drawdown,
+    drawdown=sheet_drawdown,
+    value=sheet_value,
+    ohlcv=sheet_candles,
+    benchmark=sheet_candles,
+)
 
-    if scene["save_excel"]:
-        worksheet = workbook.add_worksheet("dimension")
 
-        worksheet.write_row(0, 0, columns)
+def sheet_dimension(worksheet, scene, test_number, sheet_format):
+    """ All of the input parameters, not only the ``dimension`` columns. """
+    worksheet.write_row(0, 0, ["Item", "Value"])
 
-        worksheet.write_row(1, 0, ["test number", test_number])
+    worksheet.write_row(1, 0, ["test number", test_number])
 
-        worksheet.set_row(0, None, sheet_format["header_format"])
+    worksheet.set_row(0, None, sheet_format["header_format"])
 
-        worksheet.set_column("A:B", sheet_format["x_wide"], sheet_format["align_left"])
+    worksheet.set_column("A:B", sheet_format["x_wide"], sheet_format["align_left"])
 
-        for i, (k, v) in enumerate(dimension_dict.items()):
-            if k == "excluded_dates":
-                continue
+    for i, (k, v) in enumerate(scene.items()):
+        if k in ["excluded_dates", "db_cols"]:
+            continue
 
-            worksheet.write_row(i + 2, 0, [k])
-            worksheet.write_row(i + 2, 1, [v])
+        worksheet.write_row(i + 2, 0, [k, scene_value(v)])
 
-    return workbook, agg_dict
 
-def quantstats(scene, test_number, agg_dict):
+def save_excel(scene, test_number, agg_dict):
     """
-    Input parameters.
+    Saves the tables to an excel workbook, one worksheet per table.
 
     :param scene: Dictionary with backtest parameters.
     :param test_number: Backtest test number.
-    :param agg_dict: Collects the dictionary outputs from backtrader for using in platting.
-    :return agg_dict: Updated agg_dict including dataframe quantstants for the backtest.
-    """
-    df = agg_dict["value"].copy()
-    df = df.set_index("Date")["Value"]
-    df.index = pd.to_datetime(df.index)
-
-    df = qs.utils.to_returns(df)
-    df_qs = qs.reports.metrics(df, display=False, mode="full")
-    df_qs.columns = [test_number]
-    df_qs = df_qs.T
-    df_qs.index.name = "test_number"
-    df_qs.columns = df_qs.columns.str.replace("%", "-pct")
-    df_qs.columns = df_qs.columns.str.replace("(", "")
-    df_qs.columns = df_qs.columns.str.replace(")", "")
-    df_qs = df_qs.fillna(0)
-    agg_dict["quantstats"] = df_qs.reset_index()
-    return agg_dict
-
-
-
-
-def tearsheet(scene, results):
-    """
-    Just for tearsheet.
-
-    :param workbook: Excel workbook to be saved to disk.
-    :return None: .
-    """
-    # Get the stats auto ordered nested dictionary
-    value = results[0].analyzers.getbyname("cash_market").get_analysis()
-
-    columns = [
-        "Date",
-        "Cash",
-        "Value",
-    ]
-
-    if scene["save_tearsheet"]:
-        # Save tearsheet
-        df = pd.DataFrame(value)
-        df = df.T
-        df = df.reset_index()
-        df.columns = columns
-
-        df_value = df.set_index("Date")["Value"]
-        df_value.index = pd.to_datetime(df_value.index)
-        df_value = df_value.sort_index()
-        value_returns = qs.utils.to_returns(df_value)
-        value_returns = pd.DataFrame(value_returns)
-
-        value_returns["diff"] = value_returns["Value"].diff().dropna()
-        value_returns["diff"] = value_returns["diff"].abs().cumsum()
-        value_returns = value_returns.loc[value_returns["diff"] > 0, "Value"]
-        value_returns.index = pd.to_datetime(value_returns.index.date)
-
-        # Get the benchmark
-        benchmark = None
-        bm_title = None
-        bm = scene["benchmark"]
-        if bm:
-            df_benchmark = yf.download(
-                bm,
-                start=value_returns.index[0],
-                end=value_returns.index[-1],
-                auto_adjust=True,
-            )["Close"]
-
-            df_benchmark = qs.utils.rebase(df_benchmark)
-            benchmark = qs.utils.to_returns(df_benchmark)
-            benchmark.name = bm
-            benchmark.index = pd.to_datetime(benchmark.index.date)
-            bm_title = f"  (benchmark: {bm})"
-
-
-
-        # df_combine = value_returns.join()
-        # Set up file path.
-        Path(scene["save_path"]).mkdir(parents=True, exist_ok=True)
-        dir = Path(scene["save_path"])
-        filename = (
-                scene["save_name"]
-                + "-"
-                + scene["batchname"]
-                + "-"
-                + scene["batch_runtime"].replace("-", "").replace(":", "").replace(" ", "_")
-                + ".html"
-        )
-        filepath = dir / filename
-
-        title = f"{scene['batchname']}{bm_title if bm_title is not None else ''}"
-        qs.reports.html(
-            value_returns,
-            benchmark=benchmark,
-            title=title,
-            output=filepath,
-        )
-
-def result(results, scene, test_number):
-    """ Extraction of analyzer lines from dictionary form. """
+    :param agg_dict: Tables from the exporters.
+    :return None:
+    """
+    path = Path(scene["save_path"])
+    path.mkdir(parents=True, exist_ok=True)
+    filename = (
+        scene["save_name"]
+        + "-"
+        + scene["test_number"]
+        + "_"
+        + "{}".format(test_number[:8])
+        + ".xlsx"
+    )
+    filepath = path / filename
+
+    # Create workbook.
+    workbook = xlsxwriter.Workbook(filepath)
+
+    # Add some cell formats.
+    # Column Widths
+    sheet_format = dict(
+        narrow=8,
+        medium=12,
+        wide=16,
+        x_wide=20,
+        header_format=workbook.add_format(
+            {
+                "bold": True,
+                "text_wrap": True,
+                "valign": "top",
+                "align": "center",
+                "font_color": "black",
+                # "border": 1,
+            }
+        ),
+        float_2d=workbook.add_format({"num_format": "#,##0.00"}),
+        float_5d=workbook.add_format({"num_format": "#,##0.00000"}),
+        int_0d=workbook.add_format({"num_format": "#,##0"}),
+        percent=workbook.add_format({"num_format": "0%"}),
+        align_left=workbook.add_format({"align": "left"}),
+    )
+
+    for table_name, df in agg_dict.items():
+        if table_name in EXCEL_SHEETS:
+            worksheet = workbook.add_worksheet(table_name)
+            EXCEL_SHEETS[table_name](worksheet, df, sheet_format)
+
+    sheet_dimension(
+        workbook.add_worksheet("dimension"), scene, test_number, sheet_format
+    )
+
+    workbook.close()
+
+
+def has_transactions(results):
+    """
+    True if the backtest traded. Taken from the ``trades`` analyzer, which is
+    always attached, a trade is counted from its opening transaction.
+    """
+    return results[0].analyzers.getbyname("trades").get_analysis().total.total > 0
+
+
+def remove_spills(results, agg_dict=None):
+    """
+    Deletes the spill files of a backtest that will not be saved.
+
+    :param agg_dict: Tables passed on to the writers, their spill files are
+        kept and removed by the writer once saved.
+    """
+    kept = set()
+    for df in (agg_dict or {}).values():
+        if isinstance(df, SpillReader):
+            kept.add(df.path)
+    for analyzer in results[0].analyzers:
+        analysis = analyzer.get_analysis()
+        if isinstance(analysis, SpillReader) and analysis.path not in kept:
+            analysis.remove()
+
+
+def remove_saved_spills(agg_dict):
+    """ Deletes the spill files of ``agg_dict`` once saved by all writers. """
+    for df in agg_dict.values():
+        if isinstance(df, SpillReader):
+            df.remove()
+
+
+def result(results, scene, test_number, timer=None):
+    """
+    Extraction of analyzer lines into tables, saved to excel if requested and
+    returned for saving to the database.
+
+    Only the analyzers selected for the scene are exported, using the
+    ``EXPORTERS`` registry. A failing exporter is reported with its time and
+    the other tables are still exported.
+
+    :param timer: Optional ``extension.timing.Timer`` to add the time of each
+        export, quantstats and the tearsheet to.
+    :return agg_dict: Dictionary of table name to dataframe.
+    """
+    if timer is None:
+        timer = Timer(test_number)
 
     # If there are no transactions, return None and test number.
-    if len(results[0].analyzers.getbyname("transactions").get_analysis()) == 0:
+    if not has_transactions(results):
         print(f"{test_number} has no transactions.")
+        remove_spills(results)
         return
 
+    agg_dict = {}
+
     if scene["save_tearsheet"]:
-        agg_dict = {}
-        tearsheet(scene, results)
-
-    if scene["save_db"] and not scene["save_excel"]:
-        agg_dict = {}
-
-        if scene["full_export"]:
-            try:
-                analyzer = (
-                    results[0].analyzers.getbyname("trade_list").get_analysis(),
-                )
-
-                _, agg_dict = tradelist(
-                    scene, analyzer, test_number, agg_dict=agg_dict,
-                )
-            except:
-                pass
-
-        for analyzer in results[0].analyzers:
-            if scene["benchmark"] ==  None:
-                if type(analyzer).__name__.lower() == "benchmark":
-                    continue
-            if scene["full_export"]:
-                if type(analyzer).__name__.lower() == "tradelist":
-                    continue
-            elif not scene["full_export"]:
-                if type(analyzer).__name__.lower() not in [
-                    "drawdown",
-                    "tradeanalyzer",
-                    "vwr",
-                    "cashmarket",
-                    # "tradelist",
-                ]:
-                    continue
-
-            try:
-                _, agg_dict = eval(type(analyzer).__name__.lower())(
-                    scene, analyzer, test_number, agg_dict=agg_dict
-                )
-            except:
-                pass
-
-        _, agg_dict = dimension(scene, results, test_number, agg_dict=agg_dict)
-
-        agg_dict = quantstats(scene, test_number, agg_dict=agg_dict)
-
-    elif scene["save_excel"]:
-
-        path = Path(scene["save_path"])
-        path.mkdir(parents=True, exist_ok=True)
-        # test_params = get_test_params_indicator(test_number=scene["test_number"])
-        # filename_ma_id = "-".join([x for x in test_params.keys()])
-        filename = (
-            scene["save_name"]
-            + "-"
-            + scene["test_number"]
-            + "_"
-            + "{}".format(test_number[:8])
-            + ".xlsx"
-        )
-        filepath = path / filename
-
-        # Create workbook.
-        workbook = xlsxwriter.Workbook(filepath)
-
-        # set parameters for saving.
-
-        # Add some cell formats.
-        # Column Widths
-        sheet_format = dict(
-            narrow=8,
-            medium=12,
-            wide=16,
-            x_wide=20,
-            header_format=workbook.add_format(
-                {
-                    "bold": True,
-                    "text_wrap": True,
-                    "valign": "top",
-                    "align": "center",
-                    "font_color": "black",
-                    # "border": 1,
-                }
-            ),
-            float_2d=workbook.add_format({"num_format": "#,##0.00"}),
-            float_5d=workbook.add_format({"num_format": "#,##0.00000"}),
-            int_0d=workbook.add_format({"num_format": "#,##0"}),
-            percent=workbook.add_format({"num_format": "0%"}),
-            align_left=workbook.add_format({"align": "left"}),
-        )
+        with timer.phase("tearsheet"):
+            save_series(scene, results, test_number)
 
-        agg_dict = {}
+    if not (scene["save_db"] or scene["save_excel"] or scene["save_parquet"]):
+        remove_spills(results)
+        return agg_dict
 
+    for name in select_analyzers(scene):
+        analyzer = results[0].analyzers.getbyname(name)
+        start = time.perf_counter()
         try:
-            analyzer = (results[0].analyzers.getbyname("trade_list").get_analysis(),)
-
-            workbook, agg_dict = tradelist(
-                scene, analyzer, test_number, workbook, sheet_format, agg_dict,
-            )
-        except:
-            pass
-
-        for analyzer in results[0].analyzers:
-            if type(analyzer).__name__.lower() == "tradelist":
-                continue
-
-            try:
-                workbook, agg_dict = eval(type(analyzer).__name__.lower())(
-                    scene, analyzer, test_number, workbook, sheet_format, agg_dict
-                )
-            except:
-                pass
-
-        workbook, agg_dict = dimension(
-            scene, results, test_number, workbook, sheet_format, agg_dict
-        )
-        # agg_dict = ema_inputs_to_db(scene, test_number, agg_dict)
+            agg_dict.update(EXPORTERS[name](analyzer, test_number))
+        except Exception as e:
+            seconds = time.perf_counter() - start
+            timer.add(f"export_{name}_failed", seconds)
+            print(f"{test_number} export {name} failed after {seconds:.4f}s: {e!r}")
+        else:
+            timer.add(f"export_{name}", time.perf_counter() - start)
+
+    with timer.phase("export_dimension"):
+        agg_dict["dimension"] = dimension(scene, test_number)
 
-        workbook.close()
+    if (
+        (scene["save_db"] or scene["save_parquet"])
+        and not scene["batch_metrics"]
+        and "value" in agg_dict
+    ):
+        with timer.phase("quantstats"):
+            agg_dict["quantstats"] = quantstats(agg_dict["value"], test_number)
+
+    if scene["save_excel"]:
+        with timer.phase("excel_save"):
+            save_excel(scene, test_number, agg_dict)
+
+    # Spill files of analyzers not exported, or only saved to excel.
+    if scene["save_db"] or scene["save_parquet"]:
+        remove_spills(results, agg_dict)
+    else:
+        remove_spills(results)
 
     return agg_dict
@@ -0,0 +1,219 @@
+###############################################################################
+#
+# Software program written by Neil Murphy in year 2021.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+#
+# By using this software, the Disclaimer and Terms distributed with the
+# software are deemed accepted, without limitation, by user.
+#
+# You should have received a copy of the Disclaimer and Terms document
+# along with this program.  If not, see... https://bit.ly/2Tlr9ii
+#
+###############################################################################
+import sqlite3
+
+import pandas as pd
+import pyarrow as pa
+
+"""
+Module managing the schema of the results database.
+
+The results tables are declared in ``TABLES`` with their indexes. Columns come
+from the first rows saved, since the ``dimension`` columns depend on the
+strategy parameters, and columns appearing in later tests are added with
+``ALTER TABLE``. The schema version is kept in ``PRAGMA user_version`` and
+databases from earlier versions are upgraded by ``MIGRATIONS``.
+
+The parquet datasets of ``save_parquet`` add columns the same way, their
+files are read with the union of their schemas from ``unify_schemas``.
+"""
+
+# Tables with one row per test have a unique index on ``test_number``, the
+# others an index on ``test_number`` and their date column.
+TABLES = dict(
+    dimension=dict(unique=True),
+    trade_analysis=dict(unique=True),
+    drawdown=dict(unique=True),
+    vwr=dict(unique=True),
+    quantstats=dict(unique=True),
+    trade_list=dict(indexes=[["test_number"]]),
+    trade=dict(indexes=[["test_number"]]),
+    transaction=dict(indexes=[["test_number", "Date"]]),
+    value=dict(indexes=[["test_number", "Date"]]),
+    ohlcv=dict(indexes=[["test_number", "Date"]]),
+    benchmark=dict(indexes=[["test_number", "Date"]]),
+    global_out=dict(indexes=[["test_number", "Datetime"]]),
+    order_history=dict(indexes=[["test_number", "Datetime"]]),
+    timings=dict(indexes=[["test_number"]]),
+    series=dict(indexes=[["test_number", "table_name"]]),
+    series_dates=dict(indexes=[["dates_id"]]),
+    sensitivity=dict(indexes=[["batchname", "param_x", "param_y", "metric"]]),
+)
+
+
+def sql_type(series):
+    """ Sqlite column type for a dataframe column, as used by ``to_sql``. """
+    if pd.api.types.is_bool_dtype(series) or pd.api.types.is_integer_dtype(series):
+        return "INTEGER"
+    if pd.api.types.is_float_dtype(series):
+        return "REAL"
+    if pd.api.types.is_datetime64_any_dtype(series):
+        return "TIMESTAMP"
+    if pd.api.types.infer_dtype(series) == "bytes":
+        return "BLOB"
+    return "TEXT"
+
+
+def table_columns(engine, table_name):
+    """ Column names of ``table_name``, empty if the table does not exist. """
+    return [row[1] for row in engine.execute(f'PRAGMA table_info("{table_name}")')]
+
+
+def index_columns(table_name, columns):
+    """
+    Lists of columns to index in ``table_name``. Each ``dimension`` column is
+    indexed to filter tests by parameter.
+
+    :return list of (columns list, unique bool):
+    """
+    table = TABLES.get(table_name)
+    if table is None:
+        return []
+
+    if table.get("unique"):
+        indexes = [(["test_number"], True)]
+    else:
+        indexes = [(cols, False) for cols in table["indexes"]]
+    if table_name == "dimension":
+        indexes += [([col], False) for col in columns if col != "test_number"]
+
+    return [(cols, unique) for cols, unique in indexes if set(cols) <= set(columns)]
+
+
+def create_indexes(engine, table_name, columns):
+    for cols, unique in index_columns(table_name, columns):
+        name = f"ix_{table_name}_{'_'.join(cols)}"
+        names = ", ".join(f'"{col}"' for col in cols)
+        try:
+            engine.execute(
+                f'CREATE {"UNIQUE " if unique else ""}INDEX IF NOT EXISTS "{name}" '
+                f'ON "{table_name}" ({names})'
+            )
+        except sqlite3.IntegrityError:
+            # Duplicate tests saved before the schema was managed.
+            print(f"{table_name} has duplicate {names}, using a non unique index.")
+            engine.execute(
+                f'CREATE INDEX IF NOT EXISTS "{name}" ON "{table_name}" ({names})'
+            )
+
+
+def ensure_table(engine, table_name, df, columns):
+    """
+    Creates ``table_name`` with its indexes if missing, otherwise adds the
+    columns of ``df`` missing from the table.
+
+    :param engine: Sqlite3 connection.
+    :param df DataFrame: Rows about to be inserted, with sql column names.
+    :param columns dict: Cache of table name to column names, updated here.
+    :return None:
+    """
+    if table_name not in columns:
+        columns[table_name] = table_columns(engine, table_name)
+
+    if not columns[table_name]:
+        # ``to_sql`` saves bytes as text.
+        blobs = {col: "BLOB" for col in df.columns if sql_type(df[col]) == "BLOB"}
+        engine.execute(
+            pd.io.sql.get_schema(df, table_name, con=engine, dtype=blobs).replace(
+                "CREATE TABLE", "CREATE TABLE IF NOT EXISTS", 1
+            )
+        )
+        columns[table_name] = list(df.columns)
+        create_indexes(engine, table_name, columns[table_name])
+        return
+
+    new = [col for col in df.columns if col not in columns[table_name]]
+    for col in new:
+        engine.execute(
+            f'ALTER TABLE "{table_name}" ADD COLUMN "{col}" {sql_type(df[col])}'
+        )
+        columns[table_name].append(col)
+    if new:
+        create_indexes(engine, table_name, columns[table_name])
+
+
+def migration_1(engine):
+    """ Indexes the tables of databases created before the schema was managed. """
+    tables = [
+        row[0]
+        for row in engine.execute("SELECT name FROM sqlite_master WHERE type='table'")
+    ]
+    for table_name in tables:
+        create_indexes(engine, table_name, table_columns(engine, table_name))
+
+
+# Schema upgrades, the database version is the number of migrations applied.
+MIGRATIONS = [migration_1]
+
+SCHEMA_VERSION = len(MIGRATIONS)
+
+
+def migrate(engine):
+    """
+    Upgrades the database to ``SCHEMA_VERSION``, applying the missing
+    migrations in order and committing.
+
+    :param engine: Sqlite3 connection.
+    :return int: Version of the database before the upgrade.
+    """
+    version = engine.execute("PRAGMA user_version").fetchone()[0]
+    if version > SCHEMA_VERSION:
+        raise ValueError(
+            f"Results database version {version} is newer than this code, "
+            f"{SCHEMA_VERSION}."
+        )
+
+    for number, migration in enumerate(MIGRATIONS[version:], version + 1):
+        migration(engine)
+        engine.execute(f"PRAGMA user_version = {number}")
+    engine.commit()
+
+    return version
+
+
+def _promote_type(left, right):
+    """ Type holding the values of both ``left`` and ``right`` columns. """
+    if left == right or pa.types.is_null(right):
+        return left
+    if pa.types.is_null(left):
+        return right
+    if pa.types.is_integer(left) and pa.types.is_integer(right):
+        return pa.int64()
+    numeric = (pa.types.is_integer, pa.types.is_floating, pa.types.is_boolean)
+    if any(f(left) for f in numeric) and any(f(right) for f in numeric):
+        return pa.float64()
+    if pa.types.is_timestamp(left) and pa.types.is_timestamp(right):
+        return pa.timestamp("ns", left.tz)
+    return pa.string()
+
+
+def unify_schemas(schemas):
+    """
+    Union of the parquet ``schemas`` of a table, in column order of first
+    appearance. Columns of different types are promoted, integers to
+    ``int64``, numbers to ``float64``, other types to strings. Null columns
+    are ``float64`` and all columns are nullable.
+    """
+    types = {}
+    for schema in schemas:
+        for field in schema:
+            types[field.name] = _promote_type(types.get(field.name, pa.null()), field.type)
+    return pa.schema(
+        [
+            pa.field(name, pa.float64() if pa.types.is_null(t) else t)
+            for name, t in types.items()
+        ]
+    )
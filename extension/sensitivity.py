@@ -0,0 +1,131 @@
+###############################################################################
+#
+# Software program written by Neil Murphy in year 2021.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+#
+# By using this software, the Disclaimer and Terms distributed with the
+# software are deemed accepted, without limitation, by user.
+#
+# You should have received a copy of the Disclaimer and Terms document
+# along with this program.  If not, see... https://bit.ly/2Tlr9ii
+#
+###############################################################################
+from datetime import datetime
+import itertools
+import uuid
+
+import pandas as pd
+
+"""
+Module for the parameter sensitivity tables behind the notebook heatmaps.
+
+A heatmap shows a metric across two ``dimension`` parameters, eg: ``sma_fast``
+by ``sma_slow``. Instead of joining ``dimension`` to the results tables each
+time, ``Sensitivity`` keeps the parameters and chosen metrics of each test as
+the results are saved, a few values per test, and at the end of the batch
+computes the ``sensitivity`` table: the number of tests, mean, median and best
+(highest) of each metric for each pair of values of each pair of parameters
+that vary in the batch.
+"""
+
+# One row per test tables the metrics are taken from.
+METRIC_TABLES = ["trade_analysis", "drawdown", "vwr", "quantstats"]
+
+STATS = ["tests", "mean", "median", "best"]
+
+
+class Sensitivity:
+    """
+    Collects the ``dimension`` parameters and ``metrics`` of each test of a
+    batch with ``add``, and builds the batch ``sensitivity`` table with
+    ``table``.
+
+    :param metrics list: Metric columns, eg: ``["Sharpe", "pnl_net_total"]``.
+    :param batchname str: Batch name saved with the rows.
+    :param batch_runtime str: Batch start time saved with the rows, to tell
+        apart runs of the same batch name.
+
+    The rows also get a ``batch_id``, unique to the run and sorting by start
+    time to the microsecond, as ``batch_runtime`` is to the minute and two
+    runs in the same minute would be mixed.
+    """
+
+    def __init__(self, metrics, batchname, batch_runtime):
+        self.metrics = list(metrics)
+        self.batchname = batchname
+        self.batch_runtime = batch_runtime
+        self.batch_id = f"{datetime.now():%Y%m%d%H%M%S%f}-{uuid.uuid4().hex[:6]}"
+        self.params = {}
+        self.values = {}
+
+    def add(self, agg_dict):
+        """
+        Keeps the parameters and metrics of the tests in ``agg_dict``. The
+        metrics may come later than the parameters, eg: with
+        ``batch_metrics``, and are matched by test number.
+        """
+        if "dimension" in agg_dict:
+            for row in agg_dict["dimension"].to_dict("records"):
+                self.params[row.pop("test_number")] = row
+
+        for table_name in METRIC_TABLES:
+            df = agg_dict.get(table_name)
+            if df is None:
+                continue
+            df = df.rename(columns=lambda name: str(name).replace(" ", "_"))
+            columns = [col for col in self.metrics if col in df.columns]
+            if not columns:
+                continue
+            for row in df[["test_number"] + columns].to_dict("records"):
+                self.values.setdefault(row.pop("test_number"), {}).update(row)
+
+    def frame(self):
+        """ Parameters and metrics, one row per test with both. """
+        tests = [tn for tn in self.params if tn in self.values]
+        return pd.DataFrame(
+            [dict(self.params[tn], **self.values[tn]) for tn in tests]
+        )
+
+    def table(self):
+        """
+        Batch ``sensitivity`` table, one row per pair of parameters, pair of
+        values and metric, with the ``STATS`` of the metric. Values are saved
+        as text, as parameters may be numbers or strings.
+
+        :return DataFrame: Empty if less than two parameters vary.
+        """
+        df = self.frame()
+        if df.empty:
+            return df
+
+        metrics = [col for col in self.metrics if col in df.columns]
+        params = [
+            col
+            for col in df.columns
+            if col not in metrics and col != "batchname" and df[col].nunique() > 1
+        ]
+
+        frames = []
+        for param_x, param_y in itertools.combinations(params, 2):
+            grouped = df.groupby([param_x, param_y])
+            for metric in metrics:
+                stats = grouped[metric].agg(["count", "mean", "median", "max"])
+                stats.columns = STATS
+                stats = stats.reset_index().rename(columns={param_x: "x", param_y: "y"})
+                stats["x"] = stats["x"].astype(str)
+                stats["y"] = stats["y"].astype(str)
+                stats.insert(0, "metric", metric)
+                stats.insert(0, "param_y", param_y)
+                stats.insert(0, "param_x", param_x)
+                frames.append(stats)
+
+        if not frames:
+            return pd.DataFrame()
+        df = pd.concat(frames, ignore_index=True)
+        df.insert(0, "batch_id", self.batch_id)
+        df.insert(0, "batch_runtime", self.batch_runtime)
+        df.insert(0, "batchname", self.batchname)
+        return df
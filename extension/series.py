@@ -0,0 +1,111 @@
+###############################################################################
+#
+# Software program written by Neil Murphy in year 2021.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+#
+# By using this software, the Disclaimer and Terms distributed with the
+# software are deemed accepted, without limitation, by user.
+#
+# You should have received a copy of the Disclaimer and Terms document
+# along with this program.  If not, see... https://bit.ly/2Tlr9ii
+#
+###############################################################################
+import hashlib
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+"""
+Module encoding the per bar tables of a test as compressed blobs.
+
+Saving ``value``, ``ohlcv``, ``benchmark`` and ``global_out`` as one row per
+bar per test makes the database very large. With ``series_blobs`` each of these
+tables is saved as one row per test in the ``series`` table, holding the
+columns as a zstd compressed arrow blob, floats as float32. The dates are saved
+once in the ``series_dates`` table and shared by all the tests with the same
+dates. ``decode_series`` turns the rows back into the original table.
+"""
+
+# Per bar tables saved as blobs, and their date column.
+SERIES_TABLES = dict(value="Date", ohlcv="Date", benchmark="Date", global_out="Datetime")
+
+IPC_OPTIONS = pa.ipc.IpcWriteOptions(compression="zstd")
+
+
+def encode_frame(df):
+    """ Dataframe to a compressed arrow blob, floats as float32. """
+    df = df.copy()
+    for col in df.columns:
+        if pd.api.types.is_float_dtype(df[col]):
+            df[col] = df[col].astype(np.float32)
+        elif df[col].dtype == object and "mixed" in pd.api.types.infer_dtype(df[col]):
+            df[col] = df[col].astype(str)
+
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema, options=IPC_OPTIONS) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+def decode_frame(blob):
+    """ Compressed arrow blob back to a dataframe, floats as float64. """
+    df = pa.ipc.open_stream(blob).read_all().to_pandas()
+    for col in df.columns:
+        if df[col].dtype == np.float32:
+            df[col] = df[col].astype(np.float64)
+    return df
+
+
+def encode_series(table_name, df):
+    """
+    Encodes one per bar table of one test.
+
+    :param table_name str: One of ``SERIES_TABLES``.
+    :param df DataFrame: Table rows of one test, with ``test_number``.
+    :return series DataFrame, dates_id str, dates blob: The ``series`` table
+        row, and the id and blob of the dates for ``series_dates``.
+    """
+    date_column = SERIES_TABLES[table_name]
+    dates = pd.to_datetime(df[date_column]).to_numpy("datetime64[ns]").astype(np.int64)
+    dates_id = hashlib.sha1(dates.tobytes()).hexdigest()[:16]
+
+    series = pd.DataFrame(
+        dict(
+            test_number=[df["test_number"].iloc[0]],
+            table_name=table_name,
+            dates_id=dates_id,
+            rows=len(df),
+            data=[encode_frame(df.drop(columns=["test_number", date_column]))],
+        )
+    )
+    return series, dates_id, encode_frame(pd.DataFrame(dict(date=dates)))
+
+
+def decode_series(series, dates):
+    """
+    Rebuilds a per bar table from its ``series`` rows.
+
+    :param series DataFrame: ``series`` rows of one table.
+    :param dates dict: ``dates_id`` to blob from ``series_dates``.
+    :return DataFrame: Table rows, as saved without ``series_blobs``.
+    """
+    decoded_dates = {}
+    frames = []
+    for row in series.itertuples(index=False):
+        if row.dates_id not in decoded_dates:
+            decoded_dates[row.dates_id] = pd.to_datetime(
+                decode_frame(dates[row.dates_id])["date"].to_numpy()
+            )
+        df = decode_frame(row.data)
+        df.insert(0, SERIES_TABLES[row.table_name], decoded_dates[row.dates_id])
+        df.insert(0, "test_number", row.test_number)
+        frames.append(df)
+
+    if not frames:
+        return pd.DataFrame()
+    return pd.concat(frames, ignore_index=True)
@@ -0,0 +1,135 @@
+###############################################################################
+#
+# Software program written by Neil Murphy in year 2021.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+#
+# By using this software, the Disclaimer and Terms distributed with the
+# software are deemed accepted, without limitation, by user.
+#
+# You should have received a copy of the Disclaimer and Terms document
+# along with this program.  If not, see... https://bit.ly/2Tlr9ii
+#
+###############################################################################
+from pathlib import Path
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+"""
+Module for spilling per bar analyzer rows to disk during long backtests.
+
+Per bar analyzers normally hold every bar in memory until ``result`` runs after
+``cerebro.run`` finishes. In spill mode the rows are buffered and flushed in
+fixed size chunks to a parquet file per test and analyzer, then read back one
+chunk at a time when saving to the database.
+"""
+
+
+def spill_enabled(p):
+    """
+    Spilling is used when saving to the database only. Excel is meant for
+    single test deep dives and reads the analyzers from memory.
+
+    :param p: Strategy params.
+    :return bool:
+    """
+    return bool(p.spill_rows and p.save_result and p.save_db and not p.save_excel)
+
+
+def spill_path(p, name):
+    """ File path for the analyzer ``name`` of the current test. """
+    return Path(p.save_path) / "spill" / f"{p.test_number}_{name}.parquet"
+
+
+class SpillWriter:
+    """
+    Buffers analyzer rows and writes them to a parquet file, one row group
+    per ``chunk_rows`` rows.
+
+    The columns are those of the first row. Their types are given by
+    ``types``, column name to arrow type, and default to floats, so a column
+    empty in the first chunks does not fix the type of the file. Each chunk
+    is converted to this schema.
+    """
+
+    def __init__(self, path, chunk_rows, types=None):
+        self.path = Path(path)
+        self.chunk_rows = chunk_rows
+        self.types = types or {}
+        self.rows = []
+        self.schema = None
+        self.writer = None
+
+    def append(self, row):
+        """ Add one row dictionary, flushing if the chunk is full. """
+        self.rows.append(row)
+        if len(self.rows) >= self.chunk_rows:
+            self.flush()
+
+    def flush(self):
+        if not self.rows:
+            return
+
+        if self.writer is None:
+            self.schema = pa.schema(
+                [(name, self.types.get(name, pa.float64())) for name in self.rows[0]]
+            )
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self.writer = pq.ParquetWriter(self.path, self.schema)
+
+        self.writer.write_table(pa.Table.from_pylist(self.rows, schema=self.schema))
+        self.rows = []
+
+    def close(self):
+        """ Flush the remaining rows and return a reader for the file. """
+        self.flush()
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+        return SpillReader(self.path)
+
+
+class SpillReader:
+    """
+    Lazy reader of a spilled analyzer file. Iterating yields one dataframe per
+    chunk. Only holds the file path so it can be returned from the
+    multi-processing workers.
+    """
+
+    def __init__(self, path, test_number=None):
+        self.path = Path(path)
+        self.test_number = test_number
+
+    def keyed(self, test_number):
+        """ Reader that inserts the ``test_number`` column in each chunk. """
+        return SpillReader(self.path, test_number)
+
+    def __iter__(self):
+        if not self.path.exists():
+            return
+
+        file = pq.ParquetFile(self.path)
+        for i in range(file.num_row_groups):
+            df = file.read_row_group(i).to_pandas()
+            if self.test_number is not None:
+                df.insert(0, "test_number", self.test_number)
+            yield df
+
+    def read(self, columns=None):
+        """ Read the whole file, or only ``columns``, into one dataframe. """
+        if not self.path.exists():
+            return pd.DataFrame(columns=columns)
+
+        df = pq.read_table(self.path, columns=columns).to_pandas()
+        if self.test_number is not None:
+            df.insert(0, "test_number", self.test_number)
+        return df
+
+    def remove(self):
+        """ Delete the spill file once it has been saved. """
+        if self.path.exists():
+            self.path.unlink()
@@ -0,0 +1,464 @@
+###############################################################################
+#
+# Software program written by Neil Murphy in year 2021.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+#
+# By using this software, the Disclaimer and Terms distributed with the
+# software are deemed accepted, without limitation, by user.
+#
+# You should have received a copy of the Disclaimer and Terms document
+# along with this program.  If not, see... https://bit.ly/2Tlr9ii
+#
+###############################################################################
+import itertools
+from pathlib import Path
+import sqlite3
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from extension.schema import unify_schemas
+from extension.series import SERIES_TABLES, decode_series
+
+"""
+Module for reading backtest results into the notebooks.
+
+A ``ResultsStore`` reads the results database, or the parquet datasets of
+``save_parquet``, only loading the rows and columns asked for. Filters are
+lists of ``(column, op, value)`` tuples, as for pyarrow, eg:
+``[("sma_fast", "<", 20), ("instrument", "in", ["FB", "AAPL"])]``, and are run
+by sqlite or pyarrow, so the whole table is never loaded into pandas. Passing
+``chunksize`` returns an iterator of dataframes instead of one dataframe.
+
+    store = ResultsStore()
+    df = store.summary([("Sharpe", ">", 1)], columns=["sma_fast", "Sharpe"])
+    value = store.equity(df["test_number"])
+"""
+
+# One row per test tables joined by ``summary``.
+SUMMARY_TABLES = ["dimension", "trade_analysis", "drawdown", "vwr", "quantstats"]
+
+# Filter operators, with their sql.
+OPERATORS = {
+    "=": "=",
+    "==": "=",
+    "!=": "!=",
+    "<": "<",
+    "<=": "<=",
+    ">": ">",
+    ">=": ">=",
+    "in": "IN",
+    "not in": "NOT IN",
+}
+
+# Test numbers per sql query, sqlite limits the number of query parameters.
+TESTS_PER_QUERY = 500
+
+
+def sql_where(filters, owner=None):
+    """
+    Sql ``WHERE`` clause and parameters of ``filters``.
+
+    :param filters list: ``(column, op, value)`` tuples, all must match.
+    :param owner dict: Column to table name, to qualify joined columns.
+    :return str, list: Clause, empty if no filters, and parameters.
+    """
+    clauses = []
+    params = []
+    for col, op, value in filters or []:
+        if op not in OPERATORS:
+            raise ValueError(f"Unknown filter operator {op}.")
+        name = f'"{col}"'
+        if owner and col in owner:
+            name = f'"{owner[col]}".{name}'
+        if op in ["in", "not in"]:
+            value = list(value)
+            clauses.append(f'{name} {OPERATORS[op]} ({", ".join("?" * len(value))})')
+            params += value
+        else:
+            clauses.append(f"{name} {OPERATORS[op]} ?")
+            params.append(value)
+
+    if not clauses:
+        return "", []
+    return " WHERE " + " AND ".join(clauses), params
+
+
+def arrow_filter(filters):
+    """ Pyarrow dataset expression of ``filters``, ``None`` if no filters. """
+    expression = None
+    for col, op, value in filters or []:
+        field = ds.field(col)
+        if op in ["=", "=="]:
+            term = field == value
+        elif op == "!=":
+            term = field != value
+        elif op == "<":
+            term = field < value
+        elif op == "<=":
+            term = field <= value
+        elif op == ">":
+            term = field > value
+        elif op == ">=":
+            term = field >= value
+        elif op == "in":
+            term = field.isin(list(value))
+        elif op == "not in":
+            term = ~field.isin(list(value))
+        else:
+            raise ValueError(f"Unknown filter operator {op}.")
+        expression = term if expression is None else expression & term
+    return expression
+
+
+def frame_mask(df, filters):
+    """ Boolean mask of the rows of ``df`` matching ``filters``. """
+    mask = pd.Series(True, index=df.index)
+    for col, op, value in filters or []:
+        if op in ["=", "=="]:
+            mask &= df[col] == value
+        elif op == "!=":
+            mask &= df[col] != value
+        elif op == "<":
+            mask &= df[col] < value
+        elif op == "<=":
+            mask &= df[col] <= value
+        elif op == ">":
+            mask &= df[col] > value
+        elif op == ">=":
+            mask &= df[col] >= value
+        elif op == "in":
+            mask &= df[col].isin(list(value))
+        elif op == "not in":
+            mask &= ~df[col].isin(list(value))
+        else:
+            raise ValueError(f"Unknown filter operator {op}.")
+    return mask
+
+
+def concat(frames, chunksize):
+    """ Returns the ``frames`` iterator if ``chunksize`` else one dataframe. """
+    if chunksize:
+        return frames
+    frames = list(frames)
+    if not frames:
+        return pd.DataFrame()
+    return pd.concat(frames, ignore_index=True)
+
+
+class ResultsStore:
+    """
+    Reads results from the database at ``db_path``, or from the parquet
+    datasets in ``save_path/parquet`` if ``parquet`` is set, in which case
+    only ``batchname`` is read if given.
+
+    :param db_path str: Results database.
+    :param parquet bool: Read the parquet datasets instead of the database.
+    :param save_path str: ``save_path`` of the backtests, for parquet.
+    :param batchname str: Parquet batch to read, ``None`` reads all.
+    """
+
+    def __init__(
+        self, db_path="data/results.db", parquet=False, save_path="results", batchname=None
+    ):
+        self.parquet = parquet
+        self.path = Path(save_path) / "parquet"
+        self.batchname = batchname
+        self.engine = None
+        if not parquet:
+            # Read only, the notebooks can be open while a batch is saving.
+            self.engine = sqlite3.connect(f"file:{Path(db_path)}?mode=ro", uri=True)
+
+    def close(self):
+        if self.engine is not None:
+            self.engine.close()
+
+    def tables(self):
+        """ Names of the results tables. """
+        if self.parquet:
+            return sorted(p.name for p in self.path.iterdir() if p.is_dir())
+        tables = [
+            row[0]
+            for row in self.engine.execute(
+                "SELECT name FROM sqlite_master WHERE type='table' ORDER BY name"
+            )
+        ]
+        if "series" in tables:
+            saved = [
+                row[0] for row in self.engine.execute("SELECT DISTINCT table_name FROM series")
+            ]
+            tables = sorted(set(tables) | set(saved))
+        return tables
+
+    def columns(self, table_name):
+        """ Column names of ``table_name``. """
+        if self.parquet:
+            return self.dataset(table_name).schema.names
+        return [
+            row[1] for row in self.engine.execute(f'PRAGMA table_info("{table_name}")')
+        ]
+
+    def dataset(self, table_name):
+        path = self.path / table_name
+        if self.batchname is not None:
+            path = path / f"batchname={self.batchname}"
+        # Files of later tests or batches may have more columns or wider types.
+        schema = unify_schemas(pq.read_schema(part) for part in path.rglob("*.parquet"))
+        if self.batchname is None:
+            schema = schema.append(pa.field("batchname", pa.string()))
+        return ds.dataset(path, schema=schema, format="parquet", partitioning="hive")
+
+    def table(
+        self, table_name, test_numbers=None, columns=None, filters=None, chunksize=None
+    ):
+        """
+        Reads rows of a results table.
+
+        :param table_name str: Results table, eg: ``trade_list``.
+        :param test_numbers list: Only read these tests. ``None`` reads all.
+        :param columns list: Only read these columns.
+        :param filters list: ``(column, op, value)`` row filters.
+        :param chunksize int: Return an iterator of dataframes of about
+            ``chunksize`` rows.
+        :return DataFrame or iterator of DataFrame:
+        """
+        if self.parquet:
+            frames = self.read_parquet(table_name, test_numbers, columns, filters, chunksize)
+        elif table_name in SERIES_TABLES and self.columns("series"):
+            # Batches saved with and without ``series_blobs`` can share a database.
+            frames = self.read_series(table_name, test_numbers, columns, filters, chunksize)
+            if self.columns(table_name):
+                frames = itertools.chain(
+                    self.read_sql_dates(table_name, test_numbers, columns, filters, chunksize),
+                    frames,
+                )
+        else:
+            frames = self.read_sql(table_name, test_numbers, columns, filters, chunksize)
+        return concat(frames, chunksize)
+
+    def read_sql(self, table_name, test_numbers, columns, filters, chunksize):
+        names = "*" if columns is None else ", ".join(f'"{col}"' for col in columns)
+        where, params = sql_where(filters)
+        sql = f'SELECT {names} FROM "{table_name}"{where}'
+
+        if test_numbers is None:
+            queries = [(sql, params)]
+        else:
+            test_numbers = list(test_numbers)
+            queries = []
+            for start in range(0, len(test_numbers), TESTS_PER_QUERY):
+                tests = test_numbers[start : start + TESTS_PER_QUERY]
+                where_tests, params_tests = sql_where(
+                    list(filters or []) + [("test_number", "in", tests)]
+                )
+                queries.append(
+                    (f'SELECT {names} FROM "{table_name}"{where_tests}', params_tests)
+                )
+
+        for sql, params in queries:
+            if chunksize:
+                yield from pd.read_sql(sql, self.engine, params=params, chunksize=chunksize)
+            else:
+                yield pd.read_sql(sql, self.engine, params=params)
+
+    def read_sql_dates(self, table_name, test_numbers, columns, filters, chunksize):
+        """ Per bar table rows, with the dates parsed as by ``read_series``. """
+        date = SERIES_TABLES[table_name]
+        for df in self.read_sql(table_name, test_numbers, columns, filters, chunksize):
+            if date in df.columns:
+                df[date] = pd.to_datetime(df[date])
+            yield df
+
+    def read_series(self, table_name, test_numbers, columns, filters, chunksize):
+        """ Per bar table saved with ``series_blobs``, decoded by test. """
+        dates = {}
+        series_filters = [("table_name", "=", table_name)]
+        for series in self.read_sql(
+            "series", test_numbers, None, series_filters, chunksize or TESTS_PER_QUERY
+        ):
+            # Only the dates of these tests not read yet.
+            missing = [i for i in series["dates_id"].unique() if i not in dates]
+            for start in range(0, len(missing), TESTS_PER_QUERY):
+                ids = missing[start : start + TESTS_PER_QUERY]
+                where, params = sql_where([("dates_id", "in", ids)])
+                dates.update(
+                    self.engine.execute(f"SELECT dates_id, data FROM series_dates{where}", params)
+                )
+            df = decode_series(series, dates)
+            if df.empty:
+                continue
+            df = df[frame_mask(df, filters)]
+            yield df if columns is None else df[list(columns)]
+
+    def read_parquet(self, table_name, test_numbers, columns, filters, chunksize):
+        filters = list(filters or [])
+        if test_numbers is not None:
+            filters.append(("test_number", "in", list(test_numbers)))
+        read_columns = columns
+        if self.batchname is not None and columns is not None:
+            read_columns = [col for col in columns if col != "batchname"]
+
+        dataset = self.dataset(table_name)
+        batches = dataset.to_batches(
+            columns=read_columns,
+            filter=arrow_filter(filters),
+            batch_size=chunksize or 1 << 20,
+        )
+        empty = True
+        for batch in batches:
+            if not batch.num_rows:
+                continue
+            empty = False
+            df = batch.to_pandas()
+            if self.batchname is not None and (columns is None or "batchname" in columns):
+                df.insert(0, "batchname", self.batchname)
+            elif "batchname" in df.columns:
+                df["batchname"] = df["batchname"].astype(str)
+            yield df
+        if empty:
+            yield pd.DataFrame(columns=read_columns or dataset.schema.names)
+
+    def summary(self, filters=None, columns=None, tables=None, chunksize=None):
+        """
+        One row per test of ``dimension`` joined with the one row per test
+        tables, eg: ``trade_analysis`` and ``quantstats``.
+
+        :param filters list: ``(column, op, value)`` filters on any column of
+            the joined tables, eg: ``[("Sharpe", ">", 1)]``.
+        :param columns list: Only read these columns, ``test_number`` is
+            always read.
+        :param tables list: Tables to join, default ``SUMMARY_TABLES`` saved.
+        :param chunksize int: Return an iterator of dataframes.
+        :return DataFrame or iterator of DataFrame:
+        """
+        saved = self.tables()
+        tables = [t for t in (tables or SUMMARY_TABLES) if t in saved]
+        table_columns = {t: self.columns(t) for t in tables}
+        if columns is not None:
+            columns = ["test_number"] + [c for c in columns if c != "test_number"]
+        if not tables:
+            return concat(iter([pd.DataFrame(columns=columns or ["test_number"])]), chunksize)
+
+        if self.parquet:
+            frames = self.summary_parquet(tables, table_columns, filters, columns, chunksize)
+        else:
+            frames = self.summary_sql(tables, table_columns, filters, columns, chunksize)
+        return concat(frames, chunksize)
+
+    def summary_sql(self, tables, table_columns, filters, columns, chunksize):
+        # Each column is taken from the first table that has it.
+        owner = {}
+        for t in tables:
+            for col in table_columns[t]:
+                owner.setdefault(col, t)
+
+        names = columns or list(owner)
+        unknown = [col for col in names if col not in owner]
+        if unknown:
+            raise ValueError(
+                f"Unknown summary columns {', '.join(unknown)}, not in {', '.join(tables)}."
+            )
+        select = ", ".join(f'"{owner[col]}"."{col}"' for col in names)
+        joins = " ".join(f'LEFT JOIN "{t}" USING (test_number)' for t in tables[1:])
+        where, params = sql_where(filters, owner)
+        sql = f'SELECT {select} FROM "{tables[0]}" {joins}{where}'
+        if chunksize:
+            yield from pd.read_sql(sql, self.engine, params=params, chunksize=chunksize)
+        else:
+            yield pd.read_sql(sql, self.engine, params=params)
+
+    def summary_parquet(self, tables, table_columns, filters, columns, chunksize):
+        # Filter each table on its own columns, then keep the tests in all.
+        tests = None
+        for t in tables:
+            own = [f for f in filters or [] if f[0] in table_columns[t]]
+            if own:
+                found = set(
+                    self.table(t, columns=["test_number"], filters=own)["test_number"]
+                )
+                tests = found if tests is None else tests & found
+        if tests is not None and not tests:
+            yield pd.DataFrame(columns=columns or ["test_number"])
+            return
+
+        df = None
+        for t in tables:
+            names = [
+                c
+                for c in table_columns[t]
+                if c != "test_number"
+                and (columns is None or c in columns)
+                and (df is None or c not in df.columns)
+            ]
+            if df is not None and not names:
+                continue
+            frame = self.table(t, tests, ["test_number"] + names)
+            df = frame if df is None else df.merge(frame, how="left", on="test_number")
+        if self.batchname is not None and (columns is None or "batchname" in columns):
+            df.insert(1, "batchname", self.batchname)
+        if columns is not None:
+            df = df[[col for col in columns if col in df.columns]]
+
+        step = chunksize or len(df)
+        for start in range(0, len(df), max(step, 1)):
+            yield df.iloc[start : start + step]
+
+    def sensitivity(self, x, y, metric, stat="mean", batchname=None):
+        """
+        Heatmap values of ``metric`` by parameters ``x`` and ``y`` from the
+        ``sensitivity`` table, of the last run of ``batchname``, or of the
+        last batch if ``None``. Runs are told apart by ``batch_id``, or for
+        rows saved without it by ``batchname`` and ``batch_runtime``.
+
+        :param stat str: ``tests``, ``mean``, ``median`` or ``best``.
+        :return DataFrame: Columns ``y``, ``x`` and ``metric``.
+        """
+        filters = [
+            ("param_x", "in", [x, y]),
+            ("param_y", "in", [x, y]),
+            ("metric", "=", metric),
+        ]
+        if batchname is not None:
+            filters.append(("batchname", "=", batchname))
+        columns = ["batchname", "batch_runtime", "param_x", "x", "y", stat]
+        if "batch_id" in self.columns("sensitivity"):
+            columns.insert(0, "batch_id")
+        df = self.table("sensitivity", columns=columns, filters=filters)
+        if df.empty:
+            return pd.DataFrame(columns=[y, x, metric])
+
+        if "batch_id" in df.columns and df["batch_id"].notna().any():
+            df = df[df["batch_id"] == df["batch_id"].max()]
+        else:
+            df = df[df["batch_runtime"] == df["batch_runtime"].max()]
+            df = df[df["batchname"].astype(str) == df["batchname"].astype(str).max()]
+        if df["param_x"].iloc[0] == x:
+            df = df.rename(columns={"x": x, "y": y, stat: metric})
+        else:
+            df = df.rename(columns={"x": y, "y": x, stat: metric})
+        df = df[[y, x, metric]].reset_index(drop=True)
+
+        # Values are saved as text.
+        for col in [x, y]:
+            try:
+                df[col] = pd.to_numeric(df[col])
+            except ValueError:
+                pass
+        return df.sort_values([y, x], ignore_index=True)
+
+    def test_numbers(self, filters=None):
+        """ Test numbers of the tests matching ``filters``, see ``summary``. """
+        return self.summary(filters, columns=["test_number"])["test_number"].tolist()
+
+    def equity(self, test_numbers, columns=None, chunksize=None):
+        """ Daily ``value`` rows, cash and value, of ``test_numbers``. """
+        return self.table("value", test_numbers, columns, chunksize=chunksize)
+
+    def trades(self, test_numbers, columns=None, chunksize=None):
+        """ ``trade_list`` rows of ``test_numbers``. """
+        return self.table("trade_list", test_numbers, columns, chunksize=chunksize)
@@ -0,0 +1,275 @@
+###############################################################################
+#
+# Software program written by Neil Murphy in year 2021.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+#
+# By using this software, the Disclaimer and Terms distributed with the
+# software are deemed accepted, without limitation, by user.
+#
+# You should have received a copy of the Disclaimer and Terms document
+# along with this program.  If not, see... https://bit.ly/2Tlr9ii
+#
+###############################################################################
+from concurrent.futures import ProcessPoolExecutor
+import os
+from pathlib import Path
+
+import backtrader as bt
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from extension.metrics import batch_metrics
+from extension.spill import SpillReader
+
+"""
+Module for rendering quantstats tearsheets away from the backtests.
+
+Rendering a tearsheet takes seconds of matplotlib work. The backtests only save
+the portfolio values of the test, and once per batch the benchmark closes, to
+``save_path/tearsheet``. A ``TearsheetPool`` renders the html reports from these
+files in its own processes, alongside the batch, or after the batch for the
+best ``top`` tests only.
+"""
+
+
+def series_path(save_path, test_number):
+    """ Portfolio values file of a test waiting for its tearsheet. """
+    return Path(save_path) / "tearsheet" / f"{test_number}.parquet"
+
+
+def benchmark_path(save_path, bm, from_date, to_date):
+    """ Benchmark closes file shared by the tests of the batch. """
+    name = "".join(c if c.isalnum() else "_" for c in f"{bm}_{from_date}_{to_date}")
+    return Path(save_path) / "tearsheet" / f"benchmark_{name}.parquet"
+
+
+def write_atomic(table, path):
+    """ Writes the parquet file in one step, as other processes may read it. """
+    path.parent.mkdir(parents=True, exist_ok=True)
+    temp = path.with_suffix(f".{os.getpid()}.tmp")
+    pq.write_table(table, temp)
+    os.replace(temp, path)
+
+
+def save_benchmark(scene, results):
+    """
+    Saves the benchmark closes for the tearsheets, from the benchmark feed
+    already loaded for the backtest, so nothing is downloaded. Saved once for
+    each benchmark and dates.
+
+    :param scene dict: One set of backtest parameters.
+    :param results: Cerebro run results.
+    :return str: Benchmark file path, empty if no benchmark.
+    """
+    bm = scene["benchmark"]
+    if not bm:
+        return ""
+
+    path = benchmark_path(scene["save_path"], bm, scene["from_date"], scene["to_date"])
+    if not path.exists():
+        # The benchmark is the second data feed, see ``RunBacktest.run_strat``.
+        data = results[0].datas[1]
+        dates = [bt.num2date(x).date() for x in data.datetime.array]
+        df = pd.DataFrame(dict(Date=pd.to_datetime(dates), Close=data.close.array))
+        df = df.drop_duplicates("Date", keep="last")
+        write_atomic(pa.Table.from_pandas(df, preserve_index=False), path)
+
+    return str(path)
+
+
+def save_series(scene, results, test_number):
+    """
+    Saves the portfolio values of the test for its tearsheet. The title, html
+    file and benchmark file are kept in the file metadata, so the file alone
+    describes the tearsheet to render.
+
+    :param scene dict: One set of backtest parameters.
+    :param results: Cerebro run results.
+    :param test_number: Backtest test number.
+    :return None:
+    """
+    value = results[0].analyzers.getbyname("cash_market").get_analysis()
+    columns = ["Date", "Cash", "Value"]
+    if isinstance(value, SpillReader):
+        df = value.read(columns=columns)
+    else:
+        df = pd.DataFrame(value).T.reset_index()
+        df.columns = columns
+    df = df[["Date", "Value"]]
+    df["Date"] = pd.to_datetime(df["Date"])
+
+    title = scene["batchname"]
+    if scene["benchmark"]:
+        title += f"  (benchmark: {scene['benchmark']})"
+    output = Path(scene["save_path"]) / (
+        scene["save_name"]
+        + "-"
+        + scene["batchname"]
+        + "-"
+        + scene["batch_runtime"].replace("-", "").replace(":", "").replace(" ", "_")
+        + f"-{test_number}.html"
+    )
+
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    table = table.replace_schema_metadata(
+        dict(
+            title=title,
+            output=str(output),
+            benchmark=save_benchmark(scene, results),
+            benchmark_name=scene["benchmark"] or "",
+        )
+    )
+    write_atomic(table, series_path(scene["save_path"], test_number))
+
+
+def render(path):
+    """
+    Renders the tearsheet of a saved test, then removes its file. Runs in the
+    ``TearsheetPool`` processes.
+
+    :param path str: File saved by ``save_series``.
+    :return str: Html file written.
+    """
+    # Imported here, only the tearsheet processes need quantstats.
+    import quantstats as qs
+
+    table = pq.read_table(path)
+    meta = {k.decode(): v.decode() for k, v in table.schema.metadata.items()}
+    df_value = table.to_pandas().set_index("Date")["Value"].sort_index()
+
+    # Start the returns at the first change in value.
+    value_returns = pd.DataFrame(qs.utils.to_returns(df_value))
+    value_returns["diff"] = value_returns["Value"].diff().dropna()
+    value_returns["diff"] = value_returns["diff"].abs().cumsum()
+    value_returns = value_returns.loc[value_returns["diff"] > 0, "Value"]
+    value_returns.index = pd.to_datetime(value_returns.index.date)
+
+    benchmark = None
+    if meta["benchmark"]:
+        close = pq.read_table(meta["benchmark"]).to_pandas()
+        close = close.set_index("Date")["Close"]
+        benchmark = qs.utils.to_returns(close)
+        benchmark.name = meta["benchmark_name"]
+
+    Path(meta["output"]).parent.mkdir(parents=True, exist_ok=True)
+    try:
+        qs.reports.html(
+            value_returns,
+            benchmark=benchmark,
+            title=meta["title"],
+            output=meta["output"],
+        )
+    except Exception:
+        # No partly written report.
+        Path(meta["output"]).unlink(missing_ok=True)
+        raise
+    Path(path).unlink()
+    return meta["output"]
+
+
+class TearsheetPool:
+    """
+    Renders the tearsheets of a batch in ``processes`` background processes.
+
+    Tests are added with ``add`` as they finish. Without ``top`` they are
+    rendered straight away, alongside the batch. With ``top`` only the ``top``
+    tests with the highest ``metric`` are rendered when the batch is closed,
+    eg: ``Sharpe``, and the other files removed.
+
+    :param results: Function returning the ``extension.store.ResultsStore``
+        of the batch, or ``None``. The tests are ranked from their saved
+        summary rows, or if the metric is not saved, it is computed one test
+        at a time.
+    """
+
+    def __init__(self, save_path, processes=1, top=None, metric="Sharpe", results=None):
+        self.save_path = save_path
+        self.top = top
+        self.metric = metric
+        self.results = results
+        self.executor = ProcessPoolExecutor(max_workers=processes)
+        self.futures = []
+        self.pending = []
+
+    def add(self, test_number):
+        """ Queues the tearsheet of a test, if its values were saved. """
+        path = series_path(self.save_path, test_number)
+        if not path.exists():
+            return
+        if self.top:
+            self.pending.append((test_number, path))
+        else:
+            self.futures.append(self.executor.submit(render, str(path)))
+
+    def saved_metrics(self, store):
+        """
+        ``metric`` of the pending tests from the saved summary rows.
+
+        :return Series: By test number, ``None`` if the metric is not saved.
+        """
+        column = self.metric.replace(" ", "_")
+        tests = [test_number for test_number, _ in self.pending]
+        frames = []
+        for start in range(0, len(tests), 500):
+            filters = [("test_number", "in", tests[start : start + 500])]
+            try:
+                frames.append(store.summary(filters, columns=[column]))
+            except ValueError:
+                return None
+        df = pd.concat(frames, ignore_index=True)
+        if column not in df.columns:
+            return None
+        return df.set_index("test_number")[column]
+
+    def computed_metrics(self):
+        """ ``metric`` of the pending tests, reading one test at a time. """
+        values = {}
+        for test_number, path in self.pending:
+            value = pq.read_table(path).to_pandas().assign(test_number=test_number)
+            values[test_number] = batch_metrics(value)[self.metric].iloc[0]
+        return pd.Series(values, dtype=float)
+
+    def select(self):
+        """ Paths of the ``top`` pending tests by ``metric``. """
+        ranks = None
+        store = self.results() if self.results is not None else None
+        if store is not None:
+            try:
+                ranks = self.saved_metrics(store)
+            finally:
+                store.close()
+        if ranks is None:
+            ranks = self.computed_metrics()
+        ranks = pd.to_numeric(ranks, errors="coerce").sort_values(
+            ascending=False, na_position="last"
+        )
+        best = set(ranks.index[: self.top])
+        return [path for test_number, path in self.pending if test_number in best]
+
+    def close(self):
+        """ Renders the ``top`` tests if set and waits for all tearsheets. """
+        if self.pending:
+            selected = self.select()
+            for test_number, path in self.pending:
+                if path in selected:
+                    self.futures.append(self.executor.submit(render, str(path)))
+                else:
+                    path.unlink()
+            self.pending = []
+
+        for future in self.futures:
+            try:
+                future.result()
+            except Exception as e:
+                print(f"Tearsheet failed: {e!r}")
+        self.executor.shutdown()
+
+        directory = Path(self.save_path) / "tearsheet"
+        for path in directory.glob("benchmark_*.parquet"):
+            path.unlink()
+        if directory.exists() and not any(directory.iterdir()):
+            directory.rmdir()
@@ -0,0 +1,142 @@
+###############################################################################
+#
+# Software program written by Neil Murphy in year 2021.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+#
+# By using this software, the Disclaimer and Terms distributed with the
+# software are deemed accepted, without limitation, by user.
+#
+# You should have received a copy of the Disclaimer and Terms document
+# along with this program.  If not, see... https://bit.ly/2Tlr9ii
+#
+###############################################################################
+import collections
+from contextlib import contextmanager
+from functools import wraps
+import time
+
+import pandas as pd
+from tabulate import tabulate
+
+"""
+Module for timing the phases of a backtest: loading data, ``cerebro.run``, each
+analyzer, the ``result`` conversions, quantstats and saving to the database.
+Loading data and the analyzers run inside ``cerebro.run`` and are included in its
+time. Timing costs one ``time.perf_counter`` call at each end of a phase, so it
+can be left on.
+"""
+
+
+class Timer:
+    """
+    Accumulates the seconds and number of calls for each named phase of the
+    test ``test_number``. Phases are timed with ``with timer.phase("name"):``
+    or added directly with ``add``.
+    """
+
+    def __init__(self, test_number=None):
+        self.test_number = test_number
+        self.seconds = collections.defaultdict(float)
+        self.calls = collections.defaultdict(int)
+
+    @contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start)
+
+    def add(self, name, seconds, calls=1):
+        self.seconds[name] += seconds
+        self.calls[name] += calls
+
+    def update(self, other):
+        """ Adds the phases of another timer, eg: a test to the batch. """
+        for name, seconds in other.seconds.items():
+            self.add(name, seconds, other.calls[name])
+
+    def to_df(self):
+        """ Timings table rows for the test. """
+        return pd.DataFrame(
+            dict(
+                test_number=self.test_number,
+                phase=list(self.seconds.keys()),
+                seconds=list(self.seconds.values()),
+                calls=[self.calls[name] for name in self.seconds],
+            )
+        )
+
+    def summary(self, tests):
+        """ Prints the total and per test seconds of each phase. """
+        rows = [
+            [name, seconds, seconds / max(tests, 1), self.calls[name]]
+            for name, seconds in sorted(
+                self.seconds.items(), key=lambda x: x[1], reverse=True
+            )
+        ]
+        print("\nTimings:")
+        print(
+            tabulate(
+                rows,
+                headers=["phase", "seconds", "per test", "calls"],
+                floatfmt=".4f",
+            )
+        )
+
+
+# Methods timed in the analyzers: ``next`` and the ``notify_*`` methods.
+ANALYZER_METHODS = [
+    "_prenext",
+    "_nextstart",
+    "_next",
+    "_notify_cashvalue",
+    "_notify_fund",
+    "_notify_trade",
+    "_notify_order",
+]
+
+# Methods timed in the data feeds: starting and preloading the data.
+FEED_METHODS = ["_start", "preload"]
+
+
+def timed_method(method):
+    """ Wraps ``method`` adding its time to ``time_spent`` of the instance. """
+
+    @wraps(method)
+    def wrapper(self, *args):
+        start = time.perf_counter()
+        ret = method(self, *args)
+        self.time_spent += time.perf_counter() - start
+        self.time_calls += 1
+        return ret
+
+    return wrapper
+
+
+_timed_classes = {}
+
+
+def timed(cls, methods):
+    """
+    Subclass of ``cls`` adding up the time spent in ``methods`` in the
+    ``time_spent`` and ``time_calls`` attributes. The class name is kept so
+    the analyzer exports and spill files are unchanged.
+
+    The subclass is created with the class metaclass and ``cls`` as the only
+    base, as backtrader derives the lines of a class from all of its bases.
+
+    :param cls: Backtrader analyzer or data feed class.
+    :param methods: ``ANALYZER_METHODS`` or ``FEED_METHODS``.
+    :return class: Cached timed subclass.
+    """
+    key = (cls, tuple(methods))
+    if key not in _timed_classes:
+        dct = {name: timed_method(getattr(cls, name)) for name in methods}
+        dct.update(time_spent=0.0, time_calls=0)
+        _timed_classes[key] = type(cls)(cls.__name__, (cls,), dct)
+
+    return _timed_classes[key]
@@ -30,11 +30,27 @@ from tabulate import tabulate
 
 import extension.indicator as id
 from extension.indicator import SmaCross
+from extension.metrics import batch_metrics
+from extension.sensitivity import Sensitivity
+from extension.store import ResultsStore
 from extension.analyzer import AddAnalyzer
-from extension.result import result
+from extension.result import has_transactions, remove_saved_spills, remove_spills, result
 from extension.sizer import Stake
 from extension.strategy import StandardStrategy
-from utils import clear_database, df_to_db, yes_or_no
+from extension.tearsheet import TearsheetPool
+from extension.timing import FEED_METHODS, Timer, timed
+from utils import (
+    DBWriter,
+    ParquetBatchWriter,
+    clear_database,
+    read_parquet,
+    read_series,
+    read_table,
+    yes_or_no,
+)
+
+# Tests loaded at a time by ``batch_metrics``.
+BATCH_METRICS_TESTS = 5000
 
 
 class RunBacktest:
@@ -92,6 +108,19 @@ class RunBacktest:
       - ``save_db`` (bool: default ``False``)
           Save results to database.
 
+      - ``save_parquet`` (bool: default ``False``)
+          Append the results tables of each test to parquet datasets in
+          ``save_path/parquet``, one directory per table partitioned by
+          ``batchname``. Much faster than excel for large batches, use
+          ``utils.read_parquet`` to load them. Excel remains available for
+          single test deep dives.
+
+      - ``series_blobs`` (bool: default ``False``)
+          Save the per bar tables ``value``, ``ohlcv``, ``benchmark`` and
+          ``global_out`` to the database as one compressed blob per test in
+          the ``series`` table, instead of one row per bar. Use
+          ``utils.read_series`` to load them, see ``extension.series``.
+
       - ``full_export`` (bool: default True)
           The analyzers are split into to groups. The first group has analyzers
           that only have one or minimal lines of output per test. The second group
@@ -100,8 +129,60 @@ class RunBacktest:
           outputs, but slows down the backtests. This is most important when
           running many backtest as memory can become an issues. Try to use
           False for running many backtest. Which analyzers are included where
-          can be modified in the ``AddAnalyzer.add_analyzers`` in
-          ``extension.analyzer``.
+          can be modified in the ``ANALYZERS`` registry in
+          ``extension.analyzer``. Analyzers not selected are not attached to
+          cerebro. The excel workbook still has the ``transaction`` and
+          ``trade_list`` sheets without ``full_export``.
+
+      - ``analyzers`` (list of str: default ``None``)
+          Names of the analyzers from the ``ANALYZERS`` registry in
+          ``extension.analyzer`` to use in the backtest. Overrides
+          ``full_export``. Since lists create multiple tests, wrap the names
+          in a list, eg: ``analyzers=[["trades", "drawdown", "cash_market"]]``.
+          Unknown or duplicate names raise a ``ValueError``.
+
+      - ``spill_rows`` (int: default ``None``)
+          When saving to the database only, the per bar analyzers
+          (``GlobalOutput``, ``OHLCV``, ``CashMarket``, ``OrderHistory``) write
+          their rows to disk in chunks of ``spill_rows`` rows instead of holding
+          them in memory for the whole backtest. The chunks are read back one
+          at a time when saving to the database. Useful for long intraday
+          backtests. ``None`` keeps everything in memory.
+
+      - ``timings`` (bool: default ``True``)
+          Time each phase of the backtests: loading data, ``cerebro.run``,
+          each analyzer, the ``result`` exports, quantstats and saving to the
+          database. Timings are saved to the ``timings`` table when saving to
+          the database and summarized at the end of the batch.
+
+      - ``tearsheet_top`` (int: default ``None``)
+          With ``save_tearsheet``, only render the tearsheets of the best
+          ``tearsheet_top`` tests by ``tearsheet_metric``, after the batch.
+          ``None`` renders every test alongside the batch.
+
+      - ``tearsheet_metric`` (str: default ``Sharpe``)
+          Column of the ``quantstats`` table ranking the tests for
+          ``tearsheet_top``, highest first. Read from the saved results, or
+          computed one test at a time when the metric is not saved.
+
+      - ``tearsheet_processes`` (int: default ``1``)
+          Processes rendering the tearsheets in the background. The backtests
+          only save the values of each test, see ``extension.tearsheet``.
+
+      - ``batch_metrics`` (bool: default ``False``)
+          Compute the ``quantstats`` table after the batch instead of in each
+          backtest. The saved ``value`` tables of the batch are loaded into
+          one tests by dates array and the metrics computed in one pass.
+          Needs ``save_db`` or ``save_parquet``.
+
+      - ``sensitivity_metrics`` (list: default ``None``)
+          Metrics of the results tables, eg: ``["Sharpe", "pnl_net_total"]``,
+          to save in the ``sensitivity`` table after the batch: the number of
+          tests, mean, median and best of each metric for each pair of values
+          of each pair of parameters varying in the batch. The notebook
+          heatmaps are drawn from it, see ``extension.sensitivity``. Needs
+          ``save_db`` or ``save_parquet``. Unlike the other lists, the metrics
+          do not create multiple tests.
 
       - ``save_path`` (str: default ``result``)
           Directory name where to save spreadsheet results. Created if none exist.
@@ -207,9 +288,19 @@ class RunBacktest:
             test_number=[0, True],
             save_result=[False, False],
             save_tearsheet=[False, False],
+            tearsheet_top=[None, False],
+            tearsheet_metric=["Sharpe", False],
+            tearsheet_processes=[1, False],
             save_excel=[False, False],
             save_db=[False, False],
+            save_parquet=[False, False],
+            series_blobs=[False, False],
             full_export=[True, False],
+            analyzers=[None, False],
+            spill_rows=[None, False],
+            timings=[True, False],
+            batch_metrics=[False, False],
+            sensitivity_metrics=[None, False],
             save_path=["results", False],
             excluded_dates=[None, False],
             save_name=["results", False],
@@ -318,19 +409,32 @@ class RunBacktest:
                 pool = multiprocessing.Pool(processes=multiprocessing.cpu_count() - 2)
                 cum_backtest = 0
                 backtest_with_trades = 0
+                batch_timer = Timer()
+                parquet = self.parquet_writer()
+                db_writer = self.db_writer()
+                tearsheets = self.tearsheet_pool()
+                sensitivity = self.sensitivity()
+                saved_tests = []
 
                 # This loop allows for processing to database backtest
                 # results while further tests are still running. Saves memory.
-                for agg_dict in pool.imap_unordered(
+                for agg_dict, timer in pool.imap_unordered(
                     self.backtest_controller_multi, scenarios
                 ):
-                    if (
-                        self.params_value["save_result"]
-                        and self.params_value["save_db"]
-                        and agg_dict is not None
-                    ):
-                        df_to_db(agg_dict)
+                    if agg_dict is not None:
+                        saved_tests.append(timer.test_number)
+                    if tearsheets is not None:
+                        tearsheets.add(timer.test_number)
+                    if parquet is not None and agg_dict is not None:
+                        self.save_parquet(parquet, agg_dict, timer)
+                    if db_writer is not None and agg_dict is not None:
+                        db_writer.put(
+                            agg_dict, timer if self.params_value["timings"] else None
+                        )
                         backtest_with_trades += 1
+                    if sensitivity is not None and agg_dict is not None:
+                        sensitivity.add(agg_dict)
+                    batch_timer.update(timer)
                     cum_backtest += 1
                     print(
                         f"Backtests: {cum_backtest:3.0f} / {total_backtests:3.0f} "
@@ -338,6 +442,18 @@ class RunBacktest:
                         f"Elapsed: {(time.time() - start_test):.2f}"
                     )
                 pool.close()
+                if parquet is not None:
+                    parquet.close()
+                if db_writer is not None:
+                    batch_timer.update(db_writer.close())
+                self.save_batch_metrics(saved_tests, batch_timer, sensitivity)
+                self.save_sensitivity(sensitivity, batch_timer)
+                if tearsheets is not None:
+                    with batch_timer.phase("tearsheet_render_wait"):
+                        tearsheets.close()
+
+                if self.params_value["timings"]:
+                    batch_timer.summary(cum_backtest)
 
             else:
                 # Single call to run backtest sequentially, no multi-processing.
@@ -355,46 +471,249 @@ class RunBacktest:
 
         # Loop though each backtest parameters.
         loop = 1
+        batch_timer = Timer()
+        parquet = self.parquet_writer()
+        db_writer = self.db_writer()
+        tearsheets = self.tearsheet_pool()
+        sensitivity = self.sensitivity()
+        saved_tests = []
         for scene in scenarios:
             if scene['printon']:
                 print("Starting loop {}".format(loop))
             loop += 1
             scene["test_number"] = str(uuid.uuid4()).replace("-", "")[:10]
+            timer = Timer(scene["test_number"])
 
             # Run the main strategy
-            res, final_value = self.run_strat(scene)
+            res, final_value = self.run_strat(scene, timer)
 
             # If there are transactions, save results spreadsheet.
             if scene["save_result"]:
-                if len(res[0].analyzers.getbyname("transactions").get_analysis()) > 0:
+                if has_transactions(res):
                     scene["db_cols"] = self.db_cols()
-                    if scene["save_excel"] or scene["save_db"]:
-                        agg_dict = result(res, scene, scene["test_number"])
-                    if scene["save_db"]:
-                        df_to_db(agg_dict)
+                    if scene["save_excel"] or scene["save_db"] or scene["save_parquet"]:
+                        agg_dict = result(res, scene, scene["test_number"], timer)
+                        saved_tests.append(scene["test_number"])
+                    if tearsheets is not None:
+                        tearsheets.add(scene["test_number"])
+                    if parquet is not None and agg_dict is not None:
+                        self.save_parquet(parquet, agg_dict, timer)
+                    if db_writer is not None:
+                        db_writer.put(agg_dict, timer if scene["timings"] else None)
+                    if sensitivity is not None and agg_dict is not None:
+                        sensitivity.add(agg_dict)
+                else:
+                    remove_spills(res)
+
+            batch_timer.update(timer)
 
             if scene["printon"]:
                 print(f"Final value {final_value:.2f}")
 
+        if parquet is not None:
+            parquet.close()
+        if db_writer is not None:
+            batch_timer.update(db_writer.close())
+        self.save_batch_metrics(saved_tests, batch_timer, sensitivity)
+        self.save_sensitivity(sensitivity, batch_timer)
+        if tearsheets is not None:
+            with batch_timer.phase("tearsheet_render_wait"):
+                tearsheets.close()
+
+        if self.params_value["timings"]:
+            batch_timer.summary(len(scenarios))
+
         return final_value
 
     def backtest_controller_multi(self, scene=None):
         """
         Runs a single backtest controlled by multi processor.
         :param scene dict: One set of backtest parameters.
-        :return agg_dict dict: Back test results if saving.
+        :return agg_dict dict, timer Timer: Back test results if saving, and
+            the test timings.
         """
         # Assign uniq id for the backtest to allow matching in database.
         scene["test_number"] = str(uuid.uuid4()).replace("-", "")[:10]
+        timer = Timer(scene["test_number"])
 
         # Run the main strategy and retrieving the strategy object
         # and final value.
-        res, final_value = self.run_strat(scene)
+        res, final_value = self.run_strat(scene, timer)
 
-        if scene["save_result"] and (scene["save_excel"] or scene["save_db"]):
+        agg_dict = None
+        if scene["save_result"] and (
+            scene["save_excel"] or scene["save_db"] or scene["save_parquet"]
+        ):
             scene["db_cols"] = self.db_cols()
-            agg_dict = result(res, scene, scene["test_number"])
-            return agg_dict
+            agg_dict = result(res, scene, scene["test_number"], timer)
+
+        return agg_dict, timer
+
+    def save_batch_metrics(self, test_numbers, timer, sensitivity=None):
+        """
+        Computes the ``quantstats`` table of the batch from the saved
+        ``value`` tables if ``batch_metrics`` is on. Tests are loaded and
+        computed ``BATCH_METRICS_TESTS`` at a time to limit memory.
+        :param test_numbers list: Tests saved in the batch.
+        :param timer Timer: Batch timer.
+        :param sensitivity Sensitivity: Given the metrics if not None.
+        :return None:
+        """
+        p = self.params_value
+        if not (p["save_result"] and p["batch_metrics"] and test_numbers):
+            return
+        if not (p["save_db"] or p["save_parquet"]):
+            print("batch_metrics needs save_db or save_parquet.")
+            return
+
+        db_writer = self.db_writer()
+        parquet = self.parquet_writer()
+        columns = ["test_number", "Date", "Value"]
+        for start in range(0, len(test_numbers), BATCH_METRICS_TESTS):
+            tests = test_numbers[start : start + BATCH_METRICS_TESTS]
+            with timer.phase("batch_metrics_load"):
+                if p["save_db"] and p["series_blobs"]:
+                    value = read_series("value", tests)[columns]
+                elif p["save_db"]:
+                    value = read_table("value", tests, columns)
+                else:
+                    value = read_parquet(
+                        "value",
+                        p["batchname"],
+                        p["save_path"],
+                        columns=columns,
+                        filters=[("test_number", "in", tests)],
+                    )
+            with timer.phase("batch_metrics"):
+                df = batch_metrics(value)
+            if sensitivity is not None:
+                sensitivity.add(dict(quantstats=df))
+            if db_writer is not None:
+                db_writer.put(dict(quantstats=df))
+            if parquet is not None:
+                parquet.add(dict(quantstats=df))
+
+        if parquet is not None:
+            parquet.close()
+        if db_writer is not None:
+            timer.update(db_writer.close())
+
+    def sensitivity(self):
+        """
+        Collector of the parameters and metrics for the ``sensitivity``
+        table if ``sensitivity_metrics`` are set.
+        :return Sensitivity or None:
+        """
+        p = self.params_value
+        if not (
+            p["save_result"]
+            and p["sensitivity_metrics"]
+            and (p["save_db"] or p["save_parquet"])
+        ):
+            return None
+        metrics = p["sensitivity_metrics"]
+        if isinstance(metrics, str):
+            metrics = [metrics]
+        elif len(metrics) == 1 and isinstance(metrics[0], (list, tuple)):
+            # Wrapped like ``analyzers``, eg: ``[["Sharpe", "pnl_net_total"]]``.
+            metrics = metrics[0]
+        return Sensitivity(metrics, p["batchname"], p["batch_runtime"])
+
+    def save_sensitivity(self, sensitivity, timer):
+        """
+        Saves the ``sensitivity`` table of the batch.
+        :param sensitivity Sensitivity: Batch collector, nothing saved if None.
+        :param timer Timer: Batch timer.
+        :return None:
+        """
+        if sensitivity is None:
+            return
+        with timer.phase("sensitivity"):
+            df = sensitivity.table()
+        if df.empty:
+            print("sensitivity needs two parameters varying in the batch.")
+            return
+
+        db_writer = self.db_writer()
+        parquet = self.parquet_writer()
+        if db_writer is not None:
+            db_writer.put(dict(sensitivity=df))
+            timer.update(db_writer.close())
+        if parquet is not None:
+            parquet.add(dict(sensitivity=df))
+            parquet.close()
+
+    def tearsheet_pool(self):
+        """
+        Background tearsheet renderer for the batch if saving tearsheets.
+        :return TearsheetPool or None:
+        """
+        p = self.params_value
+        if not (p["save_result"] and p["save_tearsheet"]):
+            return None
+        return TearsheetPool(
+            p["save_path"],
+            processes=p["tearsheet_processes"],
+            top=p["tearsheet_top"],
+            metric=p["tearsheet_metric"],
+            results=self.results_store,
+        )
+
+    def results_store(self):
+        """
+        Reader of the saved results, from the database, else from the parquet
+        datasets of the batch.
+        :return ResultsStore or None: None if the results are not saved.
+        """
+        p = self.params_value
+        if not p["save_result"]:
+            return None
+        if p["save_db"]:
+            return ResultsStore()
+        if p["save_parquet"]:
+            return ResultsStore(
+                parquet=True, save_path=p["save_path"], batchname=p["batchname"]
+            )
+        return None
+
+    def db_writer(self):
+        """
+        Background database writer for the batch results if saving to the
+        database.
+        :return DBWriter or None:
+        """
+        if not (self.params_value["save_result"] and self.params_value["save_db"]):
+            return None
+        return DBWriter(series_blobs=self.params_value["series_blobs"])
+
+    def parquet_writer(self):
+        """
+        Parquet writer for the batch results if saving to parquet.
+        :return ParquetBatchWriter or None:
+        """
+        if not (self.params_value["save_result"] and self.params_value["save_parquet"]):
+            return None
+        return ParquetBatchWriter(
+            self.params_value["save_path"],
+            self.params_value["batchname"],
+            self.params_value["batch_runtime"],
+        )
+
+    def save_parquet(self, parquet, agg_dict, timer):
+        """
+        Adds the results of one backtest to the batch parquet datasets.
+        :param parquet ParquetBatchWriter: Batch writer.
+        :param agg_dict dict: Results tables of the backtest.
+        :param timer Timer: Test timings, saved with the results if on.
+        :return None:
+        """
+        with timer.phase("save_parquet"):
+            parquet.add(agg_dict)
+        # Without the database writer, nothing else reads the spill files.
+        if not self.params_value["save_db"]:
+            remove_saved_spills(agg_dict)
+        if self.params_value["timings"]:
+            parquet.add(dict(timings=timer.to_df()))
 
     def iterize(self, iterable):
         """
@@ -426,6 +745,8 @@ class RunBacktest:
 
         test_params = self.params_value.copy()
         excluded_dates = test_params.pop("excluded_dates")
+        # Batch level, a list of metrics not values to run tests for.
+        test_params.pop("sensitivity_metrics")
 
         keys = test_params.keys()
         values = self.iterize(test_params.values())
@@ -462,13 +783,16 @@ class RunBacktest:
 
         return scenario_dict_final, test_params
 
-    def run_strat(self, scene):
+    def run_strat(self, scene, timer=None):
         """
         Sets up and runs a back test.
 
         :param scene: Dictionary containing all parameters.
+        :param timer: Optional ``Timer`` to add the backtest phases to.
         :return: Cerebro strategy object and total value.
         """
+        if timer is None:
+            timer = Timer(scene["test_number"])
 
         # Cerebro create
         cerebro = bt.Cerebro(stdstats=False)
@@ -484,9 +808,13 @@ class RunBacktest:
             pass
 
         # Get data from yahoo.
+        feed = bt.feeds.YahooFinanceData
+        if scene["timings"]:
+            feed = timed(feed, FEED_METHODS)
+
         for ticker in [scene["instrument"], scene["benchmark"]]:
             if ticker:
-                data = bt.feeds.YahooFinanceData(
+                data = feed(
                     dataname=ticker,
                     timeframe=bt.TimeFrame.Days,
                     fromdate=datetime.strptime(scene["from_date"], "%Y-%m-%d"),
@@ -516,7 +844,20 @@ class RunBacktest:
         cerebro = AddAnalyzer(cerebro).add_analyzers()
 
         # Cerebro run
-        strat = cerebro.run(tradehistory=True)
+        with timer.phase("cerebro_run"):
+            strat = cerebro.run(tradehistory=True)
+
+        if scene["timings"]:
+            timer.add(
+                "load_data",
+                sum([d.time_spent for d in cerebro.datas]),
+                sum([d.time_calls for d in cerebro.datas]),
+            )
+            for name in strat[0].analyzers.getnames():
+                analyzer = strat[0].analyzers.getbyname(name)
+                timer.add(
+                    f"analyzer_{name}", analyzer.time_spent, analyzer.time_calls
+                )
 
         # Print out the final result
         if scene["printon"]:
@@ -0,0 +1,39 @@
+import queue
+
+import backtrader as bt
+
+from ccxtbt import CCXTStore
+from ccxtbt.ccxtfeed import CCXTFeed
+from ccxtbt.mockexchange import MockExchange
+
+
+class CandleStream:
+    """ Stand in for ``WebSocketCandleStream``, candles are queued by the test. """
+
+    RECONNECTED = 1
+
+
+def test_stream_gap_longer_than_ohlcv_limit():
+    exchange = MockExchange()
+    store = CCXTStore(exchange=exchange, currency="USDT", config={}, retries=1)
+    store.exchange = exchange  # the store is a singleton
+    feed = CCXTFeed(
+        store=store,
+        dataname="S0/USDT",
+        timeframe=bt.TimeFrame.Minutes,
+        compression=1,
+        ohlcv_limit=20,
+        candle_stream=CandleStream(),
+    )
+    interval = 60000
+    now = exchange.milliseconds()
+    streamed = now - now % interval - interval  # last closed candle
+    feed._last_ts = streamed - 101 * interval  # 100 candles missed
+    feed._candles = queue.Queue()
+    feed._candles.put((0, [streamed, 1.0, 1.0, 1.0, 1.0, 1.0]))
+
+    feed._load_stream()
+
+    tstamps = [ohlcv[0] for ohlcv in feed._data]
+    assert tstamps == list(range(streamed - 100 * interval, streamed + 1, interval))
+    assert exchange.calls["fetch_ohlcv"] == 6
@@ -0,0 +1,67 @@
+import warnings
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from extension.metrics import batch_metrics, compare_quantstats, metrics
+
+DATES = pd.bdate_range("2020-01-01", periods=300)
+
+
+def walk():
+    rng = np.random.default_rng(1)
+    return 100 * np.exp(np.cumsum(rng.normal(0.0005, 0.01, len(DATES))))
+
+
+def with_nans():
+    values = walk()
+    values[[10, 11, 50]] = np.nan
+    return values
+
+
+@pytest.mark.parametrize(
+    "values",
+    [
+        walk(),
+        np.full(len(DATES), 100.0),  # all zero returns
+        np.array([100.0, 101.0]),  # a single daily return
+        with_nans(),  # dates missing in the test
+    ],
+    ids=["walk", "zero", "single", "nan"],
+)
+def test_metrics_match_quantstats(values):
+    value = pd.DataFrame({"Date": DATES[: len(values)], "Value": values})
+    with warnings.catch_warnings():
+        # quantstats warns about the degenerate series.
+        warnings.simplefilter("ignore")
+        df = compare_quantstats(value)
+
+    np.testing.assert_allclose(
+        df["native"], df["quantstats"], rtol=1e-9, atol=1e-12, equal_nan=True
+    )
+
+
+def test_single_value_has_no_returns():
+    row = metrics(np.array([100.0]), DATES[:1]).iloc[0]
+
+    assert row["Start_Period"] == row["End_Period"] == "2020-01-01"
+    assert row["Cumulative_Return"] == 0.0
+    assert row["Max_Drawdown"] == 0.0
+    assert np.isnan(row["Volatility_ann."])
+    assert np.isnan(row["Sharpe"])
+
+
+def test_batch_matches_each_test():
+    values = [walk(), with_nans()]
+    value = pd.concat(
+        pd.DataFrame({"test_number": i, "Date": DATES, "Value": v}).dropna()
+        for i, v in enumerate(values)
+    )
+
+    batch = batch_metrics(value).set_index("test_number")
+    for i, v in enumerate(values):
+        single = metrics(v, DATES).iloc[0]
+        pd.testing.assert_series_equal(
+            batch.loc[i], single, check_names=False, rtol=1e-12
+        )
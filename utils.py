@@ -17,7 +17,20 @@ from datetime import datetime
 import itertools
 import math
 from pathlib import Path
+import queue
 import sqlite3
+import threading
+import time
+import uuid
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from extension.schema import ensure_table, migrate, table_columns, unify_schemas
+from extension.series import SERIES_TABLES, decode_series, encode_series
+from extension.spill import SpillReader
+from extension.timing import Timer
 
 def time_str_to_datetime(time):
     return datetime.strptime(time, "%H:%M").time()
@@ -56,21 +69,416 @@ def clear_database():
     try:
         remove_db = Path('data/results.db')
         remove_db.unlink()
+        # Write ahead log files of the database writer.
+        for suffix in ["-wal", "-shm"]:
+            Path(f"data/results.db{suffix}").unlink(missing_ok=True)
     except:
         pass
 
-def df_to_db(agg_dict):
-    """ Saves results dataframes to the sqlite3 database"""
+def insert_rows(engine, table_name, df, columns):
+    """
+    Inserts a dataframe in the current transaction with one ``executemany``.
+    The table is created, or new columns added, by ``extension.schema``. Dates
+    are saved as text as by ``DataFrame.to_sql``.
+
+    :param columns dict: Cache of table name to column names.
+    """
+    # Remove whitespace before going to sql.
+    df = df.copy()
+    df.columns = [str(name).replace(" ", "_") for name in df.columns]
+    ensure_table(engine, table_name, df, columns)
+
+    for col in df.columns:
+        if pd.api.types.is_datetime64_any_dtype(df[col]):
+            df[col] = pd.Series(
+                df[col].dt.to_pydatetime(), index=df.index, dtype=object
+            )
+    df = df.astype(object).where(df.notna(), None)
+
+    names = ", ".join(f'"{name}"' for name in df.columns)
+    marks = ", ".join("?" * len(df.columns))
+    engine.executemany(
+        f'INSERT INTO "{table_name}" ({names}) VALUES ({marks})',
+        df.itertuples(index=False, name=None),
+    )
+
+
+def insert_series(engine, table_name, df, columns, dates_ids):
+    """
+    Inserts a per bar table of one test as a ``series`` blob, and its dates in
+    ``series_dates`` unless already saved.
+
+    :param dates_ids set: Ids of the dates saved, updated here.
+    """
+    df = df.copy()
+    df.columns = [str(name).replace(" ", "_") for name in df.columns]
+    series, dates_id, dates = encode_series(table_name, df)
+    if dates_id not in dates_ids:
+        insert_rows(
+            engine,
+            "series_dates",
+            pd.DataFrame(dict(dates_id=[dates_id], rows=len(df), data=[dates])),
+            columns,
+        )
+        dates_ids.add(dates_id)
+    insert_rows(engine, "series", series, columns)
+
+
+def read_in(engine, sql, column, values, params=()):
+    """
+    Reads the rows of ``sql`` with ``column`` in ``values``. Sqlite limits the
+    number of query parameters, so the values are queried 500 at a time.
+
+    :param sql str: Query, with or without a ``WHERE`` clause.
+    :param params list: Parameters of ``sql``.
+    :return DataFrame:
+    """
+    values = list(values)
+    join = " AND " if " WHERE " in sql else " WHERE "
+    frames = []
+    for start in range(0, max(len(values), 1), 500):
+        chunk = values[start : start + 500]
+        marks = ", ".join("?" * len(chunk))
+        frames.append(
+            pd.read_sql(
+                f'{sql}{join}"{column}" IN ({marks})',
+                con=engine,
+                params=list(params) + chunk,
+            )
+        )
+    return pd.concat(frames, ignore_index=True)
+
+
+def read_table(table_name, test_numbers=None, columns=None):
+    """
+    Reads a results table from the database.
+
+    :param table_name str: Results table, eg: ``value``.
+    :param test_numbers list: Only read these tests. ``None`` reads all.
+    :param columns list: Only read these columns.
+    :return DataFrame:
+    """
     engine = create_db_connection()
+    names = "*" if columns is None else ", ".join(f'"{col}"' for col in columns)
+    sql = f'SELECT {names} FROM "{table_name}"'
+    try:
+        if test_numbers is None:
+            return pd.read_sql(sql, con=engine)
+        return read_in(engine, sql, "test_number", test_numbers)
+    finally:
+        engine.close()
+
+
+def read_series(table_name, test_numbers=None):
+    """
+    Reads a per bar table saved with ``series_blobs``, decoded to the rows
+    it would have without ``series_blobs``.
+
+    :param table_name str: One of ``value``, ``ohlcv``, ``benchmark`` or
+        ``global_out``.
+    :param test_numbers list: Only read these tests. ``None`` reads all.
+    :return DataFrame:
+    """
+    engine = create_db_connection()
+    sql = 'SELECT * FROM "series" WHERE "table_name" = ?'
+    try:
+        if test_numbers is None:
+            series = pd.read_sql(sql, con=engine, params=[table_name])
+        else:
+            series = read_in(engine, sql, "test_number", test_numbers, [table_name])
+        # Only the dates of the tests read.
+        dates = read_in(
+            engine,
+            'SELECT "dates_id", "data" FROM "series_dates"',
+            "dates_id",
+            series["dates_id"].unique(),
+        )
+    finally:
+        engine.close()
+    return decode_series(series, dict(zip(dates["dates_id"], dates["data"])))
+
+
+class DBWriter:
+    """
+    Saves results to the sqlite3 database from a background thread, so the
+    backtests are not held up waiting on the database.
+
+    The thread holds one connection in WAL mode. Results passed to ``put`` are
+    buffered and inserted in one transaction once ``commit_rows`` rows are
+    waiting or ``commit_seconds`` have passed since the last commit. Spilled
+    analyzers are inserted one chunk at a time and their spill file removed
+    after the commit.
+
+    With ``series_blobs`` the per bar tables are saved as one compressed blob
+    per test, see ``extension.series``.
+
+    Each table of a test is inserted inside a savepoint, rolled back if the
+    insert fails part way, eg: in a later chunk of a spilled analyzer, so only
+    whole tables are committed. At most ``queue_size`` tests wait in the
+    queue, ``put`` blocks until the thread catches up.
+
+    The time spent saving is added to the ``df_to_db`` and ``db_commit``
+    phases of ``timer``, for the whole batch. Call ``close`` at the end of the
+    batch to commit the remaining results. If the thread fails, eg: on a
+    migration or a commit, the error is raised by the next ``put`` or by
+    ``close``.
+    """
+
+    def __init__(
+        self, commit_rows=100000, commit_seconds=5.0, series_blobs=False, queue_size=100
+    ):
+        self.commit_rows = commit_rows
+        self.commit_seconds = commit_seconds
+        self.series_blobs = series_blobs
+        self.timer = Timer()
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.error = None
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def put(self, agg_dict, timer=None):
+        """
+        Queues the results of one test. If a test ``timer`` is passed, its
+        timings are saved to the ``timings`` table. The timer should not be
+        changed afterwards.
+        """
+        if timer is not None:
+            agg_dict = dict(agg_dict, timings=timer.to_df())
+        self._put(agg_dict)
+
+    def _put(self, item):
+        """ Blocks while the queue is full, raising if the thread has failed. """
+        while True:
+            if self.error is not None:
+                raise RuntimeError("Database writer failed.") from self.error
+            try:
+                self.queue.put(item, timeout=1.0)
+                return
+            except queue.Full:
+                pass
+
+    def close(self):
+        """ Commits the remaining results and waits for the thread to end. """
+        if self.thread.is_alive() and self.error is None:
+            self._put(None)
+        self.thread.join()
+        if self.error is not None:
+            raise RuntimeError("Database writer failed.") from self.error
+        return self.timer
 
-    for table_name, df in agg_dict.items():
+    def run(self):
         try:
-            # Remove whitespace before going to sql.
-            df.columns = [name.replace(" ", "_") for name in df.columns]
-            df.to_sql(
-                table_name, con=engine, if_exists="append", index=False
-            )
+            self.save()
+        except Exception as e:
+            print(f"{e!r} database writer failed.")
+            self.error = e
+
+    def insert(self, engine, table_name, df, columns, dates_ids):
+        """
+        Inserts one table of a test in a savepoint.
+
+        :return int: Rows inserted.
+        """
+        frames = df if isinstance(df, SpillReader) else [df]
+        if not engine.in_transaction:
+            engine.execute("BEGIN")
+        engine.execute("SAVEPOINT insert_table")
+        saved_ids = set(dates_ids)
+        rows = 0
+        try:
+            if self.series_blobs and table_name in SERIES_TABLES:
+                frame = df.read() if isinstance(df, SpillReader) else df
+                if len(frame):
+                    insert_series(engine, table_name, frame, columns, dates_ids)
+                    rows += len(frame)
+                frames = []
+            for frame in frames:
+                insert_rows(engine, table_name, frame, columns)
+                rows += len(frame)
         except Exception as e:
             print(f"{e} {table_name} failed.")
-    engine.close()
+            engine.execute("ROLLBACK TO insert_table")
+            engine.execute("RELEASE insert_table")
+            # Tables or columns created in the savepoint are gone.
+            for name in [table_name, "series", "series_dates"]:
+                columns.pop(name, None)
+            dates_ids.intersection_update(saved_ids)
+            return 0
+
+        engine.execute("RELEASE insert_table")
+        return rows
+
+    def save(self):
+        engine = create_db_connection()
+        try:
+            engine.execute("PRAGMA journal_mode=WAL")
+            engine.execute("PRAGMA synchronous=NORMAL")
+            migrate(engine)
+            self.save_queue(engine)
+        finally:
+            engine.close()
+
+    def save_queue(self, engine):
+        columns = {}
+        dates_ids = set()
+        if table_columns(engine, "series_dates"):
+            dates_ids = {
+                row[0] for row in engine.execute("SELECT dates_id FROM series_dates")
+            }
+
+        rows = 0
+        spilled = []
+        last_commit = time.perf_counter()
+        while True:
+            try:
+                agg_dict = self.queue.get(timeout=self.commit_seconds)
+            except queue.Empty:
+                agg_dict = False
+
+            if agg_dict:
+                with self.timer.phase("df_to_db"):
+                    for table_name, df in agg_dict.items():
+                        rows += self.insert(engine, table_name, df, columns, dates_ids)
+                        if isinstance(df, SpillReader):
+                            spilled.append(df)
+
+            if rows and (
+                agg_dict is None
+                or rows >= self.commit_rows
+                or time.perf_counter() - last_commit >= self.commit_seconds
+            ):
+                with self.timer.phase("db_commit"):
+                    engine.commit()
+                rows = 0
+                last_commit = time.perf_counter()
+
+                for df in spilled:
+                    df.remove()
+                spilled = []
+
+            if agg_dict is None:
+                break
+
+        # Tables created without rows.
+        engine.commit()
+        for df in spilled:
+            df.remove()
+
+
+class ParquetBatchWriter:
+    """
+    Appends the results tables of a batch to parquet datasets, one directory
+    per table partitioned by ``batchname``:
+    ``save_path/parquet/<table>/batchname=<batchname>/part-*.parquet``.
+
+    Rows are buffered per table and written as one file every ``flush_rows``
+    rows, and on ``close``. Spilled analyzers are read one chunk at a time.
+    Each file holds the columns of all the earlier files of the table, with
+    types promoted by ``unify_schemas``. Read the datasets with
+    ``read_parquet``, which also unifies the files of different batches.
+    """
+
+    def __init__(self, save_path, batchname, batch_runtime, flush_rows=250000):
+        self.path = Path(save_path) / "parquet"
+        self.batchname = str(batchname)
+        # Unique per writer so batches run again do not overwrite earlier parts.
+        self.runtime = "".join(c for c in str(batch_runtime) if c.isdigit())
+        self.runtime += "-" + uuid.uuid4().hex[:6]
+        self.flush_rows = flush_rows
+        self.frames = {}
+        self.rows = {}
+        self.schemas = {}
+        self.parts = {}
+        self.failed = []
+
+    def add(self, agg_dict):
+        """ Buffer the tables of one test, flushing full tables. """
+        for table_name, df in agg_dict.items():
+            frames = df if isinstance(df, SpillReader) else [df]
+            for frame in frames:
+                if len(frame) == 0:
+                    continue
+                self.frames.setdefault(table_name, []).append(frame)
+                self.rows[table_name] = self.rows.get(table_name, 0) + len(frame)
+                if self.rows[table_name] >= self.flush_rows:
+                    self.flush(table_name)
+
+    def flush(self, table_name):
+        frames = self.frames.pop(table_name, [])
+        self.rows.pop(table_name, None)
+        if not frames:
+            return
+
+        df = pd.concat(frames, ignore_index=True)
+        # Same column names as the database, the partition holds the batchname.
+        df.columns = [str(name).replace(" ", "_") for name in df.columns]
+        df = df.drop(columns="batchname", errors="ignore")
+        for col in df.columns:
+            if df[col].dtype == object and "mixed" in pd.api.types.infer_dtype(df[col]):
+                df[col] = df[col].astype(str)
+
+        try:
+            table = pa.Table.from_pandas(df, preserve_index=False)
+            # Earlier parts may have other columns or types, write the union.
+            schema = unify_schemas([self.schemas.get(table_name, pa.schema([])), table.schema])
+            for field in schema:
+                if field.name not in table.schema.names:
+                    table = table.append_column(field, pa.nulls(len(table), field.type))
+            table = table.select(schema.names).cast(schema)
+            self.schemas[table_name] = schema
+
+            part = self.parts.get(table_name, 0)
+            self.parts[table_name] = part + 1
+            directory = self.path / table_name / f"batchname={self.batchname}"
+            directory.mkdir(parents=True, exist_ok=True)
+            pq.write_table(table, directory / f"part-{self.runtime}-{part:05d}.parquet")
+        except Exception as e:
+            print(f"{e} {table_name} parquet failed.")
+            self.failed.append((table_name, len(df), e))
+
+    def close(self):
+        """
+        Write the remaining buffered rows of all tables. Raises ``RuntimeError``
+        if any rows of the batch could not be written.
+        """
+        for table_name in list(self.frames):
+            self.flush(table_name)
+        if self.failed:
+            lost = ", ".join(f"{name} ({rows} rows): {e}" for name, rows, e in self.failed)
+            raise RuntimeError(f"Parquet rows not written: {lost}")
+
+
+def read_parquet(
+    table_name, batchname=None, save_path="results", columns=None, filters=None
+):
+    """
+    Reads a results table saved with ``save_parquet=True``.
+
+    :param table_name str: Results table, eg: ``trade_list`` or ``value``.
+    :param batchname str: Only read this batch. ``None`` reads all batches.
+    :param save_path str: ``save_path`` of the backtests.
+    :param columns list: Only read these columns.
+    :param filters list: Pyarrow row filters, eg: ``[("test_number", "in", tests)]``.
+    :return DataFrame: Rows of the table, with the ``batchname`` column.
+    """
+    path = Path(save_path) / "parquet" / table_name
+    if batchname is not None:
+        path = path / f"batchname={batchname}"
+    if not path.exists():
+        return pd.DataFrame(columns=columns)
 
+    read_columns = columns
+    if batchname is not None and columns is not None:
+        read_columns = [col for col in columns if col != "batchname"]
+    # Parts written by other batches may differ, read them all as their union.
+    schema = unify_schemas(pq.read_schema(part) for part in path.rglob("*.parquet"))
+    if batchname is None:
+        schema = schema.append(pa.field("batchname", pa.string()))
+    df = pq.read_table(
+        path, columns=read_columns, filters=filters, schema=schema
+    ).to_pandas()
+    if batchname is not None and (columns is None or "batchname" in columns):
+        df.insert(0, "batchname", batchname)
+    elif "batchname" in df.columns:
+        df["batchname"] = df["batchname"].astype(str)
+    return df